@@ -0,0 +1,72 @@
+"""
+Serialization micro-benchmark for the available `codec`-backends using
+`Message.json` and `Conversation.json`.
+
+Run with
+ python benchmarks/codec.py [--messages N] [--runs N]
+"""
+
+from time import perf_counter
+from datetime import datetime
+import argparse
+import random
+
+from peer_chat.common import codec, Message, MessageStatus, Conversation
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(0)
+    messages = [
+        Message(
+            mid,
+            " ".join(
+                random.choice(["hello", "wörld", "peer", "chat", "🙂"])
+                for _ in range(random.randint(1, 30))
+            ),
+            status=MessageStatus.OK,
+            last_modified=datetime.now(),
+        ).json
+        for mid in range(args.messages)
+    ]
+    conversations = [
+        Conversation(
+            peer=f"http://192.168.0.{i % 255}:27182",
+            name=f"conversation {i}",
+            length=random.randint(1, 1000),
+            last_modified=datetime.now(),
+            queued_messages=list(range(i % 5)),
+        ).json
+        for i in range(args.messages // 10)
+    ]
+
+    print(f"{'':<16}{'backend':<10}{'dumps':>12}{'loads':>12}")
+    for name, objs in (
+        ("Message", messages),
+        ("Conversation", conversations),
+    ):
+        for backend in codec.BACKENDS:
+            codec.use(backend)
+            dump = load = 0.0
+            for _ in range(args.runs):
+                start = perf_counter()
+                data = [codec.dumpb(obj) for obj in objs]
+                dump += perf_counter() - start
+                start = perf_counter()
+                for d in data:
+                    codec.loads(d)
+                load += perf_counter() - start
+            per_object = 1e6 / args.runs / len(objs)
+            print(
+                f"{name:<16}{backend:<10}{dump * per_object:>10.2f}us"
+                + f"{load * per_object:>10.2f}us"
+            )
+
+
+if __name__ == "__main__":
+    main()
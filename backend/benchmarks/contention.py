@@ -0,0 +1,65 @@
+"""
+Benchmark for lock-contention in the `MessageStore` under concurrent
+posts and reads.
+
+Run with
+ python benchmarks/contention.py [--conversations N] [--threads N]
+"""
+
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+import argparse
+import json
+import random
+
+from peer_chat.common import Conversation, Message, MessageStore
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--stripes", type=int, default=64)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        store = MessageStore(
+            Path(tmp),
+            lock_stripes=args.stripes,
+            lock_instrumentation=True,
+        )
+        cids = []
+        for i in range(args.conversations):
+            c = Conversation("0.0.0.0", f"c-{i}")
+            store.set_conversation_path(c)
+            store.create_conversation(c)
+            cids.append(c.id_)
+
+        def poster():
+            for _ in range(args.operations):
+                store.post_message(random.choice(cids), Message(body="a"))
+
+        def reader():
+            for _ in range(args.operations):
+                store.load_messages(random.choice(cids), -20)
+
+        threads = [
+            Thread(target=poster if i % 2 else reader)
+            for i in range(args.threads)
+        ]
+        start = perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"duration: {perf_counter() - start:.2f}s")
+        print(json.dumps(store.lock_stats, indent=2))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark for the consistency check `fsck` using a single and all
+available worker processes.
+
+Run with
+ python benchmarks/fsck.py [--messages N] [--conversations N]
+                           [--engine E]
+"""
+
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import os
+import argparse
+
+from peer_chat.common import (
+    Message,
+    MessageStatus,
+    Conversation,
+    MessageStore,
+    load_engine,
+    fsck,
+)
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--engine", default="directory")
+    args = parser.parse_args()
+
+    per_conversation = args.messages // args.conversations
+    with TemporaryDirectory() as tmp:
+        start = perf_counter()
+        store = MessageStore(
+            Path(tmp), engine=load_engine(args.engine, Path(tmp))
+        )
+        for i in range(args.conversations):
+            c = Conversation("http://localhost:27182", f"conversation {i}")
+            store.set_conversation_path(c)
+            store.create_conversation(c)
+            store.post_messages(
+                c.id_,
+                [
+                    Message(None, f"message {j}", MessageStatus.OK)
+                    for j in range(per_conversation)
+                ],
+                cache=False,
+            )
+        store.close()
+        print(f"setup: {perf_counter() - start:.1f}s")
+
+        for jobs in sorted({1, os.cpu_count() or 1}):
+            start = perf_counter()
+            report = fsck(Path(tmp), args.engine, jobs=jobs, dry_run=True)
+            print(
+                f"jobs={jobs:<4} {report.messages:>9} messages "
+                + f"{perf_counter() - start:>8.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
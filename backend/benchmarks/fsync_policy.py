@@ -0,0 +1,69 @@
+"""
+Benchmark for message-throughput of the storage engines under the
+different fsync-policies.
+
+Run with
+ python benchmarks/fsync_policy.py [--messages N] [--threads N]
+"""
+
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+import argparse
+
+from peer_chat.common import (
+    FSYNC_POLICIES,
+    Conversation,
+    Message,
+    MessageStore,
+    load_engine,
+)
+from peer_chat.common.engine import ENGINES
+
+
+def run(engine: str, fsync: str, messages: int, threads: int) -> float:
+    """Returns messages per second for the given configuration."""
+    with TemporaryDirectory() as tmp:
+        store = MessageStore(
+            Path(tmp), engine=load_engine(engine, Path(tmp), fsync=fsync)
+        )
+        c = Conversation("0.0.0.0", "benchmark")
+        store.set_conversation_path(c)
+        store.create_conversation(c)
+
+        def post(n: int):
+            for _ in range(n):
+                store.post_message(c.id_, Message(body="a" * 100))
+
+        workers = [
+            Thread(target=post, args=(messages // threads,))
+            for _ in range(threads)
+        ]
+        start = perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duration = perf_counter() - start
+        store.close()
+    return (messages // threads) * threads / duration
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'engine':<10} {'fsync':<8} {'threads':>7} {'msg/s':>10}")
+    for engine in ENGINES:
+        for fsync in FSYNC_POLICIES:
+            for threads in sorted({1, args.threads}):
+                rate = run(engine, fsync, args.messages, threads)
+                print(f"{engine:<10} {fsync:<8} {threads:>7} {rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
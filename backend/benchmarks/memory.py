@@ -0,0 +1,91 @@
+"""
+Benchmark for the memory footprint of cached messages.
+
+Compares the compact `Message` with the previous (plain dataclass-
+based) representation by loading messages from their serialized form
+and reporting the traced memory per message (excluding the shared
+message bodies). Additionally reports the footprint including the
+bookkeeping of the `MessageStore`'s LRU-cache, which is what
+`MessageStore.MESSAGE_OVERHEAD` estimates.
+
+Run with
+ python benchmarks/memory.py [--messages N]
+"""
+
+from typing import Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+import argparse
+import gc
+import tracemalloc
+
+from peer_chat.common import Message, MessageStatus, MessageStore
+
+
+@dataclass
+class LegacyMessage:
+    """Previous representation of `Message`."""
+
+    id_: Optional[int] = None
+    body: Optional[str] = None
+    status: MessageStatus = MessageStatus.DRAFT
+    is_mine: bool = True
+    last_modified: datetime = field(default_factory=datetime.now)
+
+    @staticmethod
+    def from_json(json_: dict) -> "LegacyMessage":
+        """Returns instance initialized from serialized representation."""
+        return LegacyMessage(
+            id_=json_["id"],
+            body=json_["body"],
+            status=MessageStatus(json_["status"]),
+            is_mine=json_["isMine"],
+            last_modified=datetime.fromisoformat(json_["lastModified"]),
+        )
+
+
+def measure(cls, records: list[dict], lru: bool = False) -> float:
+    """
+    Returns traced bytes per message for loading `records` (and
+    registering them in an LRU-cache like `MessageStore` if `lru`).
+    """
+    gc.collect()
+    tracemalloc.start()
+    cache = {}
+    lru_ = OrderedDict()
+    cid = "00000000-0000-0000-0000-000000000000"
+    for json_ in records:
+        m = cls.from_json(json_)
+        cache[m.id_] = m
+        if lru:
+            lru_[(cid, m.id_)] = len(m.body) + MessageStore.MESSAGE_OVERHEAD
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache, lru_
+    return current / len(records)
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000000)
+    args = parser.parse_args()
+
+    body = "a" * 100
+    records = [
+        Message(mid, body, MessageStatus.OK).json
+        for mid in range(args.messages)
+    ]
+    for record in records:
+        record["body"] = body
+    for name, cls in (("before", LegacyMessage), ("after", Message)):
+        print(f"{name:<8} {measure(cls, records):>8.1f} bytes/message")
+    print(
+        f"{'cached':<8} {measure(Message, records, lru=True):>8.1f} "
+        + "bytes/message"
+    )
+
+
+if __name__ == "__main__":
+    main()
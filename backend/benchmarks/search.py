@@ -0,0 +1,58 @@
+"""
+Benchmark for query-latency of the full-text `SearchIndex`.
+
+Run with
+ python benchmarks/search.py [--messages N] [--conversations N]
+"""
+
+from time import perf_counter
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import argparse
+import random
+
+from peer_chat.common import Message, SearchIndex
+
+
+WORDS = [f"word{i}" for i in range(20000)]
+
+
+def main():
+    """Run benchmark."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--conversations", type=int, default=100)
+    args = parser.parse_args()
+
+    random.seed(0)
+    per_conversation = args.messages // args.conversations
+
+    def loader(cid: str, indexed: set[int]):
+        rng = random.Random(cid)
+        for mid in range(per_conversation):
+            # Zipf-like word distribution
+            body = " ".join(
+                WORDS[min(int(rng.paretovariate(1.0)) - 1, len(WORDS) - 1)]
+                for _ in range(10)
+            )
+            if mid not in indexed:
+                yield Message(mid, body)
+
+    with TemporaryDirectory() as tmp:
+        index = SearchIndex(Path(tmp), loader)
+        cids = [f"c-{i}" for i in range(args.conversations)]
+        start = perf_counter()
+        index.search("", cids)
+        print(f"build: {perf_counter() - start:.1f}s")
+
+        for query in ["word0", "word3", "word50", "word1 word7", "word9999"]:
+            start = perf_counter()
+            runs = 20
+            for _ in range(runs):
+                total, _ = index.search(query, cids, limit=20)
+            duration = (perf_counter() - start) / runs
+            print(f"{query!r:<16} {total:>9} hits {duration * 1000:>9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,11 +19,14 @@ from peer_chat.common import (
     Message,
     MessageStatus,
     Conversation,
-    send_message as _send_message,
     Notifier,
 )
 
 
+# optional features of this API-version (advertised via '/who')
+FEATURES = ["message-batch", "attachments"]
+
+
 def blueprint_factory(
     config: AppConfig,
     user: User,
@@ -86,6 +89,9 @@ def blueprint_factory(
 
         Expected JSON
         `{"cid": <conversation-id>, "name": <conversation-name>, "msg": <Message.json>, "peer": <origin-peer-url>}`.
+
+        Repeated deliveries of a message with the same `Message.key`
+        are acknowledged without being processed again.
         """
         json = request.get_json(silent=True)
         if not json:
@@ -94,6 +100,13 @@ def blueprint_factory(
         c = None
         try:
             c = store.load_conversation(json["cid"])
+            if (
+                c is not None
+                and json["msg"].get("key") is not None
+                and store.lookup_message_key(c.id_, json["msg"]["key"])
+                is not None
+            ):
+                return Response(c.id_, mimetype="text/plain", status=200)
             if c is None:
                 c = Conversation(
                     json.get("peer", request.remote_addr),
@@ -107,23 +120,111 @@ def blueprint_factory(
                 if "peer" in json:
                     c.peer = json["peer"]
                 c.unread_messages = True
-            mid = store.post_message(
-                c.id_,
+                c.last_modified = datetime.now()
+            m = Message.from_json(
+                json["msg"]
+                | {
+                    "id": None,
+                    "isMine": False,
+                    "status": MessageStatus.OK,
+                }
+            )
+            mid = store.post_message(c.id_, m)
+            store.attachments.claim(a.id_ for a in m.attachments or [])
+            m = store.load_message(c.id_, mid)
+            socket_info.socket.emit("update-conversation", c.json)
+            socket_info.socket.emit(
+                "update-message",
+                {"cid": c.id_, "message": m.json},
+            )
+        # pylint: disable=broad-exception-caught
+        except Exception as exc_info:
+            if new_conversation and c is not None:
+                store.delete_conversation(c)
+            return Response(
+                f"Error processing request: {exc_info} "
+                + f"({type(exc_info).__name__})",
+                mimetype="text/plain",
+                status=400,
+            )
+
+        if (
+            config.USE_NOTIFICATIONS
+            and notifier
+            and len(socket_info.connections) == 0
+        ):
+            notifier.enqueue(c, m)
+
+        return Response(c.id_, mimetype="text/plain", status=200)
+
+    @bp.route("/messages", methods=["POST"])
+    def post_messages():
+        """
+        Processes an ordered batch of posted messages of a single
+        conversation (feature 'message-batch'). All messages are stored
+        at once and announced with a single 'update-messages'-event.
+
+        Expected JSON
+        `{"cid": <conversation-id>, "name": <conversation-name>, "msgs": [<Message.json>, ...], "peer": <origin-peer-url>}`.
+
+        Messages with a known `Message.key` are skipped.
+        """
+        json = request.get_json(silent=True)
+        if not json:
+            return Response("Missing JSON.", mimetype="text/plain", status=400)
+        if not isinstance(json.get("msgs"), list) or not json["msgs"]:
+            return Response("Bad JSON.", mimetype="text/plain", status=422)
+        new_conversation = False
+        c = None
+        try:
+            c = store.load_conversation(json["cid"])
+            msgs = [
                 Message.from_json(
-                    json["msg"]
+                    msg
                     | {
                         "id": None,
                         "isMine": False,
                         "status": MessageStatus.OK,
                     }
-                ),
+                )
+                for msg in json["msgs"]
+            ]
+            if c is not None:
+                msgs = [
+                    m
+                    for m in msgs
+                    if m.key is None
+                    or store.lookup_message_key(c.id_, m.key) is None
+                ]
+                if not msgs:
+                    return Response(c.id_, mimetype="text/plain", status=200)
+            if c is None:
+                c = Conversation(
+                    json.get("peer", request.remote_addr),
+                    name=json.get("name", "New Conversation"),
+                    id_=json["cid"],
+                )
+                store.set_conversation_path(c)
+                store.create_conversation(c)
+                new_conversation = True
+            else:
+                if "peer" in json:
+                    c.peer = json["peer"]
+                c.unread_messages = True
+                c.last_modified = datetime.now()
+            mids = store.post_messages(c.id_, msgs)
+            if mids is None:
+                raise ValueError("Unable to store messages.")
+            store.attachments.claim(
+                a.id_ for m in msgs for a in m.attachments or []
             )
-            c.last_modified = datetime.now()
-            m = store.load_message(c.id_, mid)
+            ms = [
+                store.load_message(c.id_, mid) for mid in dict.fromkeys(mids)
+            ]
             socket_info.socket.emit("update-conversation", c.json)
             socket_info.socket.emit(
-                "update-message",
-                {"cid": c.id_, "message": m.json},
+                "update-messages",
+                {"cid": c.id_, "messages": [m.json for m in ms]},
             )
         # pylint: disable=broad-exception-caught
         except Exception as exc_info:
@@ -141,7 +242,7 @@ def blueprint_factory(
             and notifier
             and len(socket_info.connections) == 0
         ):
-            notifier.enqueue(c, m)
+            notifier.enqueue(c, ms[-1])
 
         return Response(c.id_, mimetype="text/plain", status=200)
 
@@ -160,20 +261,65 @@ def blueprint_factory(
         if "peer" not in json:
             return Response("Bad JSON.", mimetype="text/plain", status=422)
         socket_info.socket.emit("changed-peer", json["peer"])
-        # retry sending messages
-        for cid in store.list_conversations():
-            c = store.load_conversation(cid)
-            if c.peer != json["peer"]:
-                continue
-            if not c.queued_messages:
-                continue
-            for mid in c.queued_messages.copy():
-                m = store.load_message(cid, mid)
-                if _send_message(c, m, store, user, socket_info.socket):
-                    c.queued_messages.remove(mid)
-                    store.write(c.id_)
-            socket_info.socket.emit("update-conversation", c.json)
+        # retry sending messages (in the background)
+        socket_info.delivery.wake(json["peer"])
 
         return Response("OK", mimetype="text/plain", status=200)
 
+    @bp.route("/attachments/<id_>", methods=["HEAD"])
+    def head_attachment(id_: str):
+        """Returns 200 if attachment `id_` exists and 404 otherwise."""
+        if not store.attachments.exists(id_):
+            return Response(status=404)
+        return Response(
+            headers={"Content-Length": str(store.attachments.size(id_))},
+            status=200,
+        )
+
+    @bp.route("/attachments/<id_>", methods=["PUT"])
+    def put_attachment(id_: str):
+        """
+        Stores attachment from the request body (streamed). The data
+        has to match the given `id_` (SHA-256 hash).
+
+        Uploads remain pending until referenced by a posted message;
+        pending uploads are limited to a total size of
+        `ATTACHMENT_PENDING_QUOTA` and removed if not referenced within
+        `ATTACHMENT_PENDING_TTL` seconds.
+        """
+        if not store.attachments.valid_id(id_):
+            return Response(
+                "Bad attachment id.", mimetype="text/plain", status=400
+            )
+        if store.attachments.exists(id_):
+            return Response(id_, mimetype="text/plain", status=200)
+        if (request.content_length or 0) > config.ATTACHMENT_MAX_SIZE:
+            return Response(
+                "Attachment too large.", mimetype="text/plain", status=413
+            )
+        store.attachments.expire(config.ATTACHMENT_PENDING_TTL)
+        available = (
+            config.ATTACHMENT_PENDING_QUOTA - store.attachments.pending_size
+        )
+        if (request.content_length or 0) > available:
+            return Response(
+                "Attachment quota exceeded.",
+                mimetype="text/plain",
+                status=507,
+            )
+        try:
+            store.attachments.put(
+                request.stream,
+                max_size=min(config.ATTACHMENT_MAX_SIZE, available),
+                expected=id_,
+                pending=True,
+            )
+        except ValueError as exc_info:
+            return Response(
+                f"Bad attachment: {exc_info}",
+                mimetype="text/plain",
+                status=400,
+            )
+        return Response(id_, mimetype="text/plain", status=201)
+
     return bp
@@ -3,13 +3,14 @@
 from typing import Optional
 import sys
 from pathlib import Path
-import json
 from threading import Lock, Thread
 from uuid import uuid4
 import socket
 from functools import wraps
 import base64
+import atexit
 from time import time, sleep
+from datetime import timedelta
 from subprocess import Popen, PIPE
 
 from flask import (
@@ -19,25 +20,68 @@ from flask import (
     request,
     make_response,
     send_from_directory,
+    send_file,
 )
+from flask.json.provider import DefaultJSONProvider
 from flask_socketio import SocketIO
 import requests
 from desktop_notifier import DesktopNotifier, Icon
 
 from peer_chat.config import AppConfig
 from peer_chat.common import (
+    codec,
     User,
+    Attachment,
     Auth,
     MessageStore,
+    Archiver,
+    WarmUp,
+    export_ndjson,
+    import_ndjson,
+    load_engine,
+    PeerClient,
     inform_peers,
-    send_message,
+    DeliveryWorker,
     update,
     Notifier,
 )
-from peer_chat.api.v0 import blueprint_factory as v0_blueprint
+from peer_chat.api.v0 import (
+    blueprint_factory as v0_blueprint,
+    FEATURES as API_V0_FEATURES,
+)
 from peer_chat.socket import socket_
 
 
+class CodecJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON-provider that uses the `codec`-module (and thereby its
+    faster backend if available). Indented output is generated by the
+    default provider.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs.get("indent"):
+            return super().dumps(obj, **kwargs)
+        return codec.dumps(
+            obj,
+            default=kwargs.get("default", self.default),
+            sort_keys=kwargs.get("sort_keys", self.sort_keys),
+        )
+
+    def loads(self, s, **kwargs):
+        return codec.loads(s)
+
+
+# attachment-types that are displayed inline by the client; everything
+# else is served as download
+INLINE_ATTACHMENT_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/gif",
+    "image/webp",
+)
+
+
 def load_secret_key(path: Path) -> str:
     """
     Generates random key, writes to file, and returns value.
@@ -62,9 +106,9 @@ def load_user_config(path: Path) -> User:
     """
 
     try:
-        user_json = json.loads(path.read_text(encoding="utf-8"))
+        user_json = codec.loads(path.read_bytes())
     except (
-        json.JSONDecodeError,
+        codec.JSONDecodeError,
         FileNotFoundError,
     ) as exc_info:
         print(
@@ -150,7 +194,7 @@ def load_callback_url_options() -> list[dict]:
 def login_required(auth: Auth):
     def decorator(route):
         @wraps(route)
-        def __():
+        def __(**kwargs):
             if auth.value is None:
                 return Response(
                     "Missing configuration.",
@@ -172,7 +216,7 @@ def login_required(auth: Auth):
                     mimetype="text/plain",
                     status=401,
                 )
-            return route()
+            return route(**kwargs)
 
         return __
 
@@ -183,6 +227,10 @@ def app_factory(config: AppConfig) -> tuple[Flask, SocketIO]:
     """Returns peerChat-Flask app."""
     # define Flask-app
     _app = Flask(__name__, static_folder=config.STATIC_PATH)
+    if config.JSON_CODEC:
+        codec.use(config.JSON_CODEC)
+    print(f"INFO: Using JSON codec '{codec.BACKEND}'.", file=sys.stderr)
+    _app.json = CodecJSONProvider(_app)
 
     # prepare storage
     (config.WORKING_DIRECTORY / config.DATA_DIRECTORY).mkdir(
@@ -226,16 +274,90 @@ def app_factory(config: AppConfig) -> tuple[Flask, SocketIO]:
     _app.config.from_object(config)
 
     # message store
-    store = MessageStore(config.WORKING_DIRECTORY / config.DATA_DIRECTORY)
+    store = MessageStore(
+        config.WORKING_DIRECTORY / config.DATA_DIRECTORY,
+        engine=load_engine(
+            config.STORAGE_ENGINE,
+            config.WORKING_DIRECTORY / config.DATA_DIRECTORY,
+            fsync=config.FSYNC_POLICY,
+        ),
+        max_messages=config.CACHE_MAX_MESSAGES,
+        max_bytes=config.CACHE_MAX_BYTES,
+        max_conversations=config.CACHE_MAX_CONVERSATIONS,
+        flush_interval=(
+            config.INDEX_FLUSH_INTERVAL
+            if config.INDEX_WRITE_MODE == "write-behind"
+            else None
+        ),
+        lock_stripes=config.LOCK_STRIPES,
+        lock_instrumentation=config.LOCK_INSTRUMENTATION,
+        dedup_keys=config.DEDUP_KEYS,
+    )
+    atexit.register(store.close)
+    if (
+        config.ARCHIVE_MAX_AGE is not None
+        or config.ARCHIVE_KEEP_LAST is not None
+    ):
+        archiver = Archiver(
+            store,
+            config.ARCHIVE_INTERVAL,
+            max_age=(
+                timedelta(days=config.ARCHIVE_MAX_AGE)
+                if config.ARCHIVE_MAX_AGE is not None
+                else None
+            ),
+            keep_last=config.ARCHIVE_KEEP_LAST,
+        )
+        archiver.start()
+        atexit.register(archiver.stop)
 
     # extensions
     if config.MODE == "dev":
         load_cors(_app, config.DEV_CORS_FRONTEND_URL)
 
+    # outbound requests to peers
+    client = PeerClient(
+        pool_size=config.PEER_POOL_SIZE,
+        max_peers=config.PEER_POOL_MAX_PEERS,
+        min_timeout=config.PEER_MIN_TIMEOUT,
+        max_timeout=config.PEER_MAX_TIMEOUT,
+        failure_threshold=config.PEER_FAILURE_THRESHOLD,
+        reset_timeout=config.PEER_RESET_TIMEOUT,
+    )
+    atexit.register(client.close)
+
     # socket
-    socket_info = socket_(config, auth, store, user)
+    socket_info = socket_(config, auth, store, user, client)
     socket_info.socket.init_app(_app)
 
+    # outbound delivery
+    socket_info.delivery = DeliveryWorker(
+        store,
+        user,
+        socket_info.socket,
+        client,
+        threads=config.DELIVERY_THREADS,
+        base_delay=config.DELIVERY_BASE_DELAY,
+        max_delay=config.DELIVERY_MAX_DELAY,
+        batch_size=config.DELIVERY_BATCH_SIZE,
+    )
+    socket_info.delivery.start()
+    atexit.register(socket_info.delivery.stop)
+
+    # cache warm-up
+    if config.WARM_UP:
+        socket_info.warm_up = WarmUp(
+            store,
+            conversations=config.CACHE_MAX_CONVERSATIONS,
+            active_conversations=config.WARM_UP_ACTIVE_CONVERSATIONS,
+            messages=config.WARM_UP_MESSAGES,
+            threads=config.WARM_UP_THREADS,
+            callback=lambda status: socket_info.socket.emit(
+                "warm-up-progress", status.json
+            ),
+        )
+        socket_info.warm_up.start()
+
     @_app.route("/ping", methods=["GET"])
     def ping():
         """
@@ -256,9 +378,16 @@ def app_factory(config: AppConfig) -> tuple[Flask, SocketIO]:
     def who():
         """
         Returns JSON-object identifying this as a peerChatAPI with base-url
-        paths.
+        paths and supported (optional) features per API-version.
         """
-        return jsonify(name="peerChatAPI", api={"0": "/api/v0"}), 200
+        return (
+            jsonify(
+                name="peerChatAPI",
+                api={"0": "/api/v0"},
+                features={"0": API_V0_FEATURES},
+            ),
+            200,
+        )
 
     auth_lock = Lock()
 
@@ -545,6 +674,152 @@ def app_factory(config: AppConfig) -> tuple[Flask, SocketIO]:
             status=200,
         )
 
+    @_app.route("/store/stats", methods=["GET"])
+    @login_required(auth)
+    def store_stats():
+        """
+        Returns message store statistics (cache hits, misses, and
+        evictions for conversations and messages as well as lock-
+        contention per operation if instrumentation is enabled).
+        """
+        r = make_response(
+            jsonify(cache=store.cache_stats, locks=store.lock_stats), 200
+        )
+        r.headers["Access-Control-Allow-Credentials"] = "true"
+        return r
+
+    @_app.route("/peers/health", methods=["GET"])
+    @login_required(auth)
+    def peers_health():
+        """
+        Returns health of contacted peers (round-trip time, consecutive
+        failures, last contact, and state of the circuit breaker) per
+        peer address.
+        """
+        r = make_response(jsonify(client.health), 200)
+        r.headers["Access-Control-Allow-Credentials"] = "true"
+        return r
+
+    @_app.route("/store/search", methods=["GET"])
+    @login_required(auth)
+    def store_search():
+        """
+        Returns a page of ranked full-text search results for the query
+        given as argument 'q' (paginated via 'offset' and 'limit').
+        """
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+            limit = min(max(0, int(request.args.get("limit", 20))), 1000)
+        except ValueError:
+            return Response(
+                "Bad pagination.", mimetype="text/plain", status=400
+            )
+        total, hits = store.search(
+            request.args.get("q", ""), offset=offset, limit=limit
+        )
+        r = make_response(
+            jsonify(total=total, hits=[hit.json for hit in hits]), 200
+        )
+        r.headers["Access-Control-Allow-Credentials"] = "true"
+        return r
+
+    @_app.route("/attachments", methods=["POST"])
+    @login_required(auth)
+    def post_attachment():
+        """
+        Stores attachment from the request body (streamed) and returns
+        its `Attachment`-JSON. Name and type can be given as arguments
+        'name' and 'type' (defaults to the request's content type).
+        """
+        if (request.content_length or 0) > config.ATTACHMENT_MAX_SIZE:
+            return Response(
+                "Attachment too large.", mimetype="text/plain", status=413
+            )
+        try:
+            id_, size = store.attachments.put(
+                request.stream, max_size=config.ATTACHMENT_MAX_SIZE
+            )
+        except ValueError as exc_info:
+            return Response(
+                f"Bad attachment: {exc_info}",
+                mimetype="text/plain",
+                status=413,
+            )
+        r = make_response(
+            jsonify(
+                Attachment(
+                    id_,
+                    size,
+                    name=request.args.get("name"),
+                    type_=request.args.get("type") or request.mimetype or None,
+                ).json
+            ),
+            200,
+        )
+        r.headers["Access-Control-Allow-Credentials"] = "true"
+        return r
+
+    @_app.route("/attachments/<id_>", methods=["GET"])
+    @login_required(auth)
+    def get_attachment(id_: str):
+        """
+        Returns attachment `id_` (supports range requests). Name and
+        type can be given as arguments 'name' and 'type'.
+        """
+        if not store.attachments.exists(id_):
+            return Response(
+                "Unknown attachment.", mimetype="text/plain", status=404
+            )
+        mimetype = request.args.get("type", "application/octet-stream")
+        r = send_file(
+            store.attachments.path(id_).resolve(),
+            mimetype=mimetype,
+            as_attachment=mimetype not in INLINE_ATTACHMENT_TYPES,
+            download_name=request.args.get("name", id_),
+            conditional=True,
+            etag=id_,
+            max_age=31536000,
+        )
+        r.headers["Access-Control-Allow-Credentials"] = "true"
+        r.headers["X-Content-Type-Options"] = "nosniff"
+        r.headers["Content-Security-Policy"] = "sandbox"
+        return r
+
+    @_app.route("/store/export", methods=["GET"])
+    @login_required(auth)
+    def store_export():
+        """
+        Returns a stream of NDJSON-lines with all conversations (or
+        those given as repeated argument 'cid') and their messages.
+        """
+        return Response(
+            export_ndjson(store, request.args.getlist("cid") or None),
+            headers={
+                "Access-Control-Allow-Credentials": "true",
+                "Content-Disposition": "attachment; "
+                + 'filename="peerChat-export.ndjson"',
+            },
+            mimetype="application/x-ndjson",
+            status=200,
+        )
+
+    @_app.route("/store/import", methods=["POST"])
+    @login_required(auth)
+    def store_import():
+        """
+        Imports NDJSON-lines (as returned by `/store/export`) from the
+        request body (streamed) and returns import statistics.
+        """
+        try:
+            stats = import_ndjson(store, request.stream)
+        except ValueError as exc_info:
+            return Response(
+                f"Bad import: {exc_info}", mimetype="text/plain", status=400
+            )
+        r = make_response(jsonify(stats.json), 200)
+        r.headers["Access-Control-Allow-Credentials"] = "true"
+        return r
+
     @_app.route("/", defaults={"path": ""})
     @_app.route("/<path:path>")
     def serve(path):
@@ -593,18 +868,18 @@ def app_factory(config: AppConfig) -> tuple[Flask, SocketIO]:
                 pass
             sleep(0.2)
         # inform peers
-        inform_peers(store, user)
+        socket_info.socket.emit(
+            "peers-informed",
+            inform_peers(
+                store,
+                user,
+                client,
+                workers=config.INFORM_PEERS_WORKERS,
+                deadline=config.INFORM_PEERS_DEADLINE,
+            ).json,
+        )
         # retry sending messages
-        for cid in store.list_conversations():
-            c = store.load_conversation(cid)
-            if not c.queued_messages:
-                continue
-            for mid in c.queued_messages.copy():
-                m = store.load_message(cid, mid)
-                if send_message(c, m, store, user, socket_info.socket):
-                    c.queued_messages.remove(mid)
-                    store.write(c.id_)
-            socket_info.socket.emit("update-conversation", c.json)
+        socket_info.delivery.load()
 
     Thread(target=run_post_startup_tasks, daemon=True).start()
 
@@ -0,0 +1,449 @@
+"""peerChat command line interface for maintenance of the message store."""
+
+import sys
+from pathlib import Path
+from datetime import timedelta
+from contextlib import contextmanager
+import argparse
+import gzip
+
+from peer_chat.config import AppConfig
+from peer_chat.common import (
+    codec,
+    MessageStore,
+    AttachmentStore,
+    load_engine,
+    FSYNC_POLICIES,
+    migrate,
+    export_ndjson,
+    import_ndjson,
+    create_snapshot,
+    restore_snapshots,
+    fsck,
+)
+from peer_chat.common.engine import ENGINES
+
+
+def run_migrate(args: argparse.Namespace) -> int:
+    """Migrate data from one storage engine/directory to another."""
+    if args.source.resolve() == args.target.resolve():
+        print(
+            "\033[31mERROR: Source and target directory are identical.\033[0m",
+            file=sys.stderr,
+        )
+        return 1
+    if args.target.exists() and any(args.target.iterdir()):
+        print(
+            f"\033[31mERROR: Target directory '{args.target}' is not "
+            + "empty.\033[0m",
+            file=sys.stderr,
+        )
+        return 1
+    source = load_engine(args.source_engine, args.source)
+    target = load_engine(args.target_engine, args.target, fsync=args.fsync)
+    conversations, messages, attachments = migrate(
+        source,
+        target,
+        AttachmentStore(args.source / ".attachments"),
+        AttachmentStore(args.target / ".attachments"),
+    )
+    source.close()
+    target.close()
+    print(
+        f"INFO: Migrated {conversations} conversation(s) with {messages} "
+        + f"message(s) and {attachments} attachment(s) from "
+        + f"'{args.source}' ({args.source_engine}) to "
+        + f"'{args.target}' ({args.target_engine}).",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def run_rebuild_catalog(args: argparse.Namespace) -> int:
+    """Rebuild conversation-catalog from stored data."""
+    store = MessageStore(
+        args.data,
+        engine=load_engine(args.engine, args.data, fsync=args.fsync),
+    )
+    store.rebuild_catalog()
+    print(
+        "INFO: Rebuilt catalog with "
+        + f"{len(store.list_conversations())} conversation(s).",
+        file=sys.stderr,
+    )
+    store.close()
+    return 0
+
+
+def run_archive(args: argparse.Namespace) -> int:
+    """Archive old messages."""
+    if args.max_age is None and args.keep_last is None:
+        print(
+            "\033[31mERROR: Missing criterion, specify at least one of "
+            + "'--max-age' and '--keep-last'.\033[0m",
+            file=sys.stderr,
+        )
+        return 1
+    store = MessageStore(
+        args.data,
+        engine=load_engine(args.engine, args.data, fsync=args.fsync),
+    )
+    archived = store.archive(
+        max_age=(
+            timedelta(days=args.max_age) if args.max_age is not None else None
+        ),
+        keep_last=args.keep_last,
+    )
+    print(f"INFO: Archived {archived} message(s).", file=sys.stderr)
+    store.close()
+    return 0
+
+
+def run_fsck(args: argparse.Namespace) -> int:
+    """Check (and repair) consistency of the message store."""
+    report = fsck(
+        args.data,
+        args.engine,
+        jobs=args.jobs,
+        dry_run=args.dry_run,
+        fsync=args.fsync,
+    )
+    if args.json:
+        print(codec.dumps(report.json))
+    else:
+        for issue in report.issues:
+            print(
+                f"{issue.cid or '-'}: [{issue.kind}] {issue.detail}"
+                + (
+                    " (fixed)"
+                    if issue.fixed
+                    else " (fixable)" if issue.fixable else ""
+                )
+            )
+    print(
+        f"INFO: Checked {report.conversations} conversation(s) with "
+        + f"{report.messages} message(s); found {len(report.issues)} "
+        + f"issue(s), fixed {sum(i.fixed for i in report.issues)}"
+        + (
+            " (dry run)."
+            if args.dry_run
+            else f", compacted {report.compacted} conversation(s)."
+        ),
+        file=sys.stderr,
+    )
+    return 0 if report.clean else 1
+
+
+@contextmanager
+def open_stream(path: str, mode: str):
+    """
+    Returns context manager for binary file-object; '-' refers to
+    stdin/stdout and paths ending with '.gz' are (de-)compressed.
+    """
+    if path == "-":
+        yield sys.stdin.buffer if mode == "rb" else sys.stdout.buffer
+        return
+    with (gzip.open if path.endswith(".gz") else open)(path, mode) as f:
+        yield f
+
+
+def run_export(args: argparse.Namespace) -> int:
+    """Export conversations and messages as NDJSON."""
+    store = MessageStore(
+        args.data,
+        engine=load_engine(args.engine, args.data, fsync=args.fsync),
+    )
+    with open_stream(args.output, "wb") as f:
+        f.writelines(export_ndjson(store, args.conversation or None))
+    store.close()
+    return 0
+
+
+def run_import(args: argparse.Namespace) -> int:
+    """Import conversations and messages from NDJSON."""
+    store = MessageStore(
+        args.data,
+        engine=load_engine(args.engine, args.data, fsync=args.fsync),
+    )
+    try:
+        with open_stream(args.input, "rb") as f:
+            stats = import_ndjson(store, f, batch_size=args.batch_size)
+    except ValueError as exc_info:
+        print(f"\033[31mERROR: {exc_info}\033[0m", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    print(
+        f"INFO: Imported {stats.conversations} conversation(s) with "
+        + f"{stats.messages} message(s) and {stats.attachments} "
+        + "attachment(s) (skipped "
+        + f"{stats.skipped_conversations} existing conversation(s)).",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def run_backup(args: argparse.Namespace) -> int:
+    """Create (incremental) snapshot."""
+    store = MessageStore(
+        args.data,
+        engine=load_engine(args.engine, args.data, fsync=args.fsync),
+    )
+    snapshot = create_snapshot(store, args.target, full=args.full)
+    store.close()
+    print(
+        f"INFO: Created {'incremental' if snapshot.incremental else 'full'} "
+        + f"snapshot '{args.target / snapshot.file}' with "
+        + f"{snapshot.conversations} conversation(s), {snapshot.messages} "
+        + f"message(s), {snapshot.attachments} attachment(s), and "
+        + f"{snapshot.deletions} deletion(s).",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def run_restore(args: argparse.Namespace) -> int:
+    """Restore snapshots."""
+    if args.data.exists() and any(args.data.iterdir()):
+        print(
+            f"\033[31mERROR: Data directory '{args.data}' is not "
+            + "empty.\033[0m",
+            file=sys.stderr,
+        )
+        return 1
+    store = MessageStore(
+        args.data,
+        engine=load_engine(args.engine, args.data, fsync=args.fsync),
+    )
+    try:
+        stats = restore_snapshots(store, args.source, until=args.snapshot)
+    except ValueError as exc_info:
+        print(f"\033[31mERROR: {exc_info}\033[0m", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+    print(
+        f"INFO: Restored {stats.conversations} conversation(s), "
+        + f"{stats.messages} message(s), and {stats.attachments} "
+        + f"attachment(s) from '{args.source}'.",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def add_store_arguments(
+    parser: argparse.ArgumentParser, config: AppConfig
+) -> None:
+    """
+    Adds arguments for data directory, storage engine, and
+    fsync-policy.
+    """
+    parser.add_argument(
+        "--data",
+        type=Path,
+        default=config.WORKING_DIRECTORY / config.DATA_DIRECTORY,
+        help="data directory (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=list(ENGINES),
+        default=config.STORAGE_ENGINE,
+        help="storage engine (default: %(default)s)",
+    )
+    add_fsync_argument(parser, config)
+
+
+def add_fsync_argument(
+    parser: argparse.ArgumentParser, config: AppConfig
+) -> None:
+    """Adds argument for the fsync-policy of written data."""
+    parser.add_argument(
+        "--fsync",
+        choices=list(FSYNC_POLICIES),
+        default=config.FSYNC_POLICY,
+        help="fsync-policy for written data (default: %(default)s)",
+    )
+
+
+def get_parser(config: AppConfig) -> argparse.ArgumentParser:
+    """Returns command line argument parser."""
+    parser = argparse.ArgumentParser(
+        prog="peerChat-store",
+        description="Maintenance tasks for the peerChat message store.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate",
+        help="copy all data into a new directory using another engine",
+    )
+    migrate_parser.add_argument(
+        "--source",
+        type=Path,
+        default=config.WORKING_DIRECTORY / config.DATA_DIRECTORY,
+        help="source data directory (default: %(default)s)",
+    )
+    migrate_parser.add_argument(
+        "--source-engine",
+        choices=list(ENGINES),
+        default=config.STORAGE_ENGINE,
+        help="source storage engine (default: %(default)s)",
+    )
+    migrate_parser.add_argument(
+        "--target",
+        type=Path,
+        required=True,
+        help="target data directory (must be empty or missing)",
+    )
+    migrate_parser.add_argument(
+        "--target-engine",
+        choices=list(ENGINES),
+        required=True,
+        help="target storage engine",
+    )
+    add_fsync_argument(migrate_parser, config)
+    migrate_parser.set_defaults(func=run_migrate)
+
+    rebuild_catalog_parser = subparsers.add_parser(
+        "rebuild-catalog",
+        help="rebuild the conversation-catalog from stored data",
+    )
+    add_store_arguments(rebuild_catalog_parser, config)
+    rebuild_catalog_parser.set_defaults(func=run_rebuild_catalog)
+
+    export_parser = subparsers.add_parser(
+        "export",
+        help="export conversations and messages as NDJSON",
+    )
+    add_store_arguments(export_parser, config)
+    export_parser.add_argument(
+        "--output",
+        default="-",
+        help="output file; compressed if ending with '.gz' "
+        + "(default: stdout)",
+    )
+    export_parser.add_argument(
+        "--conversation",
+        action="append",
+        help="id of conversation to export; can be repeated "
+        + "(default: all conversations)",
+    )
+    export_parser.set_defaults(func=run_export)
+
+    import_parser = subparsers.add_parser(
+        "import",
+        help="import conversations and messages from NDJSON",
+    )
+    add_store_arguments(import_parser, config)
+    import_parser.add_argument(
+        "--input",
+        default="-",
+        help="input file; decompressed if ending with '.gz' "
+        + "(default: stdin)",
+    )
+    import_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="number of messages written at once (default: %(default)s)",
+    )
+    import_parser.set_defaults(func=run_import)
+
+    backup_parser = subparsers.add_parser(
+        "backup",
+        help="create a snapshot containing the changes since the last "
+        + "snapshot",
+    )
+    add_store_arguments(backup_parser, config)
+    backup_parser.add_argument(
+        "--target",
+        type=Path,
+        required=True,
+        help="backup directory",
+    )
+    backup_parser.add_argument(
+        "--full",
+        action="store_true",
+        help="create a full instead of an incremental snapshot",
+    )
+    backup_parser.set_defaults(func=run_backup)
+
+    restore_parser = subparsers.add_parser(
+        "restore",
+        help="restore snapshots into an empty data directory",
+    )
+    add_store_arguments(restore_parser, config)
+    restore_parser.add_argument(
+        "--source",
+        type=Path,
+        required=True,
+        help="backup directory",
+    )
+    restore_parser.add_argument(
+        "--snapshot",
+        type=int,
+        default=None,
+        help="id of the last snapshot to be restored (default: latest)",
+    )
+    restore_parser.set_defaults(func=run_restore)
+
+    archive_parser = subparsers.add_parser(
+        "archive",
+        help="move old messages into compressed archive-chunks",
+    )
+    add_store_arguments(archive_parser, config)
+    archive_parser.add_argument(
+        "--max-age",
+        type=float,
+        default=config.ARCHIVE_MAX_AGE,
+        help="archive messages older than this number of days "
+        + "(default: %(default)s)",
+    )
+    archive_parser.add_argument(
+        "--keep-last",
+        type=int,
+        default=config.ARCHIVE_KEEP_LAST,
+        help="archive all but this number of most recent messages per "
+        + "conversation (default: %(default)s)",
+    )
+    archive_parser.set_defaults(func=run_archive)
+
+    fsck_parser = subparsers.add_parser(
+        "fsck",
+        help="check consistency of the message store and repair fixable "
+        + "issues (peerChat should not be running)",
+    )
+    add_store_arguments(fsck_parser, config)
+    fsck_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    fsck_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only report issues",
+    )
+    fsck_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print report as JSON",
+    )
+    fsck_parser.set_defaults(func=run_fsck)
+
+    return parser
+
+
+def run(argv=None, config=None) -> None:
+    """Run command line interface."""
+    if not config:
+        config = AppConfig()
+    args = get_parser(config).parse_args(argv)
+    if config.JSON_CODEC:
+        try:
+            codec.use(config.JSON_CODEC)
+        except ValueError as exc_info:
+            print(f"\033[31mERROR: {exc_info}\033[0m", file=sys.stderr)
+            sys.exit(1)
+    sys.exit(args.func(args))
@@ -1,17 +1,85 @@
-from .models import User, Auth, MessageStatus, Message, Conversation
-from .store import MessageStore
-from .util import inform_peers, send_message
+from . import codec
+from .models import (
+    User,
+    Auth,
+    Attachment,
+    MessageStatus,
+    Message,
+    Conversation,
+)
+from .engine import (
+    FSYNC_POLICIES,
+    StorageEngine,
+    DirectoryEngine,
+    SegmentEngine,
+    SQLiteEngine,
+    load_engine,
+    migrate,
+)
+from .catalog import Catalog, CatalogEntry
+from .search import SearchIndex, SearchHit
+from .changes import ChangeJournal
+from .attachments import AttachmentStore
+from .store import MessageStore, CacheStats
+from .archiver import Archiver
+from .warmup import WarmUp, WarmUpStatus
+from .transfer import export_ndjson, import_ndjson, TransferStats
+from .backup import (
+    Snapshot,
+    list_snapshots,
+    create_snapshot,
+    restore_snapshots,
+)
+from .fsck import FsckIssue, FsckReport, fsck
+from .peers import PeerUnavailable, PeerHealth, PeerClient
+from .util import InformReport, inform_peers, send_message, send_messages
+from .delivery import DeliveryWorker
 from .notifier import Notifier
 
 
 __all__ = [
+    "codec",
     "User",
     "Auth",
+    "Attachment",
     "MessageStatus",
     "Message",
     "Conversation",
+    "FSYNC_POLICIES",
+    "StorageEngine",
+    "DirectoryEngine",
+    "SegmentEngine",
+    "SQLiteEngine",
+    "load_engine",
+    "migrate",
+    "Catalog",
+    "CatalogEntry",
+    "SearchIndex",
+    "SearchHit",
+    "ChangeJournal",
+    "AttachmentStore",
     "MessageStore",
+    "CacheStats",
+    "Archiver",
+    "WarmUp",
+    "WarmUpStatus",
+    "export_ndjson",
+    "import_ndjson",
+    "TransferStats",
+    "Snapshot",
+    "list_snapshots",
+    "create_snapshot",
+    "restore_snapshots",
+    "FsckIssue",
+    "FsckReport",
+    "fsck",
+    "PeerUnavailable",
+    "PeerHealth",
+    "PeerClient",
+    "InformReport",
     "inform_peers",
     "send_message",
+    "send_messages",
+    "DeliveryWorker",
     "Notifier",
 ]
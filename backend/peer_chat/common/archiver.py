@@ -0,0 +1,81 @@
+"""Definitions for the background archival of messages."""
+
+from typing import Optional
+import sys
+import threading
+from datetime import timedelta
+
+from .store import MessageStore
+
+
+class Archiver:
+    """
+    Threaded worker class that periodically moves old messages of a
+    `MessageStore` into the storage engine's archive (see
+    `MessageStore.archive`).
+
+    Keyword arguments:
+    store -- message store
+    interval -- interval between archival runs in seconds
+    max_age -- minimum age of archived messages
+               (default None; no age-criterion)
+    keep_last -- number of most recent messages per conversation that
+                 are kept
+                 (default None; no count-criterion)
+    """
+
+    def __init__(
+        self,
+        store: MessageStore,
+        interval: float,
+        max_age: Optional[timedelta] = None,
+        keep_last: Optional[int] = None,
+    ) -> None:
+        self.store = store
+        self.interval = interval
+        self.max_age = max_age
+        self.keep_last = keep_last
+
+        self.thread = None
+        self._archiver_thread_lock = threading.Lock()
+        self._archiver_stop = threading.Event()
+
+    def start(self) -> None:
+        """Starts the service-loop."""
+        with self._archiver_thread_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self._archiver_stop.clear()
+                self.thread = threading.Thread(
+                    target=self._run_archiver, daemon=True
+                )
+                self.thread.start()
+
+    def stop(self) -> None:
+        """Stops the service-loop and waits for a running archival."""
+        self._archiver_stop.set()
+        with self._archiver_thread_lock:
+            if self.thread is not None:
+                self.thread.join()
+                self.thread = None
+
+    def run(self) -> int:
+        """Runs archival once and returns number of archived messages."""
+        archived = self.store.archive(self.max_age, self.keep_last)
+        if archived:
+            print(
+                f"INFO: Archived {archived} message(s).", file=sys.stderr
+            )
+        return archived
+
+    def _run_archiver(self) -> None:
+        """Service-loop definition."""
+        while not self._archiver_stop.wait(self.interval):
+            try:
+                self.run()
+            except (
+                Exception  # pylint: disable=broad-exception-caught
+            ) as exc_info:
+                print(
+                    f"ERROR: Archival of messages failed: {exc_info}",
+                    file=sys.stderr,
+                )
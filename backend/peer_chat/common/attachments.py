@@ -0,0 +1,199 @@
+"""Content-addressed attachment store-definition."""
+
+from typing import Optional, BinaryIO, Iterator, Iterable
+from pathlib import Path
+from uuid import uuid4
+from threading import Lock
+from time import monotonic
+import os
+import re
+import hashlib
+
+
+ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class AttachmentStore:
+    """
+    Content-addressed storage for attachment data.
+
+    Contents are identified (and thereby deduplicated) by their SHA-256
+    hash and stored as `<directory>/<first two digits>/<id>`. Uploads
+    are streamed into a temporary file in chunks of `chunk_size` bytes
+    while being hashed and only moved into place once complete.
+
+    Attachments that are stored with `pending=True` (e.g. uploads by
+    peers) are tracked until they are referenced by a message (see
+    `claim`); unclaimed attachments can be removed with `expire`. This
+    bookkeeping is not persisted (use `fsck` to remove unreferenced
+    attachments left over by a restart).
+
+    Keyword arguments:
+    directory -- base directory for attachment data
+    chunk_size -- size of chunks in bytes for reading uploads
+                  (default 64 KiB)
+    """
+
+    def __init__(self, directory: Path, chunk_size: int = 65536) -> None:
+        self._directory = directory
+        self._chunk_size = chunk_size
+        self._pending_lock = Lock()
+        self._pending: dict[str, tuple[float, int]] = {}
+
+    @staticmethod
+    def valid_id(id_: str) -> bool:
+        """Returns `True` if `id_` is a well-formed attachment id."""
+        return ID_PATTERN.fullmatch(id_ or "") is not None
+
+    def path(self, id_: str) -> Path:
+        """
+        Returns path to the data of attachment `id_`.
+
+        Raises `ValueError` for a malformed id.
+        """
+        if not self.valid_id(id_):
+            raise ValueError(f"Bad attachment id '{id_}'.")
+        return self._directory / id_[:2] / id_
+
+    def exists(self, id_: str) -> bool:
+        """Returns `True` if attachment `id_` exists."""
+        return self.valid_id(id_) and self.path(id_).is_file()
+
+    def size(self, id_: str) -> Optional[int]:
+        """Returns size of attachment `id_` in bytes (if it exists)."""
+        if not self.exists(id_):
+            return None
+        return self.path(id_).stat().st_size
+
+    def ids(self) -> Iterator[str]:
+        """Yields ids of all stored attachments."""
+        if not self._directory.is_dir():
+            return
+        for p in self._directory.glob("??/*"):
+            if self.valid_id(p.name):
+                yield p.name
+
+    def open(self, id_: str) -> BinaryIO:
+        """
+        Returns binary file-object for reading attachment `id_`.
+
+        Raises `FileNotFoundError` if the attachment does not exist.
+        """
+        return open(  # pylint: disable=consider-using-with
+            self.path(id_), "rb"
+        )
+
+    def put(
+        self,
+        stream: BinaryIO,
+        max_size: Optional[int] = None,
+        expected: Optional[str] = None,
+        pending: bool = False,
+    ) -> tuple[str, int]:
+        """
+        Stores data read from `stream` and returns tuple of attachment
+        id and size. Data that already exists is not stored again.
+
+        Raises `ValueError` if the data exceeds `max_size` or does not
+        match the `expected` id.
+
+        Keyword arguments:
+        stream -- binary file-like object
+        max_size -- maximum size in bytes
+                    (default None; unlimited)
+        expected -- expected id of the data
+                    (default None)
+        pending -- if `True`, newly stored data is tracked as pending
+                   until claimed (see `claim` and `expire`)
+                   (default False)
+        """
+        if expected is not None and not self.valid_id(expected):
+            raise ValueError(f"Bad attachment id '{expected}'.")
+        tmp_directory = self._directory / ".tmp"
+        tmp_directory.mkdir(parents=True, exist_ok=True)
+        tmp = tmp_directory / str(uuid4())
+        hash_ = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                while chunk := stream.read(self._chunk_size):
+                    size += len(chunk)
+                    if max_size is not None and size > max_size:
+                        raise ValueError(
+                            f"Attachment exceeds maximum size of {max_size} "
+                            + "bytes."
+                        )
+                    hash_.update(chunk)
+                    f.write(chunk)
+            id_ = hash_.hexdigest()
+            if expected is not None and id_ != expected:
+                raise ValueError(
+                    f"Attachment data does not match id '{expected}'."
+                )
+            target = self.path(id_)
+            if target.is_file():
+                os.remove(tmp)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, target)
+                if pending:
+                    with self._pending_lock:
+                        self._pending[id_] = (monotonic(), size)
+        except BaseException:
+            if tmp.is_file():
+                os.remove(tmp)
+            raise
+        return id_, size
+
+    def delete(self, id_: str) -> None:
+        """Removes attachment `id_`."""
+        with self._pending_lock:
+            self._pending.pop(id_, None)
+        try:
+            os.remove(self.path(id_))
+        except FileNotFoundError:
+            pass
+
+    @property
+    def pending_size(self) -> int:
+        """Returns total size of pending attachments in bytes."""
+        with self._pending_lock:
+            return sum(size for _, size in self._pending.values())
+
+    def claim(self, ids: Iterable[str]) -> None:
+        """Marks attachments `ids` as referenced (no longer pending)."""
+        with self._pending_lock:
+            for id_ in ids:
+                self._pending.pop(id_, None)
+
+    def expire(self, max_age: float) -> list[str]:
+        """
+        Removes pending attachments that have not been claimed within
+        `max_age` seconds and returns their ids.
+        """
+        deadline = monotonic() - max_age
+        with self._pending_lock:
+            expired = [
+                id_
+                for id_, (created, _) in self._pending.items()
+                if created < deadline
+            ]
+            for id_ in expired:
+                del self._pending[id_]
+                try:
+                    os.remove(self.path(id_))
+                except FileNotFoundError:
+                    pass
+        return expired
+
+    def copy_to(self, target: "AttachmentStore") -> int:
+        """
+        Copies all attachments into the store `target` and returns the
+        number of copied attachments.
+        """
+        count = 0
+        for id_ in self.ids():
+            with self.open(id_) as f:
+                target.put(f, expected=id_)
+            count += 1
+        return count
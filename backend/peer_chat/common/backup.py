@@ -0,0 +1,272 @@
+"""Incremental snapshot-backups of the message store."""
+
+from typing import Optional, Iterator
+import os
+import json
+import sys
+import gzip
+from time import sleep
+from pathlib import Path
+from datetime import datetime
+from dataclasses import dataclass, field
+
+from . import codec
+from .store import MessageStore
+from .transfer import (
+    TransferStats,
+    header_record,
+    conversation_records,
+    deletion_record,
+    import_ndjson,
+)
+
+
+MANIFEST = "manifest.json"
+
+
+@dataclass
+class Snapshot:
+    """
+    Record class for a snapshot in a backup directory. Implements
+    (de-)serialization methods `json` and `from_json`.
+    """
+
+    id_: int
+    file: str
+    incremental: bool
+    cursor: tuple[int, int]
+    created: datetime = field(default_factory=datetime.now)
+    conversations: int = 0
+    messages: int = 0
+    deletions: int = 0
+    attachments: int = 0
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "id": self.id_,
+            "file": self.file,
+            "incremental": self.incremental,
+            "cursor": list(self.cursor),
+            "created": self.created.isoformat(),
+            "conversations": self.conversations,
+            "messages": self.messages,
+            "deletions": self.deletions,
+            "attachments": self.attachments,
+        }
+
+    @staticmethod
+    def from_json(json_: dict) -> "Snapshot":
+        """
+        Returns instance initialized from serialized representation.
+        """
+        return Snapshot(
+            id_=json_["id"],
+            file=json_["file"],
+            incremental=json_["incremental"],
+            cursor=tuple(json_["cursor"]),
+            created=datetime.fromisoformat(json_["created"]),
+            conversations=json_.get("conversations", 0),
+            messages=json_.get("messages", 0),
+            deletions=json_.get("deletions", 0),
+            attachments=json_.get("attachments", 0),
+        )
+
+
+def list_snapshots(directory: Path) -> list[Snapshot]:
+    """Returns snapshots listed in the manifest of backup `directory`."""
+    if not (directory / MANIFEST).is_file():
+        return []
+    return [
+        Snapshot.from_json(s)
+        for s in json.loads(
+            (directory / MANIFEST).read_text(encoding="utf-8")
+        )["snapshots"]
+    ]
+
+
+def _write_manifest(directory: Path, snapshots: list[Snapshot]) -> None:
+    """Replaces manifest of backup `directory`."""
+    tmp = directory / f".{MANIFEST}.tmp"
+    # the manifest is small, written once per snapshot, and meant to be
+    # human-readable; hence, it is written (indented) with the standard
+    # library instead of `codec` (which does not support indentation)
+    tmp.write_text(
+        json.dumps({"snapshots": [s.json for s in snapshots]}, indent=2),
+        encoding="utf-8",
+    )
+    os.replace(tmp, directory / MANIFEST)
+
+
+def _changed(
+    store: MessageStore, since: tuple[int, int], until: tuple[int, int]
+) -> dict[str, dict]:
+    """
+    Returns changes recorded in the store's journal between the two
+    cursors, aggregated per conversation.
+    """
+    changes = {}
+    for record in store.changes.read(since, until):
+        change = changes.setdefault(
+            record["cid"], {"reset": False, "mids": set()}
+        )
+        if record.get("deleted"):
+            change["reset"] = True
+            change["mids"].clear()
+        elif "mid" in record:
+            change["mids"].add(record["mid"])
+    return changes
+
+
+def _incremental_records(
+    store: MessageStore, changes: dict[str, dict]
+) -> Iterator[dict]:
+    """
+    Generates records for the given changes (including the attachments
+    referenced by changed messages).
+    """
+    known = set(store.list_conversations())
+    attachments = set()
+    for cid, change in changes.items():
+        c = store.load_conversation(cid) if cid in known else None
+        if c is None or change["reset"]:
+            yield deletion_record(cid)
+        if c is None:
+            continue
+        yield from conversation_records(
+            store,
+            c,
+            None if change["reset"] else sorted(change["mids"]),
+            attachments=attachments,
+        )
+
+
+def _full_records(store: MessageStore) -> Iterator[dict]:
+    """Generates records for all conversations and attachments."""
+    attachments = set()
+    for cid in store.list_conversations():
+        c = store.load_conversation(cid)
+        if c is not None:
+            yield from conversation_records(
+                store, c, attachments=attachments
+            )
+
+
+def create_snapshot(
+    store: MessageStore, directory: Path, full: bool = False
+) -> Snapshot:
+    """
+    Writes a new (gzip-compressed NDJSON) snapshot into the backup
+    `directory` and returns its `Snapshot`. Snapshots contain the data
+    of attachments referenced by the included messages.
+
+    Unless `full` is set (or there is no previous snapshot), only
+    conversations and messages that have been changed since the last
+    snapshot (according to the store's `ChangeJournal`) are included.
+    The journal is enabled by the first snapshot.
+    Afterwards, journal-generations that are no longer needed are
+    removed (hence, a store should only be backed up into a single
+    backup directory).
+
+    Keyword arguments:
+    store -- message store
+    directory -- backup directory
+    full -- whether to force a full snapshot
+            (default False)
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    snapshots = list_snapshots(directory)
+    if not store.changes.enabled:
+        if snapshots:
+            print(
+                "INFO: Change journal not enabled, creating full snapshot.",
+                file=sys.stderr,
+            )
+        store.changes.enable()
+        # give other processes using the store (e.g. the running app)
+        # time to notice the enabled journal before collecting data
+        sleep(store.changes.interval)
+        full = True
+    cursor = store.changes.cursor()
+    generations = store.changes.generations()
+    if (
+        not full
+        and snapshots
+        and generations
+        and snapshots[-1].cursor[0] < generations[0]
+    ):
+        print(
+            "INFO: Change journal incomplete since last snapshot, "
+            + "creating full snapshot.",
+            file=sys.stderr,
+        )
+        full = True
+    incremental = bool(snapshots) and not full
+
+    id_ = snapshots[-1].id_ + 1 if snapshots else 1
+    snapshot = Snapshot(
+        id_=id_,
+        file=f"snapshot-{id_:06d}.ndjson.gz",
+        incremental=incremental,
+        cursor=cursor,
+    )
+    if incremental:
+        records = _incremental_records(
+            store, _changed(store, snapshots[-1].cursor, cursor)
+        )
+    else:
+        records = _full_records(store)
+
+    tmp = directory / f".{snapshot.file}.tmp"
+    with gzip.open(tmp, "wb") as f:
+        f.write(codec.dumpl(header_record(snapshot=snapshot.id_)))
+        for record in records:
+            if record["type"] == "conversation":
+                snapshot.conversations += 1
+            elif record["type"] == "message":
+                snapshot.messages += 1
+            elif record["type"] == "attachment":
+                if record["offset"] == 0:
+                    snapshot.attachments += 1
+            else:
+                snapshot.deletions += 1
+            f.write(codec.dumpl(record))
+    os.replace(tmp, directory / snapshot.file)
+    _write_manifest(directory, snapshots + [snapshot])
+    store.changes.prune(cursor)
+    return snapshot
+
+
+def restore_snapshots(
+    store: MessageStore, directory: Path, until: Optional[int] = None
+) -> TransferStats:
+    """
+    Restores the latest full snapshot (up to snapshot `until`) and all
+    subsequent incremental snapshots from the backup `directory` into
+    the store. Returns accumulated import statistics.
+
+    Raises `ValueError` if there is no suitable snapshot.
+
+    Keyword arguments:
+    store -- message store
+    directory -- backup directory
+    until -- id of the last snapshot to be restored
+             (default None; latest snapshot)
+    """
+    snapshots = [
+        s
+        for s in list_snapshots(directory)
+        if until is None or s.id_ <= until
+    ]
+    full = [i for i, s in enumerate(snapshots) if not s.incremental]
+    if not full:
+        raise ValueError(f"No full snapshot in '{directory}'.")
+    stats = TransferStats()
+    for snapshot in snapshots[full[-1] :]:
+        with gzip.open(directory / snapshot.file, "rb") as f:
+            result = import_ndjson(store, f, overwrite=True)
+        stats.conversations += result.conversations
+        stats.messages += result.messages
+        stats.attachments += result.attachments
+    return stats
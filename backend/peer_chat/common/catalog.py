@@ -0,0 +1,292 @@
+"""Conversation catalog-definition."""
+
+from typing import Optional, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from datetime import datetime
+from threading import Lock
+from bisect import bisect_left, insort
+import os
+import sys
+
+from . import codec
+from .models import Conversation
+
+
+@dataclass
+class CatalogEntry:
+    """
+    Record class for the conversation-summary stored in a `Catalog`.
+    Implements (de-)serialization methods `json` and `from_json`.
+    """
+
+    id_: str
+    peer: str
+    last_modified: datetime
+    unread_messages: bool = False
+    queued_messages: int = 0
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "id": self.id_,
+            "peer": self.peer,
+            "lastModified": self.last_modified.isoformat(),
+            "unreadMessages": self.unread_messages,
+            "queuedMessages": self.queued_messages,
+        }
+
+    @staticmethod
+    def from_json(json_: dict) -> "CatalogEntry":
+        """
+        Returns instance initialized from serialized representation.
+        """
+        return CatalogEntry(
+            id_=json_["id"],
+            peer=sys.intern(json_["peer"]),
+            last_modified=datetime.fromisoformat(json_["lastModified"]),
+            unread_messages=json_.get("unreadMessages", False),
+            queued_messages=json_.get("queuedMessages", 0),
+        )
+
+    @staticmethod
+    def from_conversation(c: Conversation) -> "CatalogEntry":
+        """Returns instance summarizing the given `Conversation`."""
+        return CatalogEntry(
+            id_=c.id_,
+            peer=c.peer,
+            last_modified=c.last_modified,
+            unread_messages=c.unread_messages,
+            queued_messages=len(c.queued_messages or []),
+        )
+
+
+class Catalog:
+    """
+    Persistent catalog of conversations.
+
+    The catalog is kept in memory and persisted as journal of
+    JSON-lines (upserts and deletions) which is compacted once it has
+    grown sufficiently. Changes made to the journal by other instances
+    (e.g. another `MessageStore` operating on the same directory) are
+    picked up incrementally.
+
+    Entries are additionally kept in an in-memory index ordered by
+    their last modification which allows for cursor-based pagination
+    (see `page`) as well as in an index of conversations with queued
+    messages per peer (see `queued`).
+
+    Keyword arguments:
+    path -- path to the journal file
+    read_only -- if `True`, the journal is never modified (only for
+                 reading the catalog)
+                 (default False)
+    """
+
+    def __init__(self, path: Path, read_only: bool = False) -> None:
+        self._path = path
+        self._read_only = read_only
+        self._lock = Lock()
+        self._entries: dict[str, CatalogEntry] = {}
+        self._order: list[tuple[datetime, str]] = []
+        self._queued: dict[str, set[str]] = {}
+        self._lines = 0
+        self._inode = None
+        self._offset = 0
+
+    @property
+    def exists(self) -> bool:
+        """Returns `True` if the journal exists on disk."""
+        return self._path.is_file()
+
+    def _set(self, entry: CatalogEntry) -> None:
+        """Adds or replaces entry in memory (including indices)."""
+        self._unset(entry.id_)
+        self._entries[entry.id_] = entry
+        insort(self._order, (entry.last_modified, entry.id_))
+        if entry.queued_messages:
+            self._queued.setdefault(entry.peer, set()).add(entry.id_)
+
+    def _unset(self, cid: str) -> None:
+        """Removes entry from memory (including indices)."""
+        entry = self._entries.pop(cid, None)
+        if entry is None:
+            return
+        i = bisect_left(self._order, (entry.last_modified, cid))
+        if i < len(self._order) and self._order[i][1] == cid:
+            del self._order[i]
+        if entry.queued_messages:
+            cids = self._queued[entry.peer]
+            cids.discard(cid)
+            if not cids:
+                del self._queued[entry.peer]
+
+    def _clear(self) -> None:
+        """Removes all entries from memory (including indices)."""
+        self._entries.clear()
+        self._order.clear()
+        self._queued.clear()
+
+    def _replay(self, data: bytes) -> int:
+        """
+        Applies journal-lines to in-memory catalog and returns number
+        of processed bytes (incomplete trailing lines are skipped).
+        """
+        processed = 0
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            processed += len(line)
+            self._lines += 1
+            try:
+                record = codec.loads(line)
+                if record.get("deleted"):
+                    self._unset(record["id"])
+                else:
+                    self._set(CatalogEntry.from_json(record))
+            except (
+                codec.JSONDecodeError,
+                KeyError,
+                TypeError,
+                ValueError,
+            ):
+                continue
+        return processed
+
+    def _sync(self) -> None:
+        """Loads changes of journal on disk."""
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._inode:
+            # (re-)load entirely
+            self._clear()
+            self._lines = 0
+            self._inode = stat.st_ino
+            self._offset = 0
+            data = self._path.read_bytes()
+            self._offset = self._replay(data)
+            if self._offset < len(data) and not self._read_only:
+                # terminate incomplete line of an interrupted write
+                with open(self._path, "ab") as f:
+                    f.write(b"\n")
+                self._offset = len(data) + 1
+            return
+        if stat.st_size > self._offset:
+            with open(self._path, "rb") as f:
+                f.seek(self._offset)
+                self._offset += self._replay(f.read())
+
+    def _append(self, records: Iterable[dict]) -> None:
+        """Appends records to journal and compacts if needed."""
+        with open(self._path, "ab") as f:
+            f.write(
+                b"".join(
+                    codec.dumpl(r) for r in records
+                )
+            )
+        # own changes are re-read by `_sync` to preserve the order of
+        # concurrent writes by other instances
+        self._sync()
+        if self._lines > 2 * len(self._entries) + 100:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrites the journal with the current entries only."""
+        tmp = self._path.with_name(self._path.name + ".tmp")
+        tmp.write_bytes(
+            b"".join(
+                codec.dumpl(e.json) for e in self._entries.values()
+            )
+        )
+        os.replace(tmp, self._path)
+        self._inode = None
+        self._sync()
+
+    def rebuild(self, entries: Iterable[CatalogEntry]) -> None:
+        """Replaces catalog-contents by `entries`."""
+        with self._lock:
+            self._clear()
+            for e in entries:
+                self._set(e)
+            self._compact()
+
+    def ids(self) -> list[str]:
+        """Returns list of conversation ids."""
+        with self._lock:
+            self._sync()
+            return list(self._entries)
+
+    def entries(self) -> list[CatalogEntry]:
+        """Returns list of catalog entries."""
+        with self._lock:
+            self._sync()
+            return list(self._entries.values())
+
+    def get(self, cid: str) -> Optional[CatalogEntry]:
+        """Returns catalog entry for `cid` (or `None` if unknown)."""
+        with self._lock:
+            self._sync()
+            return self._entries.get(cid)
+
+    def queued(self, peer: Optional[str] = None) -> list[str]:
+        """
+        Returns ids of conversations with queued messages (only those
+        with `peer` if given).
+        """
+        with self._lock:
+            self._sync()
+            if peer is not None:
+                return list(self._queued.get(peer, ()))
+            return [cid for cids in self._queued.values() for cid in cids]
+
+    def update(self, c: Conversation) -> None:
+        """Adds or updates entry for `Conversation`."""
+        entry = CatalogEntry.from_conversation(c)
+        with self._lock:
+            self._sync()
+            if self._entries.get(c.id_) == entry:
+                return
+            self._set(entry)
+            self._append([entry.json])
+
+    def remove(self, cid: str) -> None:
+        """Removes entry for `cid`."""
+        with self._lock:
+            self._sync()
+            if cid not in self._entries:
+                return
+            self._unset(cid)
+            self._append([{"id": cid, "deleted": True}])
+
+    def page(
+        self,
+        limit: int,
+        cursor: Optional[tuple[datetime, str]] = None,
+    ) -> tuple[list[CatalogEntry], Optional[tuple[datetime, str]]]:
+        """
+        Returns up to `limit` entries ordered by last modification
+        (most recent first) that follow after `cursor` as well as the
+        cursor for the next page (or `None` if there are no more
+        entries).
+
+        Keyword arguments:
+        limit -- maximum number of entries
+        cursor -- (last modification, id) of the last entry of the
+                  previous page
+                  (default None; start with most recent)
+        """
+        with self._lock:
+            self._sync()
+            end = (
+                len(self._order)
+                if cursor is None
+                else bisect_left(self._order, cursor)
+            )
+            start = max(0, end - limit)
+            keys = self._order[start:end][::-1]
+            return [self._entries[key[1]] for key in keys], (
+                keys[-1] if start > 0 and keys else None
+            )
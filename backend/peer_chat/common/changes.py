@@ -0,0 +1,229 @@
+"""Change journal-definition."""
+
+from typing import Optional, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, local
+from time import monotonic
+import os
+
+from . import codec
+
+
+class ChangeJournal:
+    """
+    Append-only journal of changes made through a `MessageStore`
+    (conversation-metadata, messages, and deletions).
+
+    The journal consists of generations (`<directory>/<n>.log`) of
+    JSON-lines; a new generation is started once the current one
+    exceeds `max_size`. Positions in the journal are given as cursor
+    (generation, offset) such that consumers (like incremental backups)
+    can read all changes since a previously recorded cursor.
+
+    The journal is only kept once it has been enabled (see `enable`;
+    i.e. once the `directory` exists). Since another process may enable
+    the journal, a disabled journal re-checks for the directory at most
+    once every `interval` seconds. Records are written to the file
+    immediately or, within a `batch`, once the (outermost) batch is
+    completed; if `sync` is set, every record is additionally synced to
+    disk.
+
+    Keyword arguments:
+    directory -- directory for the journal-files
+    max_size -- size in bytes after which a new generation is started
+                (default 16 MiB)
+    sync -- whether to flush and sync every record
+            (default False)
+    interval -- time in seconds between checks for an enabled journal
+                (default 1)
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_size: int = 16 * 1024 * 1024,
+        sync: bool = False,
+        interval: float = 1.0,
+    ) -> None:
+        self._directory = directory
+        self._max_size = max_size
+        self._sync = sync
+        self._interval = interval
+        self._lock = Lock()
+        self._file = None
+        self._generation = None
+        self._enabled = directory.is_dir()
+        self._checked = monotonic()
+        self._batch = local()
+
+    @property
+    def interval(self) -> float:
+        """
+        Returns the time in seconds after which other processes notice
+        that the journal has been enabled.
+        """
+        return self._interval
+
+    @property
+    def enabled(self) -> bool:
+        """Returns `True` if the journal is kept."""
+        with self._lock:
+            return self._is_enabled()
+
+    def _is_enabled(self) -> bool:
+        """Returns `True` if the journal is kept (requires lock)."""
+        if not self._enabled and monotonic() - self._checked > (
+            self._interval
+        ):
+            self._enabled = self._directory.is_dir()
+            self._checked = monotonic()
+        return self._enabled
+
+    def enable(self) -> None:
+        """Enables the journal (e.g. when creating the first backup)."""
+        with self._lock:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            self._enabled = True
+
+    def generation_path(self, generation: int) -> Path:
+        """Returns path to the journal-file of `generation`."""
+        return self._directory / f"{generation:06d}.log"
+
+    def generations(self) -> list[int]:
+        """Returns sorted list of existing generations."""
+        if not self._directory.is_dir():
+            return []
+        return sorted(
+            int(p.stem)
+            for p in self._directory.glob("*.log")
+            if p.stem.isdigit()
+        )
+
+    def record(
+        self, cid: str, mid: Optional[int] = None, deleted: bool = False
+    ) -> None:
+        """
+        Records change of conversation-metadata (`mid` is `None`),
+        message `mid`, or deletion of conversation `cid` (if the journal
+        is enabled).
+        """
+        record = {"cid": cid}
+        if mid is not None:
+            record["mid"] = mid
+        if deleted:
+            record["deleted"] = True
+        with self._lock:
+            if not self._is_enabled():
+                return
+            if self._file is None or self._file.tell() >= self._max_size:
+                self._open()
+            self._file.write(codec.dumpl(record))
+            if self._sync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            elif not getattr(self._batch, "depth", 0):
+                self._file.flush()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Returns a context manager that groups records; records of a
+        batch are written to the file at once when the batch is
+        completed.
+        """
+        self._batch.depth = getattr(self._batch, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._batch.depth -= 1
+            if self._batch.depth == 0:
+                self.flush()
+
+    def _open(self) -> None:
+        """Opens current (or next) generation for appending."""
+        if self._file is not None:
+            self._file.close()
+            self._generation += 1
+        else:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            generations = self.generations()
+            self._generation = generations[-1] if generations else 0
+            if (
+                generations
+                and self.generation_path(self._generation).stat().st_size
+                >= self._max_size
+            ):
+                self._generation += 1
+        self._file = open(  # pylint: disable=consider-using-with
+            self.generation_path(self._generation), "ab"
+        )
+
+    def flush(self) -> None:
+        """Writes buffered records to the journal-file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def cursor(self) -> tuple[int, int]:
+        """
+        Returns cursor pointing to the end of the last complete record
+        in the journal.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            generations = self.generations()
+            if not generations:
+                return (0, 0)
+            with open(self.generation_path(generations[-1]), "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                while size > 0:
+                    f.seek(max(0, size - 4096))
+                    tail = f.read(size - max(0, size - 4096))
+                    if b"\n" in tail:
+                        size -= len(tail) - tail.rindex(b"\n") - 1
+                        break
+                    size = max(0, size - 4096)
+            return (generations[-1], size)
+
+    def read(
+        self, since: tuple[int, int], until: tuple[int, int]
+    ) -> Iterator[dict]:
+        """
+        Yields change-records between the cursors `since` and `until`.
+        Incomplete trailing records are ignored.
+        """
+        for generation in self.generations():
+            if generation < since[0] or generation > until[0]:
+                continue
+            start = since[1] if generation == since[0] else 0
+            with open(self.generation_path(generation), "rb") as f:
+                f.seek(start)
+                data = f.read(
+                    (until[1] - start) if generation == until[0] else -1
+                )
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    yield codec.loads(line)
+                except codec.JSONDecodeError:
+                    continue
+
+    def prune(self, cursor: tuple[int, int]) -> None:
+        """Removes generations that are entirely before `cursor`."""
+        for generation in self.generations():
+            if generation >= cursor[0]:
+                break
+            try:
+                os.remove(self.generation_path(generation))
+            except FileNotFoundError:
+                pass
+
+    def close(self) -> None:
+        """Closes the journal-file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
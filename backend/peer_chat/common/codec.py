@@ -0,0 +1,123 @@
+"""
+JSON codec used for persistence and API payloads.
+
+If available, the faster `orjson`-package is used as backend; otherwise
+(or if selected explicitly via `use`) this module falls back to the
+standard library. Both backends produce compatible (but not
+byte-identical) output: `orjson` omits whitespace after separators and
+does not escape non-ASCII characters.
+
+Modules should access the codec via the module (`codec.dumps(..)`)
+such that a backend selected later via `use` takes effect.
+"""
+
+from typing import Any, Optional, Callable
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+BACKENDS = ("json",) + (("orjson",) if orjson is not None else ())
+BACKEND = BACKENDS[-1]
+
+# orjson-decode errors are a subclass of the standard library's error
+JSONDecodeError = json.JSONDecodeError
+
+
+def use(backend: Optional[str] = None) -> str:
+    """
+    Selects codec-backend and returns its name. Without argument, the
+    fastest available backend is selected.
+
+    Raises `ValueError` for an unknown or unavailable `backend`.
+    """
+    global BACKEND  # pylint: disable=global-statement
+    if backend is None:
+        backend = BACKENDS[-1]
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown or unavailable JSON codec '{backend}' (available: "
+            + f"{', '.join(BACKENDS)})."
+        )
+    BACKEND = backend
+    return BACKEND
+
+
+def dumps(
+    obj: Any,
+    default: Optional[Callable[[Any], Any]] = None,
+    sort_keys: bool = False,
+) -> str:
+    """
+    Returns JSON-string for `obj`.
+
+    Keyword arguments:
+    obj -- object to be serialized
+    default -- callable returning a serializable version of objects
+               that are not supported natively
+               (default None)
+    sort_keys -- whether to sort the keys of objects
+                 (default False)
+    """
+    if BACKEND == "orjson":
+        return dumpb(obj, default, sort_keys).decode("utf-8")
+    return json.dumps(obj, default=default, sort_keys=sort_keys)
+
+
+def dumpb(
+    obj: Any,
+    default: Optional[Callable[[Any], Any]] = None,
+    sort_keys: bool = False,
+) -> bytes:
+    """
+    Returns UTF-8-encoded JSON for `obj` (see `dumps` for arguments).
+    """
+    if BACKEND == "orjson":
+        return orjson.dumps(
+            obj,
+            default=default,
+            option=(
+                orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATACLASS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+                | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+            ),
+        )
+    return dumps(obj, default, sort_keys).encode("utf-8")
+
+
+def dumpl(obj: Any) -> bytes:
+    """Returns UTF-8-encoded JSON for `obj` as (JSON-)line."""
+    return dumpb(obj) + b"\n"
+
+
+def loads(data: str | bytes | bytearray | memoryview) -> Any:
+    """
+    Returns object deserialized from JSON `data`.
+
+    Raises `JSONDecodeError` for invalid input.
+    """
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class SocketIOJSON:
+    """
+    Adapter exposing the codec with the interface of the standard
+    library's `json`-module (as required by `SocketIO`).
+    """
+
+    # pylint: disable=unused-argument
+    @staticmethod
+    def dumps(obj: Any, *args, **kwargs) -> str:
+        """Returns JSON-string for `obj` (ignores formatting options)."""
+        return dumps(obj, default=kwargs.get("default"))
+
+    @staticmethod
+    def loads(data: str | bytes, *args, **kwargs) -> Any:
+        """Returns object deserialized from JSON `data`."""
+        return loads(data)
@@ -0,0 +1,132 @@
+"""Message-key deduplication index-definition."""
+
+from typing import Optional
+from pathlib import Path
+from threading import Lock
+from collections import OrderedDict
+import os
+
+from . import codec
+
+
+class DedupIndex:
+    """
+    Bounded index of sender-generated message keys per conversation
+    that is used to recognize repeated deliveries of the same message.
+
+    For every conversation, the `max_keys` most recently registered
+    keys (and the ids of the corresponding messages) are retained. The
+    index is persisted per conversation as journal of JSON-lines in
+    `directory` (compacted once it contains more than twice the number
+    of retained keys) and loaded lazily. If `deferred`, new keys are
+    only appended to the journals on `flush`.
+
+    Keyword arguments:
+    directory -- directory for the journals
+    max_keys -- number of retained keys per conversation
+                (default 1000)
+    deferred -- whether journal-writes are deferred until `flush`
+                (default False)
+    """
+
+    def __init__(
+        self, directory: Path, max_keys: int = 1000, deferred: bool = False
+    ) -> None:
+        self._directory = directory
+        self._max_keys = max_keys
+        self._deferred = deferred
+        self._lock = Lock()
+        self._keys: dict[str, OrderedDict[str, int]] = {}
+        self._lines: dict[str, int] = {}
+        self._pending: dict[str, list[dict]] = {}
+
+    def _journal(self, cid: str) -> Path:
+        """Returns path to the journal of conversation `cid`."""
+        return self._directory / f"{cid}.jsonl"
+
+    def _load(self, cid: str) -> OrderedDict[str, int]:
+        """Returns keys of conversation `cid` (loads journal if needed)."""
+        if cid in self._keys:
+            return self._keys[cid]
+        keys = OrderedDict()
+        lines = 0
+        journal = self._journal(cid)
+        if journal.is_file():
+            for line in journal.read_bytes().splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break
+                lines += 1
+                try:
+                    record = codec.loads(line)
+                    keys[record["key"]] = record["id"]
+                    keys.move_to_end(record["key"])
+                except (codec.JSONDecodeError, KeyError, TypeError):
+                    continue
+            while len(keys) > self._max_keys:
+                keys.popitem(last=False)
+        self._keys[cid] = keys
+        self._lines[cid] = lines
+        return keys
+
+    def _write(self, cid: str, records: list[dict]) -> None:
+        """Appends records to the journal of `cid` (compacts if needed)."""
+        self._directory.mkdir(parents=True, exist_ok=True)
+        with open(self._journal(cid), "ab") as f:
+            f.write(b"".join(codec.dumpl(r) for r in records))
+        self._lines[cid] += len(records)
+        if self._lines[cid] > 2 * self._max_keys:
+            self._compact(cid)
+
+    def _compact(self, cid: str) -> None:
+        """Rewrites the journal of `cid` with the retained keys only."""
+        journal = self._journal(cid)
+        tmp = journal.with_name(journal.name + ".tmp")
+        tmp.write_bytes(
+            b"".join(
+                codec.dumpl({"key": key, "id": mid})
+                for key, mid in self._keys[cid].items()
+            )
+        )
+        os.replace(tmp, journal)
+        self._lines[cid] = len(self._keys[cid])
+
+    def get(self, cid: str, key: str) -> Optional[int]:
+        """
+        Returns id of the message with `key` in conversation `cid` (or
+        `None` if unknown).
+        """
+        with self._lock:
+            return self._load(cid).get(key)
+
+    def add(self, cid: str, key: str, mid: int) -> None:
+        """Registers `key` of message `mid` in conversation `cid`."""
+        with self._lock:
+            keys = self._load(cid)
+            keys[key] = mid
+            keys.move_to_end(key)
+            if len(keys) > self._max_keys:
+                keys.popitem(last=False)
+            if self._deferred:
+                self._pending.setdefault(cid, []).append(
+                    {"key": key, "id": mid}
+                )
+                return
+            self._write(cid, [{"key": key, "id": mid}])
+
+    def flush(self) -> None:
+        """Writes deferred keys to the journals."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for cid, records in pending.items():
+                self._write(cid, records)
+
+    def remove(self, cid: str) -> None:
+        """Removes conversation `cid` from the index."""
+        with self._lock:
+            self._keys.pop(cid, None)
+            self._lines.pop(cid, None)
+            self._pending.pop(cid, None)
+            try:
+                os.remove(self._journal(cid))
+            except FileNotFoundError:
+                pass
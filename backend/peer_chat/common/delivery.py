@@ -0,0 +1,294 @@
+"""Definitions for the background delivery of outbound messages."""
+
+from typing import Optional
+import sys
+import threading
+import random
+from time import monotonic
+from collections import deque
+from dataclasses import dataclass, field
+
+from flask_socketio import SocketIO
+
+from .models import User, MessageStatus
+from .store import MessageStore
+from .peers import PeerClient
+from .util import DEFAULT_CLIENT, send_message, send_messages
+
+
+@dataclass
+class PeerDeliveryState:
+    """Record class for the delivery state of a single peer."""
+
+    queue: deque = field(default_factory=deque)
+    failures: int = 0
+    next_attempt: float = 0.0
+    busy: bool = False
+
+
+class DeliveryWorker:
+    """
+    Threaded worker class that delivers outbound messages to peers in
+    the background using a pool of threads.
+
+    Submitted messages are persisted as queued (status 'queued' and
+    listed in the queued messages of their conversation) before being
+    delivered; hence, the queued messages of the store form a
+    persistent outbox that can be reloaded with `load`. Messages are
+    delivered in order per peer by at most one thread at a time. After
+    a failed delivery, further attempts for that peer are delayed by an
+    exponential backoff (starting at `base_delay`, capped at
+    `max_delay`) with random jitter (between half and the full delay).
+    Consecutive queued messages of a conversation are sent as a single
+    batch of up to `batch_size` messages if the peer supports the
+    feature 'message-batch'. Status changes are emitted via `socket`
+    (see `send_message` and `send_messages`).
+
+    Keyword arguments:
+    store -- message store
+    user -- local user
+    socket -- socket for status updates
+    client -- client for outbound requests
+              (default None; uses `util.DEFAULT_CLIENT`)
+    threads -- number of worker threads
+               (default 4)
+    base_delay -- delay after the first failed delivery in seconds
+                  (default 1)
+    max_delay -- maximum delay between attempts in seconds
+                 (default 300)
+    batch_size -- maximum number of messages sent in one request
+                  (default 1000)
+    """
+
+    def __init__(
+        self,
+        store: MessageStore,
+        user: User,
+        socket: SocketIO,
+        client: Optional[PeerClient] = None,
+        threads: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        batch_size: int = 1000,
+    ) -> None:
+        self.store = store
+        self.user = user
+        self.socket = socket
+        self.client = client or DEFAULT_CLIENT
+        self.threads = threads
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+
+        self._condition = threading.Condition()
+        self._peers: dict[str, PeerDeliveryState] = {}
+        self._pending: set[tuple[str, int]] = set()
+        self._stopped = False
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        """Starts the worker threads."""
+        with self._condition:
+            if self._threads:
+                return
+            self._stopped = False
+            self._threads = [
+                threading.Thread(target=self._run, daemon=True)
+                for _ in range(self.threads)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the worker threads and waits for running deliveries.
+        Undelivered messages remain queued in the store.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            threads = self._threads
+            self._threads = []
+        for thread in threads:
+            thread.join()
+
+    @property
+    def pending(self) -> int:
+        """Returns number of messages awaiting delivery."""
+        with self._condition:
+            return len(self._pending)
+
+    def _enqueue(self, peer: str, cid: str, mid: int) -> None:
+        """Adds message to the queue of `peer` (if not already queued)."""
+        with self._condition:
+            if (cid, mid) in self._pending:
+                return
+            self._pending.add((cid, mid))
+            self._peers.setdefault(peer, PeerDeliveryState()).queue.append(
+                (cid, mid)
+            )
+            self._condition.notify()
+
+    def submit(self, cid: str, mid: int) -> bool:
+        """
+        Marks message `mid` of conversation `cid` as queued and submits
+        it for delivery. Returns `False` if the message does not exist.
+        """
+        c = self.store.load_conversation(cid)
+        if c is None:
+            return False
+        m = self.store.load_message(cid, mid)
+        if m is None:
+            return False
+        if m.status == MessageStatus.OK:
+            return True
+        m.status = MessageStatus.QUEUED
+        if mid not in c.queued_messages:
+            c.queued_messages.append(mid)
+        self.store.post_message(cid, m)
+        self.socket.emit("update-message", {"cid": cid, "message": m.json})
+        self.socket.emit("update-conversation", c.json)
+        self._enqueue(c.peer, cid, mid)
+        return True
+
+    def load(self, peer: Optional[str] = None) -> None:
+        """
+        Submits all queued messages of the store (or only those of
+        conversations with `peer`) for delivery.
+        """
+        for cid in self.store.list_queued(peer):
+            c = self.store.load_conversation(cid)
+            if c is None:
+                continue
+            for mid in c.queued_messages.copy():
+                self._enqueue(c.peer, c.id_, mid)
+
+    def wake(self, peer: str) -> None:
+        """
+        Resets the backoff for `peer` (e.g. after the peer reported to
+        be online) and submits its queued messages for delivery.
+        """
+        self.client.reset(peer)
+        with self._condition:
+            state = self._peers.get(peer)
+            if state is not None:
+                state.failures = 0
+                state.next_attempt = 0.0
+                self._condition.notify()
+        self.load(peer)
+
+    def _deliver(self, cid: str, mids: list[int]) -> int:
+        """
+        Attempts delivery of messages `mids` of conversation `cid` (in
+        order). Returns the number of leading messages that have been
+        handled; the remaining messages should be retried.
+        """
+        c = self.store.load_conversation(cid)
+        if c is None:
+            return len(mids)
+        ms = []
+        for mid in mids:
+            m = self.store.load_message(cid, mid)
+            # skip messages that have been removed or deleted meanwhile
+            if m is not None and m.status in (
+                MessageStatus.QUEUED,
+                MessageStatus.SENDING,
+            ):
+                ms.append(m)
+        delivered = len(mids)
+        if len(ms) > 1 and "message-batch" in self.client.features(c.peer):
+            if not send_messages(
+                c, ms, self.store, self.user, self.socket, self.client
+            ):
+                delivered = 0
+        else:
+            for m in ms:
+                if not send_message(
+                    c, m, self.store, self.user, self.socket, self.client
+                ):
+                    delivered = mids.index(m.id_)
+                    break
+        done = set(mids[:delivered])
+        if done.intersection(c.queued_messages):
+            c.queued_messages = [
+                mid for mid in c.queued_messages if mid not in done
+            ]
+            self.store.write(cid)
+        if delivered:
+            self.socket.emit("update-conversation", c.json)
+        return delivered
+
+    def _next_peer(self) -> tuple[Optional[str], Optional[float]]:
+        """
+        Returns a peer that is ready for delivery (or `None` and the
+        time in seconds until the next peer becomes ready).
+        """
+        now = monotonic()
+        timeout = None
+        for peer, state in self._peers.items():
+            if state.busy or not state.queue:
+                continue
+            if state.next_attempt <= now:
+                return peer, None
+            if timeout is None or state.next_attempt - now < timeout:
+                timeout = state.next_attempt - now
+        return None, timeout
+
+    def _run(self) -> None:
+        """Service-loop definition."""
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    peer, timeout = self._next_peer()
+                    if peer is not None:
+                        break
+                    self._condition.wait(timeout)
+                state = self._peers[peer]
+                state.busy = True
+            try:
+                self._run_peer(state)
+            finally:
+                with self._condition:
+                    state.busy = False
+                    self._condition.notify()
+
+    def _run_peer(self, state: PeerDeliveryState) -> None:
+        """Delivers queued messages of a single peer in order."""
+        while True:
+            with self._condition:
+                if self._stopped or not state.queue:
+                    return
+                cid = state.queue[0][0]
+                mids = []
+                for cid_, mid in state.queue:
+                    if cid_ != cid or len(mids) >= self.batch_size:
+                        break
+                    mids.append(mid)
+            try:
+                delivered = self._deliver(cid, mids)
+            except (
+                Exception  # pylint: disable=broad-exception-caught
+            ) as exc_info:
+                print(
+                    f"ERROR: Delivery of messages in conversation '{cid}' "
+                    + f"failed: {exc_info}",
+                    file=sys.stderr,
+                )
+                delivered = 0
+            with self._condition:
+                for mid in mids[:delivered]:
+                    state.queue.popleft()
+                    self._pending.discard((cid, mid))
+                if delivered < len(mids):
+                    state.failures += 1
+                    delay = min(
+                        self.max_delay,
+                        self.base_delay * 2 ** min(state.failures - 1, 32),
+                    )
+                    state.next_attempt = monotonic() + delay * random.uniform(
+                        0.5, 1
+                    )
+                    return
+                state.failures = 0
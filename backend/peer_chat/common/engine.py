@@ -0,0 +1,1140 @@
+"""Storage engine-definitions for the `MessageStore`."""
+
+from typing import Optional, Iterator, Iterable
+from pathlib import Path
+from threading import Lock, Condition, local
+from shutil import rmtree
+from contextlib import contextmanager
+from uuid import uuid4
+import os
+import sys
+import struct
+import sqlite3
+import zlib
+
+from . import codec
+from .attachments import AttachmentStore
+
+
+FSYNC_POLICIES = ("never", "batch", "always")
+
+
+def fsync_path(path: Path) -> None:
+    """Flushes file or directory at `path` to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _Commit:
+    """
+    Record class for a pending group commit: files (or directories)
+    that need to be synced followed by renames of temporary files.
+    """
+
+    def __init__(
+        self,
+        fsync: Iterable[Path] = (),
+        renames: Iterable[tuple[Path, Path]] = (),
+    ) -> None:
+        self.fsync = list(fsync)
+        self.renames = list(renames)
+        self.error: Optional[OSError] = None
+
+
+class GroupCommitter:
+    """
+    Coalesces the fsync-calls of concurrent writers (group commit).
+
+    Writers submit their pending commits and block until these have
+    been processed. The first waiting writer becomes leader and
+    processes all commits that are pending at that time in a single
+    pass (every file and directory is synced only once), while commits
+    submitted in the meantime form the next group.
+    """
+
+    def __init__(self) -> None:
+        self._cond = Condition(Lock())
+        self._pending: list[_Commit] = []
+        self._leader = False
+        self._group = 1
+        self._completed = 0
+
+    @staticmethod
+    def _process(commits: list[_Commit]) -> None:
+        """Syncs files, performs renames, and syncs directories."""
+        synced = set()
+        for commit in commits:
+            try:
+                for path in commit.fsync:
+                    if path not in synced:
+                        fsync_path(path)
+                        synced.add(path)
+                for tmp, path in commit.renames:
+                    os.replace(tmp, path)
+            except OSError as exc_info:
+                commit.error = exc_info
+        for commit in commits:
+            try:
+                for _, path in commit.renames:
+                    if path.parent not in synced:
+                        fsync_path(path.parent)
+                        synced.add(path.parent)
+            except OSError as exc_info:
+                commit.error = commit.error or exc_info
+
+    def commit(self, commits: list[_Commit]) -> None:
+        """
+        Submits `commits` and returns once they have been processed.
+        Raises the first `OSError` that occurred while processing.
+        """
+        with self._cond:
+            group = self._group
+            self._pending.extend(commits)
+            while self._completed < group:
+                if self._leader:
+                    self._cond.wait()
+                    continue
+                self._leader = True
+                current, self._pending = self._pending, []
+                processing = self._group
+                self._group += 1
+                self._cond.release()
+                try:
+                    self._process(current)
+                finally:
+                    self._cond.acquire()
+                    self._leader = False
+                    self._completed = processing
+                    self._cond.notify_all()
+        for commit in commits:
+            if commit.error is not None:
+                raise commit.error
+
+
+class StorageEngine:
+    """
+    Base class for persistence backends of a `MessageStore`.
+
+    Engines only translate between serialized representations (as
+    returned by `Conversation.json` and `Message.json`) and the
+    underlying storage; caching and locking are handled by the
+    `MessageStore`. Read-methods raise an exception (e.g.
+    `FileNotFoundError`) if the requested data does not exist.
+
+    Files are replaced atomically (written to a temporary file and
+    renamed). The fsync-policy determines when data is flushed to disk:
+    * "never": leave flushing to the operating system,
+    * "batch": flush all writes of a `batch` (and those of concurrent
+      writers) together (group commit), or
+    * "always": flush every write individually.
+
+    Keyword arguments:
+    working_dir -- working directory
+    fsync -- fsync-policy; one of `FSYNC_POLICIES`
+             (default "never")
+    """
+
+    NAME = None
+
+    def __init__(self, working_dir: Path, fsync: str = "never") -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(
+                f"Unknown fsync-policy '{fsync}' (expected one of "
+                + f"{', '.join(map(repr, FSYNC_POLICIES))})."
+            )
+        self._working_dir = working_dir
+        working_dir.mkdir(parents=True, exist_ok=True)
+        self._fsync = fsync
+        self._committer = GroupCommitter()
+        self._staged = local()
+
+    @property
+    def working_dir(self) -> Path:
+        """Returns the engine's working directory."""
+        return self._working_dir
+
+    @property
+    def fsync(self) -> str:
+        """Returns the engine's fsync-policy."""
+        return self._fsync
+
+    def conversation_path(self, cid: str) -> Optional[Path]:
+        """Returns directory associated with conversation `cid`."""
+        return self._working_dir / cid
+
+    def list_conversations(self) -> list[str]:
+        """Returns a list of conversation-ids."""
+        raise NotImplementedError
+
+    def read_conversation(self, cid: str) -> dict:
+        """Returns serialized conversation-metadata."""
+        raise NotImplementedError
+
+    def write_conversation(self, cid: str, json_: dict) -> None:
+        """Writes serialized conversation-metadata."""
+        raise NotImplementedError
+
+    def delete_conversation(self, cid: str) -> None:
+        """Deletes conversation including all messages."""
+        raise NotImplementedError
+
+    def list_messages(self, cid: str) -> list[int]:
+        """Returns sorted list of stored message-ids of a conversation."""
+        raise NotImplementedError
+
+    def read_message(self, cid: str, mid: int) -> dict:
+        """Returns serialized message."""
+        raise NotImplementedError
+
+    def read_messages(self, cid: str, mids: list[int]) -> dict[int, dict]:
+        """
+        Returns serialized messages for `mids` as mapping of message id
+        to message. Message ids that do not exist are omitted.
+        """
+        messages = {}
+        for mid in mids:
+            try:
+                messages[mid] = self.read_message(cid, mid)
+            except (FileNotFoundError, KeyError):
+                pass
+        return messages
+
+    def write_message(self, cid: str, mid: int, json_: dict) -> None:
+        """Writes serialized message."""
+        raise NotImplementedError
+
+    def archivable_messages(self, cid: str) -> list[int]:
+        """
+        Returns ids of messages that are not yet archived (see
+        `archive_messages`). Engines without support for archival
+        return an empty list.
+        """
+        return []
+
+    def archive_messages(self, cid: str, mids: list[int]) -> int:
+        """
+        Moves messages into a compact archive that remains readable
+        through `read_message` and `read_messages`. Returns number of
+        archived messages; engines without support for archival do not
+        archive anything.
+        """
+        return 0
+
+    def compact(
+        self, cids: Optional[Iterable[str]] = None, min_ratio: float = 0.5
+    ) -> int:
+        """
+        Reclaims space occupied by outdated message-records of the
+        conversations `cids` (or of conversations that have been
+        written to recently) if the share of current records has dropped
+        below `min_ratio`. Returns number of compacted conversations;
+        engines that do not accumulate outdated records do not compact
+        anything.
+        """
+        return 0
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Returns a context manager that groups write-operations; engines
+        may use this to commit all contained writes at once.
+
+        With the fsync-policy "batch", files that are replaced within a
+        batch only become visible once the batch is completed.
+        """
+        if self._fsync != "batch":
+            yield
+            return
+        depth = getattr(self._staged, "depth", 0)
+        if depth == 0:
+            self._staged.commits = []
+        self._staged.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._staged.depth -= 1
+            if self._staged.depth == 0:
+                commits, self._staged.commits = self._staged.commits, None
+                if commits:
+                    self._committer.commit(commits)
+
+    def _stage(self, commit: _Commit) -> None:
+        """Adds commit to the current batch or commits immediately."""
+        if getattr(self._staged, "commits", None) is not None:
+            self._staged.commits.append(commit)
+            return
+        self._committer.commit([commit])
+
+    def _write_file(self, path: Path, data: bytes) -> None:
+        """
+        Atomically replaces file at `path` by `data` according to the
+        fsync-policy.
+        """
+        tmp = path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if self._fsync == "always":
+                f.flush()
+                os.fsync(f.fileno())
+        if self._fsync == "batch":
+            self._stage(_Commit(fsync=[tmp], renames=[(tmp, path)]))
+            return
+        os.replace(tmp, path)
+        if self._fsync == "always":
+            fsync_path(path.parent)
+
+    def _sync(self, *paths: Path) -> None:
+        """
+        Flushes files that have been written to in-place (e.g. by
+        appending) according to the fsync-policy.
+        """
+        if self._fsync == "always":
+            for path in paths:
+                fsync_path(path)
+        elif self._fsync == "batch":
+            self._stage(_Commit(fsync=paths))
+
+    def close(self) -> None:
+        """Releases resources held by this engine."""
+
+
+class _ChunkArchive:
+    """
+    In-memory state of the message-archive of a single conversation in
+    a `DirectoryEngine`.
+
+    Archived messages are grouped into blocks (JSON-lists of messages)
+    that are compressed individually and appended to chunk files
+    (`archive/chunk-<n>.z`). An append-only offset index
+    (`archive/chunks.idx`) maps message ids to their block such that
+    reading a message only requires decompressing a single block.
+
+    Keyword arguments:
+    path -- conversation directory
+    """
+
+    # message id, chunk, offset, length
+    RECORD = struct.Struct("<qIQI")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path / "archive"
+        self.lock = Lock()
+        self.offsets: dict[int, tuple[int, int, int]] = {}
+        self.chunk = 0
+        self._load()
+
+    @property
+    def index(self) -> Path:
+        """Returns path to offset index."""
+        return self.path / "chunks.idx"
+
+    def chunk_path(self, chunk: int) -> Path:
+        """Returns path to chunk file."""
+        return self.path / f"chunk-{chunk:06d}.z"
+
+    def _load(self) -> None:
+        """Loads offset index."""
+        if not self.index.is_file():
+            return
+        data = self.index.read_bytes()
+        # ignore incomplete trailing record
+        for record in self.RECORD.iter_unpack(
+            data[: len(data) - len(data) % self.RECORD.size]
+        ):
+            self.offsets[record[0]] = record[1:]
+            self.chunk = max(self.chunk, record[1])
+
+    def append(
+        self,
+        messages: dict[int, dict],
+        block_size: int,
+        chunk_size: int,
+    ) -> None:
+        """
+        Compresses messages in blocks of `block_size` messages and
+        appends them to the current chunk (or a new chunk if the current
+        one exceeds `chunk_size`). Chunks and index are synced to disk
+        before returning.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        chunk = self.chunk_path(self.chunk)
+        if chunk.is_file() and chunk.stat().st_size >= chunk_size:
+            self.chunk += 1
+            chunk = self.chunk_path(self.chunk)
+        mids = sorted(messages)
+        index = []
+        with open(chunk, "ab") as f:
+            offset = f.tell()
+            for i in range(0, len(mids), block_size):
+                block = zlib.compress(
+                    codec.dumpb(
+                        [messages[mid] for mid in mids[i : i + block_size]]
+                    )
+                )
+                f.write(block)
+                for mid in mids[i : i + block_size]:
+                    index.append((mid, self.chunk, offset, len(block)))
+                offset += len(block)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index, "ab") as f:
+            f.write(b"".join(self.RECORD.pack(*r) for r in index))
+            f.flush()
+            os.fsync(f.fileno())
+        fsync_path(self.path)
+        for mid, *location in index:
+            self.offsets[mid] = tuple(location)
+
+    def read_many(self, mids: Iterable[int]) -> dict[int, dict]:
+        """
+        Returns archived messages for all indexed `mids`. Every block is
+        read and decompressed only once.
+        """
+        by_block: dict[tuple[int, int, int], set[int]] = {}
+        for mid in mids:
+            if mid in self.offsets:
+                by_block.setdefault(self.offsets[mid], set()).add(mid)
+        messages = {}
+        for (chunk, offset, length), requested in sorted(by_block.items()):
+            with open(self.chunk_path(chunk), "rb") as f:
+                f.seek(offset)
+                block = codec.loads(zlib.decompress(f.read(length)))
+            for json_ in block:
+                if json_.get("id") in requested:
+                    messages[json_["id"]] = json_
+        return messages
+
+
+class DirectoryEngine(StorageEngine):
+    """
+    Stores every conversation in a separate directory containing the
+    conversation-metadata (`index.json`) and one file per message
+    (`<mid>.json`).
+
+    Messages can be archived into compressed chunks (see
+    `_ChunkArchive`); a message file that is written after archival
+    takes precedence over the archived version.
+
+    Keyword arguments:
+    working_dir -- working directory
+    fsync -- fsync-policy; one of `FSYNC_POLICIES`
+             (default "never")
+    """
+
+    NAME = "directory"
+    # number of messages per compressed block in the archive
+    ARCHIVE_BLOCK_SIZE = 64
+    # size in bytes after which a new archive-chunk is started
+    ARCHIVE_CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, working_dir: Path, fsync: str = "never") -> None:
+        super().__init__(working_dir, fsync=fsync)
+        self._archives: dict[str, _ChunkArchive] = {}
+        self._archives_lock = Lock()
+
+    def _archive(self, cid: str) -> _ChunkArchive:
+        """Returns (and loads if needed) the message archive of `cid`."""
+        with self._archives_lock:
+            if cid not in self._archives:
+                self._archives[cid] = _ChunkArchive(self._working_dir / cid)
+            return self._archives[cid]
+
+    def list_conversations(self) -> list[str]:
+        conversations = []
+        for c in self._working_dir.glob("*"):
+            if c.is_dir() and (c / "index.json").is_file():
+                conversations.append(c.name)
+        return conversations
+
+    def read_conversation(self, cid: str) -> dict:
+        return codec.loads(
+            (self._working_dir / cid / "index.json").read_bytes()
+        )
+
+    def write_conversation(self, cid: str, json_: dict) -> None:
+        (self._working_dir / cid).mkdir(parents=True, exist_ok=True)
+        self._write_file(
+            self._working_dir / cid / "index.json",
+            codec.dumpb(json_),
+        )
+
+    def delete_conversation(self, cid: str) -> None:
+        with self._archives_lock:
+            self._archives.pop(cid, None)
+        if (self._working_dir / cid).is_dir():
+            rmtree(self._working_dir / cid)
+
+    def list_messages(self, cid: str) -> list[int]:
+        archive = self._archive(cid)
+        with archive.lock:
+            return sorted(
+                set(self.archivable_messages(cid)) | set(archive.offsets)
+            )
+
+    def read_message(self, cid: str, mid: int) -> dict:
+        try:
+            return codec.loads(
+                (self._working_dir / cid / f"{mid}.json").read_bytes()
+            )
+        except FileNotFoundError:
+            archive = self._archive(cid)
+            with archive.lock:
+                messages = archive.read_many([mid])
+            if mid not in messages:
+                raise
+            return messages[mid]
+
+    def read_messages(self, cid: str, mids: list[int]) -> dict[int, dict]:
+        messages = {}
+        missing = []
+        for mid in mids:
+            try:
+                messages[mid] = codec.loads(
+                    (self._working_dir / cid / f"{mid}.json").read_bytes()
+                )
+            except FileNotFoundError:
+                missing.append(mid)
+        if missing:
+            archive = self._archive(cid)
+            with archive.lock:
+                messages.update(archive.read_many(missing))
+        return messages
+
+    def write_message(self, cid: str, mid: int, json_: dict) -> None:
+        self._write_file(
+            self._working_dir / cid / f"{mid}.json",
+            codec.dumpb(json_),
+        )
+
+    def archivable_messages(self, cid: str) -> list[int]:
+        return sorted(
+            int(m.stem)
+            for m in (self._working_dir / cid).glob("*.json")
+            if m.stem.isdigit()
+        )
+
+    def archive_messages(self, cid: str, mids: list[int]) -> int:
+        messages = {}
+        for mid in mids:
+            try:
+                messages[mid] = codec.loads(
+                    (self._working_dir / cid / f"{mid}.json").read_bytes()
+                )
+            except FileNotFoundError:
+                pass
+        if not messages:
+            return 0
+        archive = self._archive(cid)
+        with archive.lock:
+            archive.append(
+                messages, self.ARCHIVE_BLOCK_SIZE, self.ARCHIVE_CHUNK_SIZE
+            )
+        # remove message files only after the archive has been synced
+        for mid in messages:
+            (self._working_dir / cid / f"{mid}.json").unlink()
+        return len(messages)
+
+    def close(self) -> None:
+        with self._archives_lock:
+            self._archives.clear()
+
+
+class _SegmentLog:
+    """
+    In-memory state of the message-log of a single conversation in a
+    `SegmentEngine`. Tracks the total size of all segments, the size
+    of the current (live) records, and whether records have been
+    appended since loading or compacting the log (`modified`).
+
+    Keyword arguments:
+    path -- conversation directory
+    """
+
+    # message id, segment, offset, length
+    RECORD = struct.Struct("<qIQI")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.lock = Lock()
+        self.offsets: dict[int, tuple[int, int, int]] = {}
+        self.segment = 0
+        self.size = 0
+        self.total = 0
+        self.live = 0
+        self.modified = False
+        self._load()
+
+    @property
+    def index(self) -> Path:
+        """Returns path to offset index."""
+        return self.path / "segments.idx"
+
+    def segment_path(self, segment: int) -> Path:
+        """Returns path to segment file."""
+        return self.path / f"segment-{segment:06d}.log"
+
+    def _load(self) -> None:
+        """
+        Loads offset index and recovers records that have been appended
+        to segments but are missing in the index (e.g. after a crash).
+        Segments preceding all indexed records only contain outdated
+        records (e.g. left behind by an interrupted compaction) and are
+        removed.
+        """
+        indexed = {}
+        if self.index.is_file():
+            data = self.index.read_bytes()
+            # ignore incomplete trailing record
+            for mid, segment, offset, length in self.RECORD.iter_unpack(
+                data[: len(data) - len(data) % self.RECORD.size]
+            ):
+                self.offsets[mid] = (segment, offset, length)
+                indexed[segment] = max(
+                    indexed.get(segment, 0), offset + length
+                )
+        segments = sorted(
+            int(s.stem.split("-")[1]) for s in self.path.glob("segment-*.log")
+        )
+        if indexed:
+            for segment in segments:
+                if segment < min(indexed):
+                    os.remove(self.segment_path(segment))
+            segments = [s for s in segments if s >= min(indexed)]
+        if not segments:
+            return
+        self.segment = segments[-1]
+        recovered = []
+        for segment in segments:
+            offset = indexed.get(segment, 0)
+            if self.segment_path(segment).stat().st_size <= offset:
+                continue
+            with open(self.segment_path(segment), "r+b") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # drop incomplete trailing record
+                        f.truncate(offset)
+                        break
+                    try:
+                        mid = codec.loads(line)["id"]
+                    except (codec.JSONDecodeError, KeyError, TypeError):
+                        offset += len(line)
+                        continue
+                    self.offsets[mid] = (segment, offset, len(line))
+                    recovered.append((mid, segment, offset, len(line)))
+                    offset += len(line)
+            indexed[segment] = offset
+        self.size = indexed.get(self.segment, 0)
+        self.total = sum(indexed.get(segment, 0) for segment in segments)
+        self.live = sum(length for _, _, length in self.offsets.values())
+        if recovered:
+            with open(self.index, "ab") as f:
+                f.write(b"".join(self.RECORD.pack(*r) for r in recovered))
+
+    def append(
+        self, records: list[tuple[int, bytes]], max_size: int
+    ) -> list[Path]:
+        """
+        Appends encoded message-records to the log. Returns list of
+        modified files and directories.
+        """
+        self.modified = True
+        modified = [self.segment_path(self.segment), self.index]
+        if self.size >= max_size:
+            self.segment += 1
+            self.size = 0
+            modified = [self.segment_path(self.segment), self.index]
+        if not self.segment_path(self.segment).is_file():
+            modified.append(self.path)
+        index = []
+        with open(self.segment_path(self.segment), "ab") as f:
+            for mid, data in records:
+                f.write(data)
+                if mid in self.offsets:
+                    self.live -= self.offsets[mid][2]
+                self.offsets[mid] = (self.segment, self.size, len(data))
+                index.append(
+                    self.RECORD.pack(mid, self.segment, self.size, len(data))
+                )
+                self.size += len(data)
+                self.total += len(data)
+                self.live += len(data)
+        with open(self.index, "ab") as f:
+            f.write(b"".join(index))
+        return modified
+
+    def compact(self, max_size: int) -> None:
+        """
+        Rewrites all live records into new segments (following the
+        current segment) and replaces the offset index before removing
+        the previous segments. If interrupted, the previous state
+        remains intact until the new index is in place; afterwards,
+        the previous segments are removed when loading the log.
+        """
+        first = self.segment + 1
+        segment, size = first, 0
+        offsets = {}
+        by_segment: dict[int, list[int]] = {}
+        for mid, (segment_, _, _) in self.offsets.items():
+            by_segment.setdefault(segment_, []).append(mid)
+        written = []
+        f = open(  # pylint: disable=consider-using-with
+            self.segment_path(segment), "wb"
+        )
+        try:
+            for segment_ in sorted(by_segment):
+                for mid, data in sorted(
+                    self.read_many(by_segment[segment_]).items()
+                ):
+                    if size >= max_size:
+                        f.close()
+                        written.append(self.segment_path(segment))
+                        segment, size = segment + 1, 0
+                        f = open(  # pylint: disable=consider-using-with
+                            self.segment_path(segment), "wb"
+                        )
+                    f.write(data)
+                    offsets[mid] = (segment, size, len(data))
+                    size += len(data)
+        finally:
+            f.close()
+        written.append(self.segment_path(segment))
+        tmp = self.index.with_name(f".{self.index.name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(
+                b"".join(
+                    self.RECORD.pack(mid, *offsets[mid])
+                    for mid in sorted(offsets)
+                )
+            )
+        for path in written + [tmp]:
+            fsync_path(path)
+        os.replace(tmp, self.index)
+        fsync_path(self.path)
+        for segment_ in range(first):
+            try:
+                os.remove(self.segment_path(segment_))
+            except FileNotFoundError:
+                pass
+        self.offsets = offsets
+        self.segment = segment
+        self.size = size
+        self.total = self.live = sum(
+            length for _, _, length in offsets.values()
+        )
+        self.modified = False
+
+    def read(self, mid: int) -> bytes:
+        """Returns raw message-record."""
+        segment, offset, length = self.offsets[mid]
+        with open(self.segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def read_many(self, mids: list[int]) -> dict[int, bytes]:
+        """
+        Returns raw message-records for all indexed `mids`. Every
+        segment is opened only once and records that are close to each
+        other are read in a single operation.
+        """
+        by_segment: dict[int, list[tuple[int, int, int]]] = {}
+        for mid in mids:
+            if mid in self.offsets:
+                segment, offset, length = self.offsets[mid]
+                by_segment.setdefault(segment, []).append(
+                    (offset, length, mid)
+                )
+        records = {}
+        for segment, items in by_segment.items():
+            items.sort()
+            start = items[0][0]
+            end = max(offset + length for offset, length, _ in items)
+            with open(self.segment_path(segment), "rb") as f:
+                if end - start <= 2 * sum(i[1] for i in items) + 65536:
+                    f.seek(start)
+                    data = f.read(end - start)
+                    for offset, length, mid in items:
+                        records[mid] = data[
+                            offset - start : offset - start + length
+                        ]
+                    continue
+                for offset, length, mid in items:
+                    f.seek(offset)
+                    records[mid] = f.read(length)
+        return records
+
+
+class SegmentEngine(DirectoryEngine):
+    """
+    Stores conversation-metadata like the `DirectoryEngine` but appends
+    messages to per-conversation segment files (JSON-lines) instead of
+    writing individual files. An append-only offset index
+    (`segments.idx`) maps message ids to their latest record; it can be
+    recovered from the segments if it is incomplete. Since updated
+    messages are appended as new records, outdated records accumulate
+    until the log is compacted (see `compact`). Logs of at least
+    `compact_min_size` bytes are also compacted while writing once
+    less than `compact_ratio` of their records are current (after the
+    enclosing `batch` is completed, if any).
+
+    Keyword arguments:
+    working_dir -- working directory
+    segment_size -- size in bytes after which a new segment is started
+                    (default 16 MiB)
+    fsync -- fsync-policy; one of `FSYNC_POLICIES`
+             (default "never")
+    compact_ratio -- ratio of current records below which a log is
+                     compacted while writing
+                     (default 0.5)
+    compact_min_size -- minimum size in bytes of a log for being
+                        compacted while writing
+                        (default 1 MiB)
+    """
+
+    NAME = "segment"
+
+    def __init__(
+        self,
+        working_dir: Path,
+        segment_size: int = 16 * 1024 * 1024,
+        fsync: str = "never",
+        compact_ratio: float = 0.5,
+        compact_min_size: int = 1024 * 1024,
+    ) -> None:
+        super().__init__(working_dir, fsync=fsync)
+        self._segment_size = segment_size
+        self._compact_ratio = compact_ratio
+        self._compact_min_size = compact_min_size
+        self._logs: dict[str, _SegmentLog] = {}
+        self._logs_lock = Lock()
+        # conversations to be compacted after the current batch
+        self._due = local()
+
+    def _log(self, cid: str) -> _SegmentLog:
+        """Returns (and loads if needed) the message log of `cid`."""
+        with self._logs_lock:
+            if cid not in self._logs:
+                self._logs[cid] = _SegmentLog(self._working_dir / cid)
+            return self._logs[cid]
+
+    def delete_conversation(self, cid: str) -> None:
+        with self._logs_lock:
+            self._logs.pop(cid, None)
+        if (self._working_dir / cid).is_dir():
+            rmtree(self._working_dir / cid)
+
+    def list_messages(self, cid: str) -> list[int]:
+        log = self._log(cid)
+        with log.lock:
+            return sorted(log.offsets)
+
+    def read_message(self, cid: str, mid: int) -> dict:
+        log = self._log(cid)
+        with log.lock:
+            return codec.loads(log.read(mid))
+
+    def read_messages(self, cid: str, mids: list[int]) -> dict[int, dict]:
+        log = self._log(cid)
+        with log.lock:
+            records = log.read_many(mids)
+        return {mid: codec.loads(data) for mid, data in records.items()}
+
+    def write_message(self, cid: str, mid: int, json_: dict) -> None:
+        log = self._log(cid)
+        with log.lock:
+            self._sync(
+                *log.append(
+                    [(mid, codec.dumpl(json_))],
+                    self._segment_size,
+                )
+            )
+            due = (
+                log.total >= self._compact_min_size
+                and log.live < self._compact_ratio * log.total
+            )
+        if not due:
+            return
+        if getattr(self._due, "depth", 0):
+            # pending commits of the batch may refer to current segments
+            self._due.cids.add(cid)
+            return
+        self._compact_due([cid])
+
+    def _compact_due(self, cids: Iterable[str]) -> None:
+        """Compacts logs of `cids` (errors are only reported)."""
+        try:
+            self.compact(cids, self._compact_ratio)
+        except (
+            Exception  # pylint: disable=broad-exception-caught
+        ) as exc_info:
+            print(
+                f"ERROR: Unable to compact message storage: {exc_info}",
+                file=sys.stderr,
+            )
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        depth = getattr(self._due, "depth", 0)
+        if depth == 0:
+            self._due.cids = set()
+        self._due.depth = depth + 1
+        try:
+            with super().batch():
+                yield
+        finally:
+            self._due.depth -= 1
+        if self._due.depth == 0 and self._due.cids:
+            cids, self._due.cids = self._due.cids, set()
+            self._compact_due(cids)
+
+    def compact(
+        self, cids: Optional[Iterable[str]] = None, min_ratio: float = 0.5
+    ) -> int:
+        if cids is None:
+            with self._logs_lock:
+                logs = [log for log in self._logs.values() if log.modified]
+        else:
+            logs = [
+                self._log(cid)
+                for cid in cids
+                if (self._working_dir / cid).is_dir()
+            ]
+        compacted = 0
+        for log in logs:
+            with log.lock:
+                if log.live >= min_ratio * log.total or not log.offsets:
+                    continue
+                log.compact(self._segment_size)
+                compacted += 1
+        return compacted
+
+    def archivable_messages(self, cid: str) -> list[int]:
+        # messages are already stored compactly in segments
+        return []
+
+    def archive_messages(self, cid: str, mids: list[int]) -> int:
+        return 0
+
+    def close(self) -> None:
+        with self._logs_lock:
+            self._logs.clear()
+
+
+class SQLiteEngine(StorageEngine):
+    """
+    Stores all conversations and messages in a single SQLite-database
+    (`store.sqlite3`) operated in WAL-mode, i.e. readers do not block
+    the writer and vice versa. Every thread uses its own connection.
+    Writes within a `batch` are committed in a single transaction. The
+    fsync-policy is mapped onto SQLite's `synchronous`-setting (OFF,
+    NORMAL, FULL).
+
+    Keyword arguments:
+    working_dir -- working directory
+    timeout -- time in seconds to wait for a locked database
+               (default 10)
+    fsync -- fsync-policy; one of `FSYNC_POLICIES`
+             (default "never")
+    """
+
+    NAME = "sqlite"
+    FILENAME = "store.sqlite3"
+    SYNCHRONOUS = {"never": "OFF", "batch": "NORMAL", "always": "FULL"}
+
+    def __init__(
+        self, working_dir: Path, timeout: float = 10, fsync: str = "never"
+    ) -> None:
+        super().__init__(working_dir, fsync=fsync)
+        self._timeout = timeout
+        self._local = local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = Lock()
+        with self._transaction() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations "
+                + "(id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages "
+                + "(cid TEXT NOT NULL, mid INTEGER NOT NULL, "
+                + "data TEXT NOT NULL, PRIMARY KEY (cid, mid)) "
+                + "WITHOUT ROWID"
+            )
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """Returns database connection of the current thread."""
+        if not hasattr(self._local, "db"):
+            db = sqlite3.connect(
+                self._working_dir / self.FILENAME,
+                timeout=self._timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(f"PRAGMA synchronous={self.SYNCHRONOUS[self._fsync]}")
+            self._local.db = db
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(db)
+        return self._local.db
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Returns a context manager for a (possibly nested) write
+        transaction.
+        """
+        db = self._db
+        if self._local.depth == 0:
+            db.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield db
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                db.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            db.execute("COMMIT")
+
+    def conversation_path(self, cid: str) -> Optional[Path]:
+        return None
+
+    def list_conversations(self) -> list[str]:
+        return [
+            row[0] for row in self._db.execute("SELECT id FROM conversations")
+        ]
+
+    def read_conversation(self, cid: str) -> dict:
+        row = self._db.execute(
+            "SELECT data FROM conversations WHERE id = ?", (cid,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown conversation '{cid}'.")
+        return codec.loads(row[0])
+
+    def write_conversation(self, cid: str, json_: dict) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO conversations (id, data) "
+                + "VALUES (?, ?)",
+                (cid, codec.dumps(json_)),
+            )
+
+    def delete_conversation(self, cid: str) -> None:
+        with self._transaction() as db:
+            db.execute("DELETE FROM messages WHERE cid = ?", (cid,))
+            db.execute("DELETE FROM conversations WHERE id = ?", (cid,))
+
+    def list_messages(self, cid: str) -> list[int]:
+        return [
+            row[0]
+            for row in self._db.execute(
+                "SELECT mid FROM messages WHERE cid = ? ORDER BY mid", (cid,)
+            )
+        ]
+
+    def read_message(self, cid: str, mid: int) -> dict:
+        row = self._db.execute(
+            "SELECT data FROM messages WHERE cid = ? AND mid = ?", (cid, mid)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown message '{cid}.{mid}'.")
+        return codec.loads(row[0])
+
+    def read_messages(self, cid: str, mids: list[int]) -> dict[int, dict]:
+        if not mids:
+            return {}
+        requested = set(mids)
+        return {
+            row[0]: codec.loads(row[1])
+            for row in self._db.execute(
+                "SELECT mid, data FROM messages "
+                + "WHERE cid = ? AND mid BETWEEN ? AND ?",
+                (cid, min(mids), max(mids)),
+            )
+            if row[0] in requested
+        }
+
+    def write_message(self, cid: str, mid: int, json_: dict) -> None:
+        with self._transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO messages (cid, mid, data) "
+                + "VALUES (?, ?, ?)",
+                (cid, mid, codec.dumps(json_)),
+            )
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        with self._transaction():
+            yield
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for db in self._connections:
+                db.close()
+            self._connections.clear()
+        self._local = local()
+
+
+ENGINES = {
+    e.NAME: e for e in (DirectoryEngine, SegmentEngine, SQLiteEngine)
+}
+
+
+def load_engine(name: str, working_dir: Path, **kwargs) -> StorageEngine:
+    """
+    Returns `StorageEngine` identified by `name` for `working_dir`.
+
+    Keyword arguments:
+    name -- engine name (one of the keys of `ENGINES`)
+    working_dir -- working directory
+    kwargs -- additional keyword arguments passed to the engine
+    """
+    if name not in ENGINES:
+        raise ValueError(
+            f"Unknown storage engine '{name}' (expected one of "
+            + f"{', '.join(map(repr, ENGINES))})."
+        )
+    return ENGINES[name](working_dir, **kwargs)
+
+
+def migrate(
+    source: StorageEngine,
+    target: StorageEngine,
+    source_attachments: Optional[AttachmentStore] = None,
+    target_attachments: Optional[AttachmentStore] = None,
+) -> tuple[int, int, int]:
+    """
+    Copies all conversations and messages from `source` to `target`
+    (and all attachments from `source_attachments` to
+    `target_attachments` if both are given). Returns a tuple of the
+    numbers of migrated conversations, messages, and attachments.
+
+    Keyword arguments:
+    source -- engine to read from
+    target -- engine to write to
+    source_attachments -- attachment store to read from
+                          (default None)
+    target_attachments -- attachment store to write to
+                          (default None)
+    """
+    conversations = 0
+    messages = 0
+    for cid in source.list_conversations():
+        with target.batch():
+            target.write_conversation(cid, source.read_conversation(cid))
+            for mid in source.list_messages(cid):
+                target.write_message(cid, mid, source.read_message(cid, mid))
+                messages += 1
+        conversations += 1
+    attachments = 0
+    if source_attachments is not None and target_attachments is not None:
+        attachments = source_attachments.copy_to(target_attachments)
+    return conversations, messages, attachments
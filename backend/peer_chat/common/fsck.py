@@ -0,0 +1,422 @@
+"""Consistency check (and repair) of the message store."""
+
+from typing import Optional
+from pathlib import Path
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from .models import MessageStatus, Message, Conversation
+from .engine import StorageEngine, load_engine
+from .catalog import Catalog, CatalogEntry
+from .attachments import AttachmentStore
+from .store import MessageStore
+
+
+@dataclass
+class FsckIssue:
+    """
+    Record class for an inconsistency found by `fsck`. Implements
+    (de-)serialization method `json`.
+    """
+
+    cid: Optional[str]
+    kind: str
+    detail: str
+    fixable: bool = False
+    fixed: bool = False
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "cid": self.cid,
+            "kind": self.kind,
+            "detail": self.detail,
+            "fixable": self.fixable,
+            "fixed": self.fixed,
+        }
+
+
+@dataclass
+class FsckReport:
+    """
+    Record class for the result of `fsck`. Implements
+    (de-)serialization method `json`.
+    """
+
+    conversations: int = 0
+    messages: int = 0
+    issues: list[FsckIssue] = field(default_factory=list)
+    compacted: int = 0
+
+    @property
+    def clean(self) -> bool:
+        """Returns `True` if no (unrepaired) issues remain."""
+        return all(issue.fixed for issue in self.issues)
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "conversations": self.conversations,
+            "messages": self.messages,
+            "issues": [issue.json for issue in self.issues],
+            "compacted": self.compacted,
+        }
+
+
+@dataclass
+class ConversationCheck:
+    """
+    Record class for the result of `check_conversation`, including the
+    repairs that are required to resolve fixable issues.
+    """
+
+    cid: str
+    metadata: Optional[dict] = None
+    messages: int = 0
+    issues: list[FsckIssue] = field(default_factory=list)
+    length: Optional[int] = None
+    queued_messages: Optional[list[int]] = None
+    requeue: list[int] = field(default_factory=list)
+    attachments: set[str] = field(default_factory=set)
+
+
+def _read_messages(
+    engine: StorageEngine, cid: str, mids: list[int]
+) -> tuple[dict[int, dict], list[int]]:
+    """
+    Returns readable messages and ids of unreadable messages (falls
+    back to reading messages individually if the batch fails).
+    """
+    try:
+        messages = engine.read_messages(cid, mids)
+    except (
+        Exception  # pylint: disable=broad-exception-caught
+    ):
+        messages = {}
+        for mid in mids:
+            try:
+                messages[mid] = engine.read_message(cid, mid)
+            except (
+                Exception  # pylint: disable=broad-exception-caught
+            ):
+                pass
+    return messages, [mid for mid in mids if mid not in messages]
+
+
+def check_conversation(
+    engine: StorageEngine, cid: str, chunk_size: int = 1000
+) -> ConversationCheck:
+    """
+    Verifies metadata of conversation `cid` against its messages and
+    returns `ConversationCheck`.
+
+    Keyword arguments:
+    engine -- storage engine
+    cid -- conversation id
+    chunk_size -- number of messages read at once
+                  (default 1000)
+    """
+    result = ConversationCheck(cid)
+    try:
+        result.metadata = engine.read_conversation(cid)
+        c = Conversation.from_json(result.metadata)
+    except (
+        Exception  # pylint: disable=broad-exception-caught
+    ) as exc_info:
+        result.metadata = None
+        result.issues.append(
+            FsckIssue(cid, "metadata", f"Unreadable metadata: {exc_info}")
+        )
+        return result
+
+    mids = engine.list_messages(cid)
+    result.messages = len(mids)
+    queued = set()
+    for i in range(0, len(mids), chunk_size):
+        messages, unreadable = _read_messages(
+            engine, cid, mids[i : i + chunk_size]
+        )
+        for mid in unreadable:
+            result.issues.append(
+                FsckIssue(cid, "message", f"Unreadable message {mid}.")
+            )
+        for mid, json_ in messages.items():
+            try:
+                m = Message.from_json(json_)
+            except (
+                Exception  # pylint: disable=broad-exception-caught
+            ):
+                result.issues.append(
+                    FsckIssue(cid, "message", f"Malformed message {mid}.")
+                )
+                continue
+            if m.id_ != mid:
+                result.issues.append(
+                    FsckIssue(
+                        cid,
+                        "message",
+                        f"Message {mid} is stored with id {m.id_}.",
+                    )
+                )
+            if m.status == MessageStatus.SENDING:
+                result.requeue.append(mid)
+                queued.add(mid)
+            elif m.status == MessageStatus.QUEUED:
+                queued.add(mid)
+            for a in m.attachments or []:
+                result.attachments.add(a.id_)
+
+    if mids and mids[-1] >= c.length:
+        result.length = mids[-1] + 1
+        result.issues.append(
+            FsckIssue(
+                cid,
+                "length",
+                f"Length {c.length} does not cover message {mids[-1]}.",
+                fixable=True,
+            )
+        )
+    missing = max(c.length, result.length or 0) - len(mids)
+    if missing > 0:
+        result.issues.append(
+            FsckIssue(cid, "missing", f"{missing} message(s) missing.")
+        )
+    if result.requeue:
+        result.issues.append(
+            FsckIssue(
+                cid,
+                "sending",
+                f"{len(result.requeue)} message(s) stuck in status "
+                + "'sending'.",
+                fixable=True,
+            )
+        )
+    if set(c.queued_messages) != queued:
+        result.queued_messages = [
+            mid for mid in c.queued_messages if mid in queued
+        ] + sorted(queued - set(c.queued_messages))
+        result.issues.append(
+            FsckIssue(
+                cid,
+                "queued",
+                f"Queue {c.queued_messages} does not match queued "
+                + f"messages {sorted(queued)}.",
+                fixable=True,
+            )
+        )
+    return result
+
+
+_ENGINE: Optional[StorageEngine] = None
+
+
+def _init_worker(engine: str, directory: Path) -> None:
+    """Opens storage engine in worker process."""
+    global _ENGINE  # pylint: disable=global-statement
+    _ENGINE = load_engine(engine, directory)
+
+
+def _check_worker(cid: str) -> ConversationCheck:
+    """Runs `check_conversation` in worker process."""
+    return check_conversation(_ENGINE, cid)
+
+
+def _repair(
+    store: MessageStore, check: ConversationCheck
+) -> list[FsckIssue]:
+    """
+    Applies repairs of `check` via `store` and marks the repaired
+    issues of `check` as fixed. Returns (unfixable) issues for
+    conversations or messages that could not be loaded for repair.
+    """
+    c = store.load_conversation(check.cid)
+    if c is None:
+        return [
+            FsckIssue(
+                check.cid,
+                "metadata",
+                "Unable to load conversation for repair.",
+            )
+        ]
+    issues = []
+    if check.length is not None:
+        c.length = max(c.length, check.length)
+    skipped = set()
+    for mid in check.requeue:
+        m = store.load_message(check.cid, mid)
+        if m is None:
+            skipped.add(mid)
+            issues.append(
+                FsckIssue(
+                    check.cid,
+                    "message",
+                    f"Unable to load message {mid} for repair.",
+                )
+            )
+            continue
+        m.status = MessageStatus.QUEUED
+        store.post_message(check.cid, m)
+    if check.queued_messages is not None:
+        c.queued_messages = [
+            mid for mid in check.queued_messages if mid not in skipped
+        ]
+    store.write(check.cid)
+    repaired = len(check.requeue) - len(skipped)
+    for issue in check.issues:
+        if not issue.fixable:
+            continue
+        if issue.kind == "sending":
+            # skipped messages are reported separately
+            if repaired == 0:
+                continue
+            issue.detail = (
+                f"{repaired} message(s) stuck in status 'sending'."
+            )
+        issue.fixed = True
+    return issues
+
+
+def fsck(
+    directory: Path,
+    engine: str = "directory",
+    jobs: Optional[int] = None,
+    dry_run: bool = False,
+    fsync: str = "never",
+) -> FsckReport:
+    """
+    Checks the consistency of a message store and repairs fixable
+    issues. Returns `FsckReport`.
+
+    Conversations are checked in parallel by a pool of `jobs` worker
+    processes. For every conversation, the metadata is compared with
+    the stored messages (length, queued messages, messages stuck in
+    status 'sending'). Afterwards, the catalog is compared with the
+    checked metadata and rebuilt if needed, and the attachment store
+    is checked for missing and unreferenced attachments. Unless
+    `dry_run` is set, the storage of all conversations is compacted if
+    needed (see `StorageEngine.compact`). A dry run does not modify the
+    data directory (in particular, a missing catalog is only reported).
+
+    The store should not be in use by another process while checking.
+
+    Keyword arguments:
+    directory -- data directory
+    engine -- storage engine name
+              (default "directory")
+    jobs -- number of worker processes
+            (default None; number of CPUs)
+    dry_run -- if `True`, only report issues
+               (default False)
+    fsync -- fsync-policy for repairs; one of `FSYNC_POLICIES`
+             (default "never")
+    """
+    jobs = jobs or os.cpu_count() or 1
+    engine_ = load_engine(engine, directory, fsync=fsync)
+    if dry_run:
+        # read-only access (`MessageStore` rebuilds a missing catalog)
+        store = None
+        catalog = Catalog(directory / ".catalog", read_only=True)
+        attachment_store = AttachmentStore(directory / ".attachments")
+    else:
+        store = MessageStore(directory, engine=engine_)
+        catalog = None
+        attachment_store = store.attachments
+    report = FsckReport()
+    try:
+        cids = engine_.list_conversations()
+        if jobs > 1 and len(cids) > 1:
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_worker,
+                initargs=(engine, directory),
+            ) as executor:
+                checks = list(
+                    executor.map(
+                        _check_worker,
+                        cids,
+                        chunksize=max(1, len(cids) // (jobs * 16)),
+                    )
+                )
+        else:
+            checks = [check_conversation(engine_, cid) for cid in cids]
+
+        attachments = set()
+        expected = {}
+        for check in checks:
+            report.conversations += 1
+            report.messages += check.messages
+            report.issues.extend(check.issues)
+            attachments.update(check.attachments)
+            if check.metadata is None:
+                continue
+            if not dry_run and any(i.fixable for i in check.issues):
+                issues = _repair(store, check)
+                report.issues.extend(issues)
+                c = store.load_conversation(check.cid)
+                if c is not None:
+                    expected[check.cid] = CatalogEntry.from_conversation(c)
+                    continue
+            expected[check.cid] = CatalogEntry.from_conversation(
+                Conversation.from_json(check.metadata)
+            )
+
+        # outdated records
+        if not dry_run:
+            report.compacted = engine_.compact(cids)
+
+        # catalog
+        if dry_run:
+            actual = (
+                {entry.id_: entry for entry in catalog.entries()}
+                if catalog.exists
+                else None
+            )
+        else:
+            actual = {entry.id_: entry for entry in store.list_catalog()}
+        if actual is None:
+            report.issues.append(
+                FsckIssue(None, "catalog", "Missing catalog.", fixable=True)
+            )
+        elif expected != actual:
+            issue = FsckIssue(
+                None,
+                "catalog",
+                "Catalog does not match stored conversations "
+                + f"({len(actual)} entries, {len(expected)} expected).",
+                fixable=True,
+            )
+            report.issues.append(issue)
+            if not dry_run:
+                store.rebuild_catalog(expected.values())
+                issue.fixed = True
+
+        # attachments (unreferenced attachments are only removed if all
+        # messages could be read)
+        complete = not any(
+            issue.kind in ("metadata", "message") for issue in report.issues
+        )
+        stored = set(attachment_store.ids())
+        for id_ in sorted(attachments - stored):
+            report.issues.append(
+                FsckIssue(None, "attachment", f"Missing attachment {id_}.")
+            )
+        for id_ in sorted(stored - attachments):
+            issue = FsckIssue(
+                None,
+                "attachment",
+                f"Unreferenced attachment {id_}.",
+                fixable=complete,
+            )
+            report.issues.append(issue)
+            if not dry_run and complete:
+                attachment_store.delete(id_)
+                issue.fixed = True
+    finally:
+        if store is None:
+            engine_.close()
+        else:
+            store.close()
+    return report
@@ -1,13 +1,15 @@
 """Common data model definitions."""
 
 from typing import Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from pathlib import Path
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
+import sys
 from uuid import uuid4
 from enum import Enum
 
+from . import codec
+
 
 @dataclass
 class User:
@@ -34,7 +36,7 @@ class User:
 
     def write(self, path: Path) -> None:
         """Write to disk."""
-        path.write_text(json.dumps(self.json), encoding="utf-8")
+        path.write_text(codec.dumps(self.json), encoding="utf-8")
 
 
 @dataclass
@@ -51,6 +53,42 @@ class Auth:
         path.write_text(self.value, encoding="utf-8")
 
 
+@dataclass
+class Attachment:
+    """
+    Record class for a reference to the content of an
+    `AttachmentStore` (identified by its SHA-256 hash) with metadata.
+    Implements (de-)serialization methods `json` and `from_json`.
+    """
+
+    id_: str
+    size: int
+    name: Optional[str] = None
+    type_: Optional[str] = None
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        json_ = {"id": self.id_, "size": self.size}
+        if self.name is not None:
+            json_["name"] = self.name
+        if self.type_ is not None:
+            json_["type"] = self.type_
+        return json_
+
+    @staticmethod
+    def from_json(json_: dict) -> "Attachment":
+        """
+        Returns instance initialized from serialized representation.
+        """
+        return Attachment(
+            id_=json_["id"],
+            size=json_["size"],
+            name=json_.get("name"),
+            type_=json_.get("type"),
+        )
+
+
 class MessageStatus(Enum):
     """Message status enum."""
 
@@ -62,32 +100,131 @@ class MessageStatus(Enum):
     ERROR = "error"
 
 
-@dataclass
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_STATUS = tuple(MessageStatus)
+_STATUS_INDEX = {status: index for index, status in enumerate(_STATUS)}
+
+
+def to_timestamp(dt: datetime) -> int:
+    """
+    Returns (naive local) `datetime` as integer microseconds since
+    epoch. Timezone-aware values are converted to local time first.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def from_timestamp(ts: int) -> datetime:
+    """Returns (naive local) `datetime` for `to_timestamp`-value."""
+    return _EPOCH + timedelta(microseconds=ts)
+
+
+def now() -> int:
+    """Returns current (local) time as `to_timestamp`-value."""
+    return to_timestamp(datetime.now())
+
+
 class Message:
     """
     Record class for message metadata and content. Implements
     (de-)serialization methods `json` and `from_json`.
 
     Message `id_`s are integer values 0, 1, 2... representing order of
-    messages.
+    messages. The optional `key` is generated by the sender and
+    identifies a message across peers (used to deduplicate repeated
+    deliveries). File contents are not embedded into messages but
+    referenced as `attachments`.
+
+    Since potentially large numbers of messages are held in memory,
+    instances use a compact representation: attributes are slotted,
+    `last_modified` is stored as integer (see `to_timestamp`), and
+    `status` as index of the `MessageStatus`-member. Both are exposed
+    as `datetime` and `MessageStatus` via properties.
     """
 
-    id_: Optional[int] = None
-    body: Optional[str] = None
-    status: MessageStatus = MessageStatus.DRAFT
-    is_mine: bool = True
-    last_modified: datetime = field(default_factory=datetime.now)
+    __slots__ = (
+        "id_",
+        "body",
+        "_status",
+        "is_mine",
+        "_last_modified",
+        "key",
+        "attachments",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        id_: Optional[int] = None,
+        body: Optional[str] = None,
+        status: MessageStatus = MessageStatus.DRAFT,
+        is_mine: bool = True,
+        last_modified: Optional[datetime] = None,
+        key: Optional[str] = None,
+        attachments: Optional[list[Attachment]] = None,
+    ) -> None:
+        self.id_ = id_
+        self.body = body
+        self._status = _STATUS_INDEX[status]
+        self.is_mine = is_mine
+        self._last_modified = (
+            now() if last_modified is None else to_timestamp(last_modified)
+        )
+        self.key = key
+        self.attachments = attachments
+
+    @property
+    def status(self) -> MessageStatus:
+        """Returns message status."""
+        return _STATUS[self._status]
+
+    @status.setter
+    def status(self, status: MessageStatus) -> None:
+        self._status = _STATUS_INDEX[status]
+
+    @property
+    def last_modified(self) -> datetime:
+        """Returns time of last modification."""
+        return from_timestamp(self._last_modified)
+
+    @last_modified.setter
+    def last_modified(self, last_modified: datetime) -> None:
+        self._last_modified = to_timestamp(last_modified)
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, key) == getattr(other, key)
+            for key in self.__slots__
+            if key != "__weakref__"
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Message(id_={self.id_!r}, body={self.body!r}, "
+            + f"status={self.status}, is_mine={self.is_mine!r}, "
+            + f"last_modified={self.last_modified!r}, key={self.key!r}, "
+            + f"attachments={self.attachments!r})"
+        )
 
     @property
     def json(self) -> dict:
         """Returns a serializable representation of this object."""
-        return {
+        json_ = {
             "id": self.id_,
             "body": self.body,
             "status": self.status.value,
             "isMine": self.is_mine,
             "lastModified": self.last_modified.isoformat(),
         }
+        if self.key is not None:
+            json_["key"] = self.key
+        if self.attachments:
+            json_["attachments"] = [a.json for a in self.attachments]
+        return json_
 
     @staticmethod
     def from_json(json_: dict) -> "Message":
@@ -101,6 +238,8 @@ class Message:
             ("status", "status"),
             ("is_mine", "isMine"),
             ("last_modified", "lastModified"),
+            ("key", "key"),
+            ("attachments", "attachments"),
         ):
             if jsonkey in json_:
                 kwargs[key] = json_[jsonkey]
@@ -110,27 +249,96 @@ class Message:
             kwargs["last_modified"] = datetime.fromisoformat(
                 kwargs["last_modified"]
             )
+        if kwargs.get("attachments") is not None:
+            kwargs["attachments"] = [
+                Attachment.from_json(a) for a in kwargs["attachments"]
+            ]
         return Message(**kwargs)
 
 
-@dataclass
 class Conversation:
     """
     Record class for conversation metadata and content. Implements
     (de-)serialization methods `json` and `from_json`.
 
     The keys in `messages` are `Message.id_`s.
+
+    Similar to `Message`, attributes are slotted and `last_modified` is
+    stored as integer. `peer` is interned, since the same address is
+    typically shared by multiple conversations.
     """
 
-    peer: str
-    name: str
-    id_: str = field(default_factory=lambda: str(uuid4()))
-    path: Optional[Path] = None  # points to directory
-    length: int = 0
-    last_modified: datetime = field(default_factory=datetime.now)
-    unread_messages: bool = True
-    queued_messages: list[int] = field(default_factory=list)
-    messages: dict[int, Message] = field(default_factory=dict)
+    __slots__ = (
+        "_peer",
+        "name",
+        "id_",
+        "path",
+        "length",
+        "_last_modified",
+        "unread_messages",
+        "queued_messages",
+        "messages",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        peer: str,
+        name: str,
+        id_: Optional[str] = None,
+        path: Optional[Path] = None,  # points to directory
+        length: int = 0,
+        last_modified: Optional[datetime] = None,
+        unread_messages: bool = True,
+        queued_messages: Optional[list[int]] = None,
+        messages: Optional[dict[int, Message]] = None,
+    ) -> None:
+        self.peer = peer
+        self.name = name
+        self.id_ = str(uuid4()) if id_ is None else id_
+        self.path = path
+        self.length = length
+        self._last_modified = (
+            now() if last_modified is None else to_timestamp(last_modified)
+        )
+        self.unread_messages = unread_messages
+        self.queued_messages = (
+            [] if queued_messages is None else queued_messages
+        )
+        self.messages = {} if messages is None else messages
+
+    @property
+    def peer(self) -> str:
+        """Returns peer address."""
+        return self._peer
+
+    @peer.setter
+    def peer(self, peer: str) -> None:
+        self._peer = None if peer is None else sys.intern(peer)
+
+    @property
+    def last_modified(self) -> datetime:
+        """Returns time of last modification."""
+        return from_timestamp(self._last_modified)
+
+    @last_modified.setter
+    def last_modified(self, last_modified: datetime) -> None:
+        self._last_modified = to_timestamp(last_modified)
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, key) == getattr(other, key)
+            for key in self.__slots__
+            if key != "__weakref__"
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Conversation(peer={self.peer!r}, name={self.name!r}, "
+            + f"id_={self.id_!r}, length={self.length!r})"
+        )
 
     @property
     def json(self) -> dict:
@@ -154,7 +362,7 @@ class Conversation:
             id_=json_["id"],
             peer=json_["peer"],
             name=json_["name"],
-            path=(None if "path" not in json_ else Path(json_["path"])),
+            path=(Path(json_["path"]) if json_.get("path") else None),
             length=json_["length"],
             last_modified=datetime.fromisoformat(json_["lastModified"]),
             unread_messages=json_["unreadMessages"],
@@ -0,0 +1,296 @@
+"""Definitions for outbound communication with peers."""
+
+from typing import Optional
+from threading import Lock
+from time import monotonic
+from datetime import datetime
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PeerUnavailable(requests.exceptions.ConnectionError):
+    """Raised for requests to peers that are known to be unreachable."""
+
+
+@dataclass
+class PeerHealth:
+    """
+    Record class for the health of a peer. Tracks a smoothed round-trip
+    time (and its variation), consecutive failures, and the state of
+    the peer's circuit breaker. Implements (de-)serialization method
+    `json`.
+    """
+
+    srtt: Optional[float] = None
+    rttvar: Optional[float] = None
+    failures: int = 0
+    last_seen: Optional[datetime] = None
+    last_failure: Optional[datetime] = None
+    open_until: Optional[float] = None
+    probing: bool = False
+
+    @property
+    def state(self) -> str:
+        """
+        Returns state of the circuit breaker ('closed', 'open', or
+        'half-open').
+        """
+        if self.open_until is None:
+            return "closed"
+        if monotonic() < self.open_until:
+            return "open"
+        return "half-open"
+
+    def sample(self, rtt: float) -> None:
+        """Adds round-trip time-sample (estimator as in RFC 6298)."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "state": self.state,
+            "rtt": self.srtt,
+            "failures": self.failures,
+            "lastSeen": (
+                self.last_seen.isoformat() if self.last_seen else None
+            ),
+            "lastFailure": (
+                self.last_failure.isoformat() if self.last_failure else None
+            ),
+        }
+
+
+class PeerClient:
+    """
+    HTTP-client for outbound requests to peers.
+
+    A `requests.Session` with a dedicated connection pool is kept per
+    peer (scheme and network location) such that connections are kept
+    alive and reused across requests; hence, repeated requests to the
+    same peer can be sent over an already established connection (as
+    long as the pooled connection has not been closed).
+    Sessions of the least recently contacted peers are closed once
+    more than `max_peers` peers have been contacted.
+
+    The API-features advertised by a peer (see `features`) and the
+    peer's health (see `PeerHealth`) are kept along with its session.
+    Requests without explicit timeout use an adaptive timeout based on
+    the peer's round-trip time (bounded by `min_timeout` and
+    `max_timeout`). After `failure_threshold` consecutive failed
+    requests, the peer's circuit breaker opens: further requests fail
+    immediately with `PeerUnavailable` for `reset_timeout` seconds,
+    after which a single request is let through as probe. The circuit
+    breaker is closed by a successful request or `reset`.
+
+    Keyword arguments:
+    pool_size -- maximum number of idle connections kept per peer
+                 (default 4)
+    max_peers -- maximum number of peers for which sessions are kept
+                 (default 64)
+    min_timeout -- lower bound for adaptive timeouts in seconds
+                   (default 0.5)
+    max_timeout -- upper bound for adaptive timeouts in seconds (also
+                   used for peers without known round-trip time)
+                   (default 2)
+    failure_threshold -- number of consecutive failures that open the
+                         circuit breaker
+                         (default 3)
+    reset_timeout -- time in seconds until an open circuit breaker
+                     admits a probe
+                     (default 30)
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 4,
+        max_peers: int = 64,
+        min_timeout: float = 0.5,
+        max_timeout: float = 2.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+    ) -> None:
+        self.pool_size = pool_size
+        self.max_peers = max_peers
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._sessions: OrderedDict[tuple[str, str], requests.Session] = (
+            OrderedDict()
+        )
+        self._features: dict[tuple[str, str], set[str]] = {}
+        self._health: dict[tuple[str, str], PeerHealth] = {}
+
+    @staticmethod
+    def _key(url: str) -> tuple[str, str]:
+        """Returns key identifying the peer given by `url`."""
+        return tuple(urlsplit(url)[:2])
+
+    def _session(self, url: str) -> requests.Session:
+        """Returns session for the peer given by `url`."""
+        key = self._key(url)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.pool_size
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_peers:
+                key, evicted = self._sessions.popitem(last=False)
+                self._features.pop(key, None)
+                self._health.pop(key, None)
+                evicted.close()
+            return session
+
+    @property
+    def peers(self) -> int:
+        """Returns number of peers with an open session."""
+        with self._lock:
+            return len(self._sessions)
+
+    @property
+    def health(self) -> dict[str, dict]:
+        """Returns serialized `PeerHealth` per peer address."""
+        with self._lock:
+            return {
+                f"{scheme}://{netloc}": health.json
+                for (scheme, netloc), health in self._health.items()
+            }
+
+    def timeout(self, url: str) -> float:
+        """Returns adaptive timeout for the peer given by `url`."""
+        with self._lock:
+            health = self._health.get(self._key(url))
+            if health is None or health.srtt is None:
+                return self.max_timeout
+            return min(
+                self.max_timeout,
+                max(self.min_timeout, health.srtt + 4 * health.rttvar),
+            )
+
+    def reset(self, url: str) -> None:
+        """
+        Closes the circuit breaker of the peer given by `url` (e.g.
+        after the peer reported to be online).
+        """
+        with self._lock:
+            health = self._health.get(self._key(url))
+            if health is not None:
+                health.failures = 0
+                health.open_until = None
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Sends request (see `requests.Session.request` for arguments).
+
+        If no `timeout` is given, the adaptive timeout of the peer is
+        used and the round-trip time is recorded. Raises
+        `PeerUnavailable` if the peer's circuit breaker is open.
+        """
+        session = self._session(url)
+        key = self._key(url)
+        adaptive = kwargs.get("timeout") is None
+        if adaptive:
+            kwargs["timeout"] = self.timeout(url)
+        with self._lock:
+            health = self._health.setdefault(key, PeerHealth())
+            state = health.state
+            if state == "open" or (state == "half-open" and health.probing):
+                raise PeerUnavailable(
+                    f"Peer '{key[0]}://{key[1]}' is unavailable."
+                )
+            health.probing = state == "half-open"
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                health.failures += 1
+                health.last_failure = datetime.now()
+                if health.failures >= self.failure_threshold:
+                    health.open_until = monotonic() + self.reset_timeout
+            raise
+        else:
+            with self._lock:
+                health.failures = 0
+                health.last_seen = datetime.now()
+                health.open_until = None
+                if adaptive:
+                    health.sample(response.elapsed.total_seconds())
+        finally:
+            with self._lock:
+                health.probing = False
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Sends GET-request."""
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        """Sends HEAD-request."""
+        return self.request("HEAD", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Sends POST-request."""
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        """Sends PUT-request."""
+        return self.request("PUT", url, **kwargs)
+
+    def features(self, peer: str, api: str = "0") -> set[str]:
+        """
+        Returns the set of features of API-version `api` that `peer`
+        advertises via `/who` (empty if the peer is not reachable or does
+        not advertise features). Results are cached until `forget` is
+        called for that peer.
+        """
+        key = self._key(peer)
+        with self._lock:
+            if key in self._features:
+                return self._features[key]
+        try:
+            features = set(
+                self.get(peer + "/who").json().get("features", {}).get(api, [])
+            )
+        except (
+            requests.exceptions.RequestException,
+            ValueError,
+            AttributeError,
+            TypeError,
+        ):
+            return set()
+        with self._lock:
+            if key in self._sessions:
+                self._features[key] = features
+        return features
+
+    def forget(self, peer: str) -> None:
+        """Clears cached features of `peer`."""
+        with self._lock:
+            self._features.pop(self._key(peer), None)
+
+    def close(self) -> None:
+        """Closes all sessions."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._features.clear()
+            self._health.clear()
@@ -0,0 +1,345 @@
+"""Full-text search index-definition."""
+
+from typing import Optional, Iterable, Callable
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from collections import Counter
+from array import array
+import os
+import sys
+import re
+import math
+import heapq
+
+from . import codec
+from .models import Message, MessageStatus
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> Counter:
+    """Returns term frequencies of (lower-case) words in `text`."""
+    return Counter(TOKEN_PATTERN.findall((text or "").lower()))
+
+
+@dataclass
+class SearchHit:
+    """
+    Record class for a single result of a `SearchIndex`-query.
+    Implements (de-)serialization method `json`.
+    """
+
+    cid: str
+    mid: int
+    score: float
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {"cid": self.cid, "mid": self.mid, "score": self.score}
+
+
+class _ConversationIndex:
+    """
+    Postings of a single conversation. For every term, the ids of the
+    messages containing it and the corresponding term frequencies are
+    kept as parallel (compact) arrays. Postings of deleted messages are
+    dropped; their ids are kept in `deleted`.
+    """
+
+    __slots__ = ("lock", "mids", "tfs", "indexed", "deleted")
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.mids: dict[str, array] = {}
+        self.tfs: dict[str, array] = {}
+        self.indexed: set[int] = set()
+        self.deleted: set[int] = set()
+
+    def add(self, mid: int, terms: dict[str, int]) -> bool:
+        """
+        Adds message-terms. Returns `False` if the message has already
+        been indexed.
+        """
+        if mid in self.indexed:
+            return False
+        self.indexed.add(mid)
+        for term, tf in terms.items():
+            if term not in self.mids:
+                term = sys.intern(term)
+                self.mids[term] = array("q")
+                self.tfs[term] = array("I")
+            self.mids[term].append(mid)
+            self.tfs[term].append(tf)
+        return True
+
+    def delete(self, mids: set[int]) -> set[int]:
+        """
+        Drops postings of messages `mids` and returns the ids that have
+        not been deleted before.
+        """
+        mids = mids - self.deleted
+        if not mids:
+            return mids
+        self.indexed.update(mids)
+        self.deleted.update(mids)
+        for term in list(self.mids):
+            postings = self.mids[term]
+            if mids.isdisjoint(postings):
+                continue
+            keep = [
+                (mid, tf)
+                for mid, tf in zip(postings, self.tfs[term])
+                if mid not in mids
+            ]
+            if not keep:
+                del self.mids[term], self.tfs[term]
+                continue
+            self.mids[term] = array("q", (mid for mid, _ in keep))
+            self.tfs[term] = array("I", (tf for _, tf in keep))
+        return mids
+
+    def match(self, terms: list[str]) -> tuple[list[int], list[tuple]]:
+        """
+        Returns the numbers of postings per term and a list of tuples
+        of message id and term frequencies for all messages containing
+        every term.
+        """
+        counts = [len(self.mids.get(term, ())) for term in terms]
+        if not all(counts):
+            return counts, []
+        order = sorted(range(len(terms)), key=lambda i: counts[i])
+        first = terms[order[0]]
+        others = {
+            i: dict(zip(self.mids[terms[i]], self.tfs[terms[i]]))
+            for i in order[1:]
+        }
+        matches = []
+        for mid, tf in zip(self.mids[first], self.tfs[first]):
+            if not all(mid in other for other in others.values()):
+                continue
+            tfs = [0] * len(terms)
+            tfs[order[0]] = tf
+            for i, other in others.items():
+                tfs[i] = other[mid]
+            matches.append((mid, tfs))
+        return counts, matches
+
+
+class SearchIndex:
+    """
+    Inverted index over message bodies.
+
+    Postings are held in memory (per conversation and term as arrays of
+    message ids and term frequencies) and persisted per conversation as
+    journal of JSON-lines (one line with term frequencies per message
+    or a deletion-marker) in `directory`. The index of a conversation
+    is loaded (and, where incomplete, rebuilt from the stored messages
+    using the `loader`) lazily on the first query. Conversations are
+    loaded without holding the index-wide lock such that adding
+    messages to other conversations is not blocked; messages added to
+    a conversation while it is being loaded are applied afterwards.
+    Messages are indexed once; later updates of an already indexed
+    message (e.g. status changes) are ignored except for deletions
+    (status 'deleted'), which remove the message from the results.
+
+    Queries match messages containing all words of the query. Hits are
+    ranked by tf-idf and, for equal scores, by recency.
+
+    Keyword arguments:
+    directory -- directory for the journals
+    loader -- callable that returns an iterable of all `Message`s of a
+              conversation that are missing in its index; called with
+              the conversation id and the set of already indexed
+              message ids
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        loader: Callable[[str, set[int]], Iterable[Message]],
+    ) -> None:
+        self._directory = directory
+        self._loader = loader
+        self._lock = Lock()
+        self._conversations: dict[str, _ConversationIndex] = {}
+        self._loading: dict[str, Lock] = {}
+        self._pending: dict[str, list[Message]] = {}
+
+    def _journal(self, cid: str) -> Path:
+        """Returns path to the journal of conversation `cid`."""
+        return self._directory / f"{cid}.jsonl"
+
+    def _append(self, cid: str, records: list[dict]) -> None:
+        """Appends records to the journal of conversation `cid`."""
+        if not records:
+            return
+        self._directory.mkdir(parents=True, exist_ok=True)
+        with open(self._journal(cid), "ab") as f:
+            f.write(b"".join(codec.dumpl(r) for r in records))
+
+    @staticmethod
+    def _apply(index: _ConversationIndex, m: Message) -> Optional[dict]:
+        """
+        Adds message to (or deletes message from) `index` and returns
+        the corresponding journal-record (or `None` if unchanged).
+        """
+        if m.status == MessageStatus.DELETED:
+            if index.delete({m.id_}):
+                return {"id": m.id_, "deleted": True}
+            return None
+        terms = dict(tokenize(m.body))
+        if index.add(m.id_, terms):
+            return {"id": m.id_, "terms": terms}
+        return None
+
+    def _build(self, cid: str) -> _ConversationIndex:
+        """
+        Returns index of conversation `cid` loaded from its journal
+        with missing messages added.
+        """
+        index = _ConversationIndex()
+        journal = self._journal(cid)
+        if journal.is_file():
+            data = journal.read_bytes()
+            processed = 0
+            deleted = set()
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break
+                processed += len(line)
+                try:
+                    record = codec.loads(line)
+                    if record.get("deleted"):
+                        deleted.add(record["id"])
+                    else:
+                        index.add(record["id"], record["terms"])
+                except (codec.JSONDecodeError, KeyError, TypeError):
+                    continue
+            if processed < len(data):
+                # drop incomplete line of an interrupted write
+                with open(journal, "r+b") as f:
+                    f.truncate(processed)
+            index.delete(deleted)
+        records = []
+        for m in self._loader(cid, set(index.indexed)):
+            record = self._apply(index, m)
+            if record is not None:
+                records.append(record)
+        self._append(cid, records)
+        return index
+
+    def _index(self, cid: str) -> _ConversationIndex:
+        """Returns (and loads if needed) the index of `cid`."""
+        with self._lock:
+            index = self._conversations.get(cid)
+            if index is not None:
+                return index
+            loading = self._loading.setdefault(cid, Lock())
+        with loading:
+            with self._lock:
+                index = self._conversations.get(cid)
+                if index is not None:
+                    return index
+            index = self._build(cid)
+            with self._lock:
+                pending = self._pending.pop(cid, [])
+                if self._loading.get(cid) is loading:
+                    # not removed in the meantime
+                    del self._loading[cid]
+                    self._conversations[cid] = index
+        if pending:
+            with index.lock:
+                records = [self._apply(index, m) for m in pending]
+                self._append(cid, [r for r in records if r is not None])
+        return index
+
+    def add(self, cid: str, m: Message) -> None:
+        """
+        Adds `Message` of conversation `cid` to the index (or removes
+        it from the results if it has been deleted).
+        """
+        with self._lock:
+            index = self._conversations.get(cid)
+            if index is None:
+                if cid in self._loading:
+                    self._pending.setdefault(cid, []).append(m)
+                # otherwise not loaded yet; missing messages are picked
+                # up when the conversation is loaded
+                return
+        with index.lock:
+            record = self._apply(index, m)
+            if record is not None:
+                self._append(cid, [record])
+
+    def remove(self, cid: str) -> None:
+        """Removes conversation `cid` from the index."""
+        with self._lock:
+            index = self._conversations.pop(cid, None)
+            self._loading.pop(cid, None)
+            self._pending.pop(cid, None)
+        if index is not None:
+            index.lock.acquire()
+        try:
+            os.remove(self._journal(cid))
+        except FileNotFoundError:
+            pass
+        finally:
+            if index is not None:
+                index.lock.release()
+
+    def search(
+        self,
+        query: str,
+        cids: Iterable[str],
+        offset: int = 0,
+        limit: int = 20,
+    ) -> tuple[int, list[SearchHit]]:
+        """
+        Returns total number of hits and the requested page of
+        `SearchHit`s for `query`.
+
+        Keyword arguments:
+        query -- search query
+        cids -- ids of all conversations that should be searched
+        offset -- number of hits to skip
+                  (default 0)
+        limit -- maximum number of returned hits
+                 (default 20)
+        """
+        terms = list(tokenize(query))
+        indexes = {cid: self._index(cid) for cid in set(cids)}
+        if not terms:
+            return 0, []
+        documents = 0
+        frequencies = [0] * len(terms)
+        candidates = []
+        for cid, index in indexes.items():
+            with index.lock:
+                documents += len(index.indexed - index.deleted)
+                counts, matches = index.match(terms)
+            for i, count in enumerate(counts):
+                frequencies[i] += count
+            candidates.extend((cid, mid, tfs) for mid, tfs in matches)
+        if not candidates:
+            return 0, []
+        idf = [math.log(1 + documents / df) for df in frequencies]
+        page = heapq.nlargest(
+            offset + limit,
+            (
+                (
+                    sum(
+                        (1 + math.log(tf)) * w for tf, w in zip(tfs, idf)
+                    ),
+                    mid,
+                    cid,
+                )
+                for cid, mid, tfs in candidates
+            ),
+        )[offset:]
+        return len(candidates), [
+            SearchHit(cid, mid, round(score, 6))
+            for score, mid, cid in page
+        ]
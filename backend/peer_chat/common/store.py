@@ -1,13 +1,95 @@
 """Message store-definition."""
 
-from typing import Optional
+from typing import Optional, Iterator, Iterable, ContextManager
 import sys
 from pathlib import Path
-from threading import RLock, Lock
-import json
-from shutil import rmtree
+from threading import RLock, Lock, Event, Thread
+from collections import OrderedDict
+from weakref import WeakValueDictionary
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from time import perf_counter
 
-from .models import Message, Conversation
+from .models import Message, MessageStatus, Conversation
+from .engine import StorageEngine, DirectoryEngine
+from .catalog import Catalog, CatalogEntry
+from .search import SearchIndex, SearchHit
+from .changes import ChangeJournal
+from .dedup import DedupIndex
+from .attachments import AttachmentStore
+
+
+@dataclass
+class CacheStats:
+    """Record class for cache statistics."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes_: Optional[int] = None
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        _json = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self.entries,
+        }
+        if self.bytes_ is not None:
+            _json["bytes"] = self.bytes_
+        return _json
+
+
+@dataclass
+class LockStats:
+    """Record class for lock-contention statistics of an operation."""
+
+    acquisitions: int = 0
+    contended: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "waitTotal": self.wait_total,
+            "waitMax": self.wait_max,
+        }
+
+
+class _TimedLock:
+    """
+    Context manager that acquires `lock` and records the waiting time
+    in `stats`.
+    """
+
+    def __init__(self, lock: RLock, stats: LockStats, stats_lock: Lock):
+        self._lock = lock
+        self._stats = stats
+        self._stats_lock = stats_lock
+
+    def __enter__(self) -> None:
+        wait = 0.0
+        contended = not self._lock.acquire(blocking=False)
+        if contended:
+            time0 = perf_counter()
+            self._lock.acquire()
+            wait = perf_counter() - time0
+        with self._stats_lock:
+            self._stats.acquisitions += 1
+            if contended:
+                self._stats.contended += 1
+                self._stats.wait_total += wait
+                self._stats.wait_max = max(self._stats.wait_max, wait)
+
+    def __exit__(self, *args) -> None:
+        self._lock.release()
 
 
 class MessageStore:
@@ -18,35 +100,482 @@ class MessageStore:
     changes made to the underlying data on disk if all changes to the
     data are made through the store.
 
+    The cache can be bounded by the number of messages, their
+    (estimated) size in memory, and the number of conversations. If a
+    limit is exceeded, the least recently used entries are evicted.
+    Entries that are currently locked by another thread or messages
+    that are being sent are skipped; the metadata of evicted
+    conversations is written before they are unloaded. Evicted objects
+    that are still referenced elsewhere (e.g. by a caller that is about
+    to modify and write them) are reused when loaded again such that
+    there is only ever a single instance per conversation and message.
+
+    A persistent `Catalog` of all conversations is maintained alongside
+    the engine's data such that listing conversations does not require
+    scanning the storage. It is rebuilt from the engine's data if
+    missing.
+
+    If a `flush_interval` is given, conversation-metadata is written
+    behind: changes only mark the conversation as dirty and a
+    background thread persists dirty conversations (along with their
+    catalog entries and new deduplication keys) periodically (as well
+    as on `flush` and `close`). Messages are always written
+    immediately. Since a crash may lose up to one interval of metadata
+    changes, conversation lengths are reconciled with the stored
+    messages when loading in this mode.
+
+    Once enabled (by the first snapshot), all writes are recorded in a
+    `ChangeJournal` for incremental backups.
+
+    Access to conversations is synchronized with a fixed number of
+    (reentrant) locks; every conversation is assigned to one of these
+    stripes by its id.
+
+    Message bodies are indexed for full-text search (see `search`) in a
+    `SearchIndex` that is maintained when posting messages.
+
+    File contents referenced by messages are kept in an
+    `AttachmentStore` (see `attachments`).
+
+    New messages carrying a (sender-generated) `Message.key` are
+    registered in a `DedupIndex`; posting a new message with an already
+    registered key returns the id of the existing message instead of
+    writing a duplicate.
+
     Keyword arguments:
     working_dir -- working directory
+    engine -- storage engine used for persistence
+              (default None; uses `DirectoryEngine` for `working_dir`)
+    max_messages -- maximum number of cached messages
+                    (default None; unbounded)
+    max_bytes -- maximum (estimated) size of cached messages in bytes
+                 (default None; unbounded)
+    max_conversations -- maximum number of cached conversations
+                         (default None; unbounded)
+    flush_interval -- interval in seconds for writing conversation-
+                      metadata in the background
+                      (default None; write-through)
+    lock_stripes -- number of locks that conversations are distributed
+                    over
+                    (default 64)
+    lock_instrumentation -- if `True`, waiting times for acquiring
+                            locks are recorded per operation (see
+                            `lock_stats`)
+                            (default False)
+    dedup_keys -- number of message keys that are retained per
+                  conversation for deduplication
+                  (default 1000)
     """
 
-    def __init__(self, working_dir: Path) -> None:
+    # estimate for the memory footprint of a cached message in addition
+    # to its body (including the cache's bookkeeping; measured with
+    # benchmarks/memory.py)
+    MESSAGE_OVERHEAD = 384
+
+    def __init__(
+        self,
+        working_dir: Path,
+        engine: Optional[StorageEngine] = None,
+        max_messages: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_conversations: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        lock_stripes: int = 64,
+        lock_instrumentation: bool = False,
+        dedup_keys: int = 1000,
+    ) -> None:
         self._working_dir = working_dir
         working_dir.mkdir(parents=True, exist_ok=True)
+        self._engine = engine or DirectoryEngine(working_dir)
         self._cache: dict[str, Conversation] = {}
-        self._master_lock = Lock()
-        self._cache_lock: dict[str, RLock] = {}
+        self._locks = [RLock() for _ in range(lock_stripes)]
+        self._lock_stats: Optional[dict[str, LockStats]] = (
+            {} if lock_instrumentation else None
+        )
+        self._lock_stats_lock = Lock()
+
+        self._max_messages = max_messages
+        self._max_bytes = max_bytes
+        self._max_conversations = max_conversations
+        self._lru_lock = Lock()
+        self._conversation_lru: OrderedDict[str, None] = OrderedDict()
+        self._message_lru: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self._conversation_stats = CacheStats()
+        self._message_stats = CacheStats(bytes_=0)
+        # evicted objects that may still be referenced by callers
+        self._evicted_conversations: WeakValueDictionary[
+            str, Conversation
+        ] = WeakValueDictionary()
+        self._evicted_messages: WeakValueDictionary[
+            tuple[str, int], Message
+        ] = WeakValueDictionary()
+
+        self._catalog = Catalog(working_dir / ".catalog")
+        if not self._catalog.exists:
+            self.rebuild_catalog()
+
+        self._changes = ChangeJournal(
+            working_dir / ".changes", sync=self._engine.fsync == "always"
+        )
+        self._search = SearchIndex(
+            working_dir / ".search", self._load_unindexed
+        )
+        self._dedup = DedupIndex(
+            working_dir / ".dedup",
+            dedup_keys,
+            deferred=flush_interval is not None,
+        )
+        self._attachments = AttachmentStore(working_dir / ".attachments")
+
+        self._flush_interval = flush_interval
+        self._dirty: set[str] = set()
+        self._dirty_lock = Lock()
+        self._flusher = None
+        self._flusher_stop = Event()
+        if flush_interval is not None:
+            self._flusher = Thread(target=self._run_flusher, daemon=True)
+            self._flusher.start()
+
+    @property
+    def engine(self) -> StorageEngine:
+        """Returns the store's `StorageEngine`."""
+        return self._engine
+
+    @property
+    def changes(self) -> ChangeJournal:
+        """Returns the store's `ChangeJournal`."""
+        return self._changes
+
+    @property
+    def attachments(self) -> AttachmentStore:
+        """
+        Returns the store's `AttachmentStore` (contents referenced by
+        `Message.attachments`).
+        """
+        return self._attachments
+
+    @property
+    def lock_stats(self) -> Optional[dict]:
+        """
+        Returns lock-contention statistics per operation (or `None` if
+        instrumentation is disabled).
+        """
+        if self._lock_stats is None:
+            return None
+        with self._lock_stats_lock:
+            return {
+                operation: stats.json
+                for operation, stats in self._lock_stats.items()
+            }
+
+    @property
+    def cache_stats(self) -> dict:
+        """Returns cache statistics for conversations and messages."""
+        with self._lru_lock:
+            self._conversation_stats.entries = len(self._conversation_lru)
+            self._message_stats.entries = len(self._message_lru)
+            return {
+                "conversations": self._conversation_stats.json,
+                "messages": self._message_stats.json,
+            }
+
+    def _message_size(self, m: Message) -> int:
+        """Returns estimated memory footprint of message."""
+        return self.MESSAGE_OVERHEAD + len(m.body or "")
+
+    def _cache_conversation(self, c: Conversation) -> None:
+        """Registers (or refreshes) conversation in LRU-cache."""
+        with self._lru_lock:
+            self._evicted_conversations.pop(c.id_, None)
+            self._conversation_lru[c.id_] = None
+            self._conversation_lru.move_to_end(c.id_)
+        self._evict(c.id_)
 
-    def _check_locks(self, cid: str) -> RLock:
+    def _cache_message(self, cid: str, m: Message) -> None:
+        """Registers (or refreshes) message in LRU-cache."""
+        with self._lru_lock:
+            key = (cid, m.id_)
+            self._evicted_messages.pop(key, None)
+            self._message_stats.bytes_ -= self._message_lru.get(key, 0)
+            self._message_lru[key] = self._message_size(m)
+            self._message_lru.move_to_end(key)
+            self._message_stats.bytes_ += self._message_lru[key]
+        self._evict(cid)
+
+    def _uncache_conversation(self, c: Conversation) -> None:
+        """Removes conversation and its messages from LRU-cache."""
+        with self._lru_lock:
+            self._conversation_lru.pop(c.id_, None)
+            for mid in c.messages:
+                self._message_stats.bytes_ -= self._message_lru.pop(
+                    (c.id_, mid), 0
+                )
+            self._evicted_conversations.pop(c.id_, None)
+            for key in [
+                key for key in self._evicted_messages.keys() if key[0] == c.id_
+            ]:
+                self._evicted_messages.pop(key, None)
+
+    def _restore_message(
+        self, c: Conversation, mid: int
+    ) -> Optional[Message]:
+        """
+        Returns message `mid` of `c` if it is cached or has been evicted
+        but is still referenced (in which case it is cached again).
+        """
+        m = c.messages.get(mid)
+        if m is not None:
+            return m
+        with self._lru_lock:
+            m = self._evicted_messages.pop((c.id_, mid), None)
+        if m is None:
+            return None
+        c.messages[mid] = m
+        self._cache_message(c.id_, m)
+        return m
+
+    def _messages_exceeded(self) -> bool:
+        """Returns `True` if message-cache exceeds its limits."""
+        return (
+            self._max_messages is not None
+            and len(self._message_lru) > self._max_messages
+        ) or (
+            self._max_bytes is not None
+            and self._message_stats.bytes_ > self._max_bytes
+        )
+
+    def _evict(self, cid: str) -> None:
+        """
+        Evicts least recently used messages and conversations until the
+        cache is within its limits (or no more entries can be evicted).
+
+        Keyword arguments:
+        cid -- id of conversation that is currently in use and should
+               not be unloaded
+        """
+        with self._lru_lock:
+            # messages
+            candidates = len(self._message_lru)
+            while candidates > 0 and self._messages_exceeded():
+                candidates -= 1
+                key, size = next(iter(self._message_lru.items()))
+                self._message_lru.move_to_end(key)
+                lock = self._stripe(key[0])
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    c = self._cache.get(key[0])
+                    m = None if c is None else c.messages.get(key[1])
+                    if m is not None and m.status == MessageStatus.SENDING:
+                        continue
+                    if m is not None:
+                        del c.messages[key[1]]
+                        self._evicted_messages[key] = m
+                    del self._message_lru[key]
+                    self._message_stats.bytes_ -= size
+                    self._message_stats.evictions += 1
+                finally:
+                    lock.release()
+
+        # conversations (metadata is written without holding the
+        # LRU-lock)
+        if self._max_conversations is None:
+            return
+        with self._lru_lock:
+            candidates = len(self._conversation_lru)
+        while candidates > 0:
+            candidates -= 1
+            with self._lru_lock:
+                if len(self._conversation_lru) <= self._max_conversations:
+                    return
+                cid_ = next(iter(self._conversation_lru))
+                self._conversation_lru.move_to_end(cid_)
+            if cid_ == cid:
+                continue
+            lock = self._stripe(cid_)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                c = self._cache.get(cid_)
+                if c is not None:
+                    if any(
+                        m.status == MessageStatus.SENDING
+                        for m in c.messages.values()
+                    ):
+                        continue
+                    self._write_conversation(c)
+                    with self._dirty_lock:
+                        self._dirty.discard(cid_)
+                    del self._cache[cid_]
+                with self._lru_lock:
+                    if c is not None:
+                        self._evicted_conversations[cid_] = c
+                        for mid, m in c.messages.items():
+                            self._message_stats.bytes_ -= (
+                                self._message_lru.pop((cid_, mid), 0)
+                            )
+                            self._evicted_messages[(cid_, mid)] = m
+                        c.messages.clear()
+                    self._conversation_lru.pop(cid_, None)
+                    self._conversation_stats.evictions += 1
+            finally:
+                lock.release()
+
+    def _stripe(self, cid: str) -> RLock:
+        """Returns the lock (stripe) guarding conversation `cid`."""
+        return self._locks[hash(cid) % len(self._locks)]
+
+    def _lock(self, cid: str, operation: str) -> ContextManager:
+        """
+        Returns the lock guarding conversation `cid` for use as context
+        manager. If lock-instrumentation is enabled, waiting times are
+        recorded for `operation`.
         """
-        Checks for existing lock for conversation `cid` in _cache_lock-
-        register and creates new if it does not exist.
+        if self._lock_stats is None:
+            return self._stripe(cid)
+        with self._lock_stats_lock:
+            if operation not in self._lock_stats:
+                self._lock_stats[operation] = LockStats()
+            stats = self._lock_stats[operation]
+        return _TimedLock(self._stripe(cid), stats, self._lock_stats_lock)
+
+    def rebuild_catalog(
+        self, entries: Optional[Iterable[CatalogEntry]] = None
+    ) -> None:
         """
-        if cid not in self._cache_lock:
-            with self._master_lock:
-                if cid not in self._cache_lock:
-                    self._cache_lock[cid] = RLock()
-        return self._cache_lock[cid]
+        Rebuilds the conversation-catalog from the engine's data (or
+        from the given `entries`).
+        """
+        if entries is not None:
+            self._catalog.rebuild(entries)
+            return
+        entries = []
+        for cid in self._engine.list_conversations():
+            try:
+                entries.append(
+                    CatalogEntry.from_conversation(
+                        Conversation.from_json(
+                            self._engine.read_conversation(cid)
+                        )
+                    )
+                )
+            except (
+                Exception  # pylint: disable=broad-exception-caught
+            ) as exc_info:
+                print(
+                    f"ERROR: Unable to load conversation '{cid}': {exc_info}",
+                    file=sys.stderr,
+                )
+        self._catalog.rebuild(entries)
 
     def list_conversations(self) -> list[str]:
-        """Returns a (heuristic) list of conversation-ids."""
+        """Returns a list of conversation-ids."""
+        return self._catalog.ids()
+
+    def list_queued(self, peer: Optional[str] = None) -> list[str]:
+        """
+        Returns ids of conversations with queued messages (only those
+        with `peer` if given) based on the catalog's index.
+        """
+        return self._catalog.queued(peer)
+
+    def list_catalog(self) -> list[CatalogEntry]:
+        """
+        Returns a list of `CatalogEntry`s (summaries of all
+        conversations).
+        """
+        return self._catalog.entries()
+
+    def _load_unindexed(
+        self, cid: str, indexed: set[int]
+    ) -> Iterator[Message]:
+        """
+        Yields messages of conversation `cid` that are not contained in
+        `indexed` (directly from the engine, bypassing the cache).
+        """
+        try:
+            mids = [
+                mid
+                for mid in self._engine.list_messages(cid)
+                if mid not in indexed
+            ]
+        except (
+            Exception  # pylint: disable=broad-exception-caught
+        ) as exc_info:
+            print(
+                f"ERROR: Unable to list messages of '{cid}': {exc_info}",
+                file=sys.stderr,
+            )
+            return
+        for i in range(0, len(mids), 1000):
+            try:
+                messages = self._engine.read_messages(cid, mids[i : i + 1000])
+            except (
+                Exception  # pylint: disable=broad-exception-caught
+            ) as exc_info:
+                print(
+                    f"ERROR: Unable to index messages of '{cid}': "
+                    + f"{exc_info}",
+                    file=sys.stderr,
+                )
+                continue
+            for json_ in messages.values():
+                yield Message.from_json(json_)
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = 20
+    ) -> tuple[int, list[SearchHit]]:
+        """
+        Searches message bodies of all conversations and returns the
+        total number of hits and the requested page of `SearchHit`s
+        (ordered by relevance).
+
+        Keyword arguments:
+        query -- search query; hits contain all of its words
+        offset -- number of hits to skip
+                  (default 0)
+        limit -- maximum number of returned hits
+                 (default 20)
+        """
+        return self._search.search(
+            query, self._catalog.ids(), offset=offset, limit=limit
+        )
+
+    def load_conversations(
+        self, limit: int = 50, cursor: Optional[str] = None
+    ) -> tuple[list[Conversation], Optional[str]]:
+        """
+        Loads a page of conversations ordered by their last modification
+        (most recent first) and returns these along with the cursor for
+        the next page (or `None` if there are no more conversations).
+
+        Keyword arguments:
+        limit -- maximum number of conversations
+                 (default 50)
+        cursor -- cursor returned for the previous page
+                  (default None; start with most recent)
+        """
+        if cursor is not None:
+            last_modified, _, cid = cursor.partition("/")
+            try:
+                cursor = (datetime.fromisoformat(last_modified), cid)
+            except ValueError:
+                print(
+                    f"ERROR: Bad conversation-cursor '{cursor}'.",
+                    file=sys.stderr,
+                )
+                return [], None
+        entries, next_cursor = self._catalog.page(limit, cursor)
         conversations = []
-        for c in self._working_dir.glob("*"):
-            if c.is_dir() and (c / "index.json").is_file():
-                conversations.append(c.name)
-        return conversations
+        for entry in entries:
+            c = self.load_conversation(entry.id_)
+            if c is not None:
+                conversations.append(c)
+        return conversations, (
+            None
+            if next_cursor is None
+            else f"{next_cursor[0].isoformat()}/{next_cursor[1]}"
+        )
 
     def load_conversation(self, cid: str) -> Optional[Conversation]:
         """
@@ -56,15 +585,24 @@ class MessageStore:
         Keyword arguments:
         cid -- conversation id to be loaded
         """
-        with self._check_locks(cid):
+        with self._lock(cid, "load_conversation"):
             if cid in self._cache:
+                with self._lru_lock:
+                    self._conversation_stats.hits += 1
+                    self._conversation_lru.move_to_end(cid)
                 return self._cache[cid]
 
-            index = self._working_dir / cid / "index.json"
+            with self._lru_lock:
+                self._conversation_stats.misses += 1
+                c = self._evicted_conversations.pop(cid, None)
+            if c is not None:
+                self._cache[cid] = c
+                self._cache_conversation(c)
+                return c
             try:
-                self._cache[cid] = Conversation.from_json(
-                    json.loads(index.read_text(encoding="utf-8"))
-                    | {"path": index.parent}
+                c = Conversation.from_json(
+                    self._engine.read_conversation(cid)
+                    | {"path": self._engine.conversation_path(cid)}
                 )
             except (
                 Exception  # pylint: disable=broad-exception-caught
@@ -74,7 +612,14 @@ class MessageStore:
                     file=sys.stderr,
                 )
                 return None
-            return self._cache[cid]
+            if self._flush_interval is not None:
+                # recover from lost metadata-updates
+                mids = self._engine.list_messages(cid)
+                if mids and mids[-1] >= c.length:
+                    c.length = mids[-1] + 1
+            self._cache[cid] = c
+            self._cache_conversation(c)
+            return c
 
     def load_message(self, cid: str, mid: int) -> Optional[Message]:
         """
@@ -85,7 +630,7 @@ class MessageStore:
         cid -- conversation id
         mid -- message id
         """
-        with self._check_locks(cid):
+        with self._lock(cid, "load_message"):
             c = self.load_conversation(cid)
             if c is None:
                 return None
@@ -96,13 +641,18 @@ class MessageStore:
                 mid = c.length + mid
 
             if mid in c.messages:
+                with self._lru_lock:
+                    self._message_stats.hits += 1
+                    if (cid, mid) in self._message_lru:
+                        self._message_lru.move_to_end((cid, mid))
                 return c.messages[mid]
+            with self._lru_lock:
+                self._message_stats.misses += 1
+            m = self._restore_message(c, mid)
+            if m is not None:
+                return m
             try:
-                c.messages[mid] = Message.from_json(
-                    json.loads(
-                        (c.path / f"{mid}.json").read_text(encoding="utf-8")
-                    )
-                )
+                m = Message.from_json(self._engine.read_message(cid, mid))
             except (
                 Exception  # pylint: disable=broad-exception-caught
             ) as exc_info:
@@ -111,11 +661,71 @@ class MessageStore:
                     file=sys.stderr,
                 )
                 return None
-            return c.messages[mid]
+            c.messages[mid] = m
+            self._cache_message(cid, m)
+            return m
+
+    def load_messages(
+        self, cid: str, start: int = 0, stop: Optional[int] = None
+    ) -> Optional[list[Message]]:
+        """
+        Loads a range of messages into memory and returns them as list
+        (or `None` in case of error). Similar to slicing a list, `start`
+        and `stop` may be negative (indicating positions "from back")
+        and are truncated to the conversation's length. Messages that
+        are not cached are read from disk in bulk; messages that cannot
+        be loaded are omitted.
+
+        Keyword arguments:
+        cid -- conversation id
+        start -- first message id
+                 (default 0)
+        stop -- message id after the last message
+                (default None; up to the last message)
+        """
+        with self._lock(cid, "load_messages"):
+            c = self.load_conversation(cid)
+            if c is None:
+                return None
+
+            mids = range(*slice(start, stop).indices(c.length))
+            missing = [
+                mid for mid in mids if self._restore_message(c, mid) is None
+            ]
+            with self._lru_lock:
+                self._message_stats.hits += len(mids) - len(missing)
+                self._message_stats.misses += len(missing)
+            loaded = []
+            if missing:
+                try:
+                    loaded = [
+                        Message.from_json(json_)
+                        for json_ in self._engine.read_messages(
+                            cid, missing
+                        ).values()
+                    ]
+                except (
+                    Exception  # pylint: disable=broad-exception-caught
+                ) as exc_info:
+                    print(
+                        f"ERROR: Unable to load messages '{cid}.{start}:"
+                        + f"{stop}': {exc_info}",
+                        file=sys.stderr,
+                    )
+            for m in loaded:
+                c.messages[m.id_] = m
+            messages = [c.messages[mid] for mid in mids if mid in c.messages]
+            with self._lru_lock:
+                for m in messages:
+                    if (cid, m.id_) in self._message_lru:
+                        self._message_lru.move_to_end((cid, m.id_))
+            for m in loaded:
+                self._cache_message(cid, m)
+            return messages
 
     def set_conversation_path(self, c: Conversation) -> None:
         """Sets a `Conversation`'s index-path."""
-        c.path = self._working_dir / c.id_
+        c.path = self._engine.conversation_path(c.id_)
 
     def create_conversation(self, c: Conversation) -> None:
         """
@@ -124,10 +734,10 @@ class MessageStore:
         Keyword arguments:
         c -- conversation object
         """
-        with self._check_locks(c.id_):
-            c.path.mkdir(parents=True, exist_ok=True)
+        with self._lock(c.id_, "create_conversation"):
             self._cache[c.id_] = c
-            self.write(c.id_)
+            self._cache_conversation(c)
+            self._write_conversation(c)
 
     def set_conversation_read(self, cid: str) -> Optional[Conversation]:
         """
@@ -140,7 +750,7 @@ class MessageStore:
         if c is None:
             return None
 
-        with self._check_locks(c.id_):
+        with self._lock(c.id_, "set_conversation_read"):
             c.unread_messages = False
             self.write(c.id_)
             return c
@@ -152,21 +762,38 @@ class MessageStore:
         Keyword arguments:
         c -- conversation object
         """
-        with self._check_locks(c.id_):
-            del self._cache[c.id_]
-            if c.path:
-                rmtree(c.path)
+        with self._lock(c.id_, "delete_conversation"):
+            self._cache.pop(c.id_, None)
+            self._uncache_conversation(c)
+            self._catalog.remove(c.id_)
+            self._search.remove(c.id_)
+            self._dedup.remove(c.id_)
+            with self._dirty_lock:
+                self._dirty.discard(c.id_)
+            self._engine.delete_conversation(c.id_)
+            self._changes.record(c.id_, deleted=True)
+
+    def lookup_message_key(self, cid: str, key: str) -> Optional[int]:
+        """
+        Returns id of the message with (sender-generated) `key` in
+        conversation `cid` (or `None` if unknown).
+        """
+        return self._dedup.get(cid, key)
 
     def post_message(self, cid: str, msg: Message) -> int:
         """
         Handle request to post new message in existing conversation.
         Returns `Message.id_`.
 
+        If a new message (without id) carries a `key` that is already
+        known for this conversation, the message is not written again
+        and the id of the existing message is returned.
+
         Keyword arguments:
         cid -- conversation id
         msg -- message object
         """
-        with self._check_locks(cid):
+        with self._lock(cid, "post_message"):
             c = self.load_conversation(cid)
             if c is None:
                 print(
@@ -174,27 +801,273 @@ class MessageStore:
                     file=sys.stderr,
                 )
                 return
-            if msg.id_ is None:
+            new = msg.id_ is None
+            if new and msg.key is not None:
+                mid = self._dedup.get(cid, msg.key)
+                if mid is not None:
+                    return mid
+            if new:
                 msg.id_ = c.length
                 c.length += 1
             c.messages[msg.id_] = msg
-            self.write(c.id_, msg.id_)
-            self.write(c.id_)
+            with self._engine.batch(), self._changes.batch():
+                self.write(c.id_, msg.id_)
+                self.write(c.id_)
+            if new and msg.key is not None:
+                self._dedup.add(cid, msg.key, msg.id_)
+            self._search.add(cid, msg)
+            self._cache_message(cid, msg)
             return msg.id_
 
+    def post_messages(
+        self, cid: str, msgs: list[Message], cache: bool = True
+    ) -> Optional[list[int]]:
+        """
+        Handle request to post multiple messages in existing
+        conversation at once (all messages and the conversation-metadata
+        are written in a single batch). Returns list of `Message.id_`s
+        (or `None` in case of error).
+
+        Messages without id are appended (unless their `key` is already
+        known, see `post_message`); messages with id are written as
+        given (extending the conversation's length if needed).
+
+        Keyword arguments:
+        cid -- conversation id
+        msgs -- message objects
+        cache -- whether to add the messages to the cache
+                 (default True)
+        """
+        with self._lock(cid, "post_messages"):
+            c = self.load_conversation(cid)
+            if c is None:
+                print(
+                    f"ERROR: Unable to post to conversation '{cid}'.",
+                    file=sys.stderr,
+                )
+                return None
+            mids = []
+            keyed = {}
+            written = []
+            for msg in msgs:
+                if msg.id_ is None and msg.key is not None:
+                    mid = (
+                        keyed[msg.key].id_
+                        if msg.key in keyed
+                        else self._dedup.get(cid, msg.key)
+                    )
+                    if mid is not None:
+                        mids.append(mid)
+                        continue
+                    keyed[msg.key] = msg
+                if msg.id_ is None:
+                    msg.id_ = c.length
+                c.length = max(c.length, msg.id_ + 1)
+                mids.append(msg.id_)
+                written.append(msg)
+            with self._engine.batch(), self._changes.batch():
+                for msg in written:
+                    self._engine.write_message(cid, msg.id_, msg.json)
+                    self._changes.record(cid, msg.id_)
+                self.write(c.id_)
+            for key, msg in keyed.items():
+                self._dedup.add(cid, key, msg.id_)
+            for msg in written:
+                self._search.add(cid, msg)
+                if cache:
+                    c.messages[msg.id_] = msg
+                    self._cache_message(cid, msg)
+                elif msg.id_ in c.messages:
+                    # drop outdated cached version
+                    del c.messages[msg.id_]
+                    with self._lru_lock:
+                        self._message_stats.bytes_ -= self._message_lru.pop(
+                            (cid, msg.id_), 0
+                        )
+            return mids
+
+    def _write_conversation(self, c: Conversation) -> None:
+        """Writes conversation-metadata and updates catalog."""
+        self._engine.write_conversation(c.id_, c.json)
+        self._changes.record(c.id_)
+        self._catalog.update(c)
+
+    def _run_flusher(self) -> None:
+        """Service-loop for writing dirty conversations."""
+        while not self._flusher_stop.wait(self._flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes metadata of all conversations with pending changes and
+        compacts the engine's storage if needed (see
+        `StorageEngine.compact`).
+        """
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        for cid in dirty:
+            with self._lock(cid, "flush"):
+                c = self._cache.get(cid)
+                if c is None:
+                    continue
+                try:
+                    self._write_conversation(c)
+                except (
+                    Exception  # pylint: disable=broad-exception-caught
+                ) as exc_info:
+                    print(
+                        f"ERROR: Unable to write conversation '{cid}': "
+                        + f"{exc_info}",
+                        file=sys.stderr,
+                    )
+                    with self._dirty_lock:
+                        self._dirty.add(cid)
+        self._dedup.flush()
+        self._changes.flush()
+        try:
+            self._engine.compact()
+        except (
+            Exception  # pylint: disable=broad-exception-caught
+        ) as exc_info:
+            print(
+                f"ERROR: Unable to compact message storage: {exc_info}",
+                file=sys.stderr,
+            )
+
+    @staticmethod
+    def _archivable(
+        mid: int,
+        m: Optional[Message],
+        length: int,
+        queued: set[int],
+        cutoff: Optional[datetime],
+        keep_last: Optional[int],
+    ) -> bool:
+        """
+        Returns `True` if message `mid` of a conversation with `length`
+        and `queued` messages meets the criteria of `archive` (the age
+        and status are only checked if the message `m` is given).
+        """
+        if mid in queued:
+            return False
+        if m is not None and m.status in (
+            MessageStatus.SENDING,
+            MessageStatus.QUEUED,
+        ):
+            return False
+        if keep_last is not None and mid < length - keep_last:
+            return True
+        if cutoff is None:
+            return False
+        return m is None or m.last_modified < cutoff
+
+    def archive(
+        self,
+        max_age: Optional[timedelta] = None,
+        keep_last: Optional[int] = None,
+    ) -> int:
+        """
+        Moves messages into the engine's archive (see
+        `StorageEngine.archive_messages`) if they are older than
+        `max_age` or are not among the `keep_last` most recent messages
+        of their conversation. Messages that are being sent or are
+        queued are skipped. Returns the number of archived messages.
+
+        Candidates are selected from the conversation-metadata and the
+        stored messages without holding the conversation's lock; the
+        lock is only held for re-checking the candidates against the
+        current state and moving them.
+
+        Keyword arguments:
+        max_age -- minimum age of archived messages
+                   (default None; no age-criterion)
+        keep_last -- number of most recent messages per conversation
+                     that are kept
+                     (default None; no count-criterion)
+        """
+        if max_age is None and keep_last is None:
+            return 0
+        cutoff = None if max_age is None else datetime.now() - max_age
+        archived = 0
+        for cid in self._catalog.ids():
+            mids = self._engine.archivable_messages(cid)
+            if not mids:
+                continue
+            c = self.load_conversation(cid)
+            if c is None:
+                continue
+            with self._lock(cid, "archive"):
+                length = c.length
+                queued = set(c.queued_messages or [])
+            # select candidates without holding the lock (first based on
+            # the metadata, then on the stored messages)
+            criteria = (length, queued, cutoff, keep_last)
+            candidates = []
+            mids = [
+                mid for mid in mids if self._archivable(mid, None, *criteria)
+            ]
+            for i in range(0, len(mids), 1000):
+                for mid, json_ in self._engine.read_messages(
+                    cid, mids[i : i + 1000]
+                ).items():
+                    m = Message.from_json(json_)
+                    if self._archivable(mid, m, *criteria):
+                        candidates.append(mid)
+            mids = candidates
+            if not mids:
+                continue
+            with self._lock(cid, "archive"):
+                # skip messages that have been changed in the meantime
+                criteria = (
+                    length,
+                    set(c.queued_messages or []),
+                    cutoff,
+                    keep_last,
+                )
+                mids = [
+                    mid
+                    for mid in mids
+                    if self._archivable(mid, c.messages.get(mid), *criteria)
+                ]
+                try:
+                    archived += self._engine.archive_messages(cid, mids)
+                except (
+                    Exception  # pylint: disable=broad-exception-caught
+                ) as exc_info:
+                    print(
+                        f"ERROR: Unable to archive messages of '{cid}': "
+                        + f"{exc_info}",
+                        file=sys.stderr,
+                    )
+        return archived
+
+    def close(self) -> None:
+        """
+        Writes pending changes, stops background tasks, and releases
+        resources of the engine.
+        """
+        if self._flusher is not None:
+            self._flusher_stop.set()
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self._changes.close()
+        self._engine.close()
+
     def write(self, cid: str, mid: Optional[int] = None) -> None:
         """
         Write `Conversation` metadata or `Message` from cache to disk.
 
         If `mid` is not `None`, the referenced `Message` will be written
-        instead of the Conversation-metadata
+        instead of the Conversation-metadata. In write-behind mode,
+        conversation-metadata is only marked for the next flush.
 
         Keyword arguments:
         cid -- conversation id
         mid -- message id
                (default None)
         """
-        with self._check_locks(cid):
+        with self._lock(cid, "write"):
             c = self.load_conversation(cid)
             if c is None:
                 print(
@@ -203,16 +1076,18 @@ class MessageStore:
                 )
                 return
             if mid is None:
-                (c.path / "index.json").write_text(
-                    json.dumps(c.json), encoding="utf-8"
-                )
+                if self._flush_interval is None:
+                    self._write_conversation(c)
+                else:
+                    with self._dirty_lock:
+                        self._dirty.add(cid)
                 return
-            if mid not in c.messages:
+            if self._restore_message(c, mid) is None:
                 print(
                     f"ERROR: Unable to write message '{cid}.{mid}'.",
                     file=sys.stderr,
                 )
                 return
-            (c.path / f"{mid}.json").write_text(
-                json.dumps(c.messages[mid].json), encoding="utf-8"
-            )
+            self._engine.write_message(cid, mid, c.messages[mid].json)
+            self._changes.record(cid, mid)
+            self._search.add(cid, c.messages[mid])
@@ -0,0 +1,357 @@
+"""Streaming export and import of message store-contents (NDJSON)."""
+
+from typing import Optional, Iterator, Iterable
+import sys
+import base64
+from dataclasses import dataclass
+
+from . import codec
+from .models import Message, Conversation
+from .store import MessageStore
+
+
+FORMAT = "peerChat-ndjson"
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+ATTACHMENT_CHUNK_SIZE = 65536
+
+
+@dataclass
+class TransferStats:
+    """Record class for the result of an import."""
+
+    conversations: int = 0
+    messages: int = 0
+    skipped_conversations: int = 0
+    skipped_messages: int = 0
+    attachments: int = 0
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "conversations": self.conversations,
+            "messages": self.messages,
+            "skippedConversations": self.skipped_conversations,
+            "skippedMessages": self.skipped_messages,
+            "attachments": self.attachments,
+        }
+
+
+def header_record(**kwargs) -> dict:
+    """Returns header-record (with additional fields `kwargs`)."""
+    return {"type": "header", "format": FORMAT, "version": VERSION} | kwargs
+
+
+def attachment_records(
+    store: MessageStore, id_: str, chunk_size: int = ATTACHMENT_CHUNK_SIZE
+) -> Iterator[dict]:
+    """
+    Generates records containing the (base64-encoded) data of
+    attachment `id_` in chunks of `chunk_size` bytes. Every record
+    carries the `offset` of its chunk; the last record is marked as
+    `final`.
+
+    Raises `FileNotFoundError` if the attachment does not exist.
+    """
+    with store.attachments.open(id_) as f:
+        offset = 0
+        chunk = f.read(chunk_size)
+        while True:
+            next_chunk = f.read(chunk_size) if chunk else b""
+            yield {
+                "type": "attachment",
+                "id": id_,
+                "offset": offset,
+                "data": base64.b64encode(chunk).decode("ascii"),
+                "final": not next_chunk,
+            }
+            if not next_chunk:
+                return
+            offset += len(chunk)
+            chunk = next_chunk
+
+
+class _AttachmentStream:
+    """
+    Binary file-like object reading the data of an attachment from a
+    sequence of chunk-records (see `attachment_records`), starting with
+    the already parsed `record` and pulling subsequent records from
+    `lines`.
+
+    Raises `ValueError` on reading if the sequence of chunks is
+    interrupted; a line that does not continue the sequence is kept as
+    `rejected`.
+    """
+
+    def __init__(self, record: dict, lines: Iterator[bytes]) -> None:
+        if record.get("offset", 0) != 0:
+            raise ValueError(
+                f"Incomplete data of attachment '{record['id']}'."
+            )
+        self._id = record["id"]
+        self._lines = lines
+        self._buffer = b""
+        self._offset = 0
+        self._done = False
+        self.rejected: Optional[bytes] = None
+        self._feed(record)
+
+    def _feed(self, record: dict) -> None:
+        """Appends data of chunk-`record` to the buffer."""
+        data = base64.b64decode(record["data"])
+        self._buffer += data
+        self._offset += len(data)
+        # records without offset contain the complete data (version 1)
+        self._done = record.get("final", "offset" not in record)
+
+    def read(self, size: int = -1) -> bytes:
+        """Returns up to `size` bytes (all remaining if negative)."""
+        while not self._done and (size < 0 or len(self._buffer) < size):
+            line = next(self._lines, None)
+            try:
+                record = None if line is None else codec.loads(line)
+            except codec.JSONDecodeError:
+                record = None
+            if (
+                not isinstance(record, dict)
+                or record.get("type") != "attachment"
+                or record.get("id") != self._id
+                or record.get("offset") != self._offset
+            ):
+                self.rejected = line
+                self._done = True
+                raise ValueError(
+                    f"Incomplete data of attachment '{self._id}'."
+                )
+            self._feed(record)
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def drain(self) -> None:
+        """Consumes the remaining chunk-records."""
+        while self.read(ATTACHMENT_CHUNK_SIZE):
+            pass
+
+
+def conversation_records(
+    store: MessageStore,
+    c: Conversation,
+    mids: Optional[list[int]] = None,
+    chunk_size: int = 1000,
+    attachments: Optional[set[str]] = None,
+) -> Iterator[dict]:
+    """
+    Generates records for a conversation followed by its messages.
+
+    If `attachments` is given, every message is followed by records for
+    the referenced attachments that are not yet contained in that set
+    (which is updated accordingly). Missing attachments are reported as
+    warning.
+
+    Keyword arguments:
+    store -- message store
+    c -- conversation
+    mids -- ids of messages to be included
+            (default None; all messages)
+    chunk_size -- number of messages read at once
+                  (default 1000)
+    attachments -- ids of attachments that have already been exported
+                   (default None; attachment data is not exported)
+    """
+    yield {"type": "conversation", "conversation": c.json}
+    if mids is None:
+        mids = store.engine.list_messages(c.id_)
+    for i in range(0, len(mids), chunk_size):
+        messages = store.engine.read_messages(
+            c.id_, mids[i : i + chunk_size]
+        )
+        for mid in mids[i : i + chunk_size]:
+            if mid not in messages:
+                continue
+            yield {
+                "type": "message",
+                "cid": c.id_,
+                "message": messages[mid],
+            }
+            if attachments is None:
+                continue
+            for a in messages[mid].get("attachments", []):
+                if a["id"] in attachments:
+                    continue
+                attachments.add(a["id"])
+                if not store.attachments.exists(a["id"]):
+                    print(
+                        f"WARNING: Missing attachment '{a['id']}' of "
+                        + f"message '{mid}' in conversation '{c.id_}'.",
+                        file=sys.stderr,
+                    )
+                    continue
+                yield from attachment_records(store, a["id"])
+
+
+def deletion_record(cid: str) -> dict:
+    """Returns record for the deletion of conversation `cid`."""
+    return {"type": "deletion", "cid": cid}
+
+
+def export_ndjson(
+    store: MessageStore,
+    cids: Optional[Iterable[str]] = None,
+    chunk_size: int = 1000,
+    attachments: bool = True,
+) -> Iterator[bytes]:
+    """
+    Generates NDJSON-lines containing a header followed by every
+    conversation and its messages (and the data of the attachments
+    referenced by those messages). Messages are read from the storage
+    engine in chunks (bypassing the cache) such that memory-usage does
+    not depend on the size of the exported history.
+
+    Keyword arguments:
+    store -- message store
+    cids -- ids of conversations to be exported
+            (default None; all conversations)
+    chunk_size -- number of messages read at once
+                  (default 1000)
+    attachments -- whether to include attachment data
+                   (default True)
+    """
+    yield codec.dumpl(header_record())
+    exported = set() if attachments else None
+    for cid in store.list_conversations() if cids is None else cids:
+        c = store.load_conversation(cid)
+        if c is None:
+            continue
+        for record in conversation_records(
+            store, c, chunk_size=chunk_size, attachments=exported
+        ):
+            yield codec.dumpl(record)
+
+
+def import_ndjson(
+    store: MessageStore,
+    lines: Iterable[bytes],
+    batch_size: int = 1000,
+    overwrite: bool = False,
+) -> TransferStats:
+    """
+    Imports NDJSON-lines (as generated by `export_ndjson`) into the
+    store. Messages are written in batches of `batch_size` and are not
+    added to the cache. Conversations that already exist in the store
+    are skipped along with their messages unless `overwrite` is set.
+    Deletion-records remove the conversation from the store and the
+    data of attachment-records is streamed into the store's
+    attachments.
+
+    Raises `ValueError` if the header is missing or unsupported.
+
+    Keyword arguments:
+    store -- message store
+    lines -- iterable of NDJSON-lines
+    batch_size -- number of messages written at once
+                  (default 1000)
+    overwrite -- if `True`, the metadata of existing conversations is
+                 replaced and their messages are written
+                 (default False)
+    """
+    stats = TransferStats()
+    lines = iter(lines)
+    try:
+        header = codec.loads(next(lines))
+    except (StopIteration, codec.JSONDecodeError) as exc_info:
+        raise ValueError("Missing header.") from exc_info
+    if (
+        not isinstance(header, dict)
+        or header.get("format") != FORMAT
+        or header.get("version") not in SUPPORTED_VERSIONS
+    ):
+        raise ValueError(f"Unsupported format '{header}'.")
+
+    known = set(store.list_conversations())
+    current = None
+    batch: list[Message] = []
+    rejected: list[bytes] = []
+
+    def pending_lines():
+        # lines consumed by (but not belonging to) attachment-data
+        for line in lines:
+            yield line
+            while rejected:
+                yield rejected.pop()
+
+    def flush():
+        if batch:
+            store.post_messages(current, batch, cache=False)
+            stats.messages += len(batch)
+            batch.clear()
+
+    for line in pending_lines():
+        if not line.strip():
+            continue
+        try:
+            record = codec.loads(line)
+            if record["type"] == "conversation":
+                flush()
+                c = Conversation.from_json(record["conversation"])
+                if c.id_ in known and not overwrite:
+                    current = None
+                    stats.skipped_conversations += 1
+                    continue
+                existing = (
+                    store.load_conversation(c.id_) if c.id_ in known else None
+                )
+                if existing is None:
+                    store.set_conversation_path(c)
+                    store.create_conversation(c)
+                else:
+                    existing.peer = c.peer
+                    existing.name = c.name
+                    existing.length = c.length
+                    existing.last_modified = c.last_modified
+                    existing.unread_messages = c.unread_messages
+                    existing.queued_messages = c.queued_messages
+                    store.write(c.id_)
+                known.add(c.id_)
+                current = c.id_
+                stats.conversations += 1
+            elif record["type"] == "deletion":
+                flush()
+                current = None
+                if record["cid"] in known:
+                    c = store.load_conversation(record["cid"])
+                    if c is not None:
+                        store.delete_conversation(c)
+                    known.discard(record["cid"])
+            elif record["type"] == "message":
+                if record["cid"] != current:
+                    stats.skipped_messages += 1
+                    continue
+                batch.append(Message.from_json(record["message"]))
+                if len(batch) >= batch_size:
+                    flush()
+            elif record["type"] == "attachment":
+                stream = _AttachmentStream(record, lines)
+                try:
+                    if store.attachments.exists(record["id"]):
+                        stream.drain()
+                        continue
+                    store.attachments.put(stream, expected=record["id"])
+                    stats.attachments += 1
+                finally:
+                    if stream.rejected is not None:
+                        rejected.append(stream.rejected)
+        except (
+            codec.JSONDecodeError,
+            KeyError,
+            TypeError,
+            ValueError,
+        ) as exc_info:
+            print(
+                f"ERROR: Skipping bad record in import: {exc_info}",
+                file=sys.stderr,
+            )
+    flush()
+    return stats
@@ -1,41 +1,148 @@
 """Utility-definitions."""
 
+from typing import Optional
 import sys
+from uuid import uuid4
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import requests
 from flask_socketio import SocketIO
 
 from peer_chat.common import (
+    codec,
     Conversation,
     Message,
     MessageStatus,
     MessageStore,
     User,
+    PeerClient,
 )
 
 
-def inform_peers(store: MessageStore, user: User) -> None:
+JSON_HEADERS = {"Content-Type": "application/json"}
+# shared client for callers that do not provide their own
+DEFAULT_CLIENT = PeerClient()
+
+
+@dataclass
+class InformReport:
+    """
+    Record class for the result of `inform_peers`. Maps every peer to
+    one of the states 'ok', 'failed', or 'timeout' (no response within
+    the deadline). Implements (de-)serialization method `json`.
+    """
+
+    peers: dict[str, str] = field(default_factory=dict)
+
+    def count(self, state: str) -> int:
+        """Returns number of peers in `state`."""
+        return sum(1 for s in self.peers.values() if s == state)
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {
+            "peers": self.peers,
+            "ok": self.count("ok"),
+            "failed": self.count("failed"),
+            "timeout": self.count("timeout"),
+        }
+
+
+def _inform_peer(client: PeerClient, peer: str, body: bytes) -> str:
+    """Posts update-notification to `peer` and returns state."""
+    try:
+        client.post(
+            peer + "/api/v0/update-available",
+            data=body,
+            headers=JSON_HEADERS,
+        ).raise_for_status()
+    except requests.exceptions.RequestException:
+        return "failed"
+    return "ok"
+
+
+def inform_peers(
+    store: MessageStore,
+    user: User,
+    client: Optional[PeerClient] = None,
+    workers: int = 32,
+    deadline: float = 3.0,
+) -> InformReport:
     """
     Send update-notifications to all peers in `store` (using
-    `user.address`).
+    `user.address`) and returns `InformReport`.
+
+    Notifications are sent concurrently by up to `workers` threads.
+    Peers that have not responded after `deadline` seconds are reported
+    as 'timeout'; pending notifications are abandoned in that case.
+
+    Keyword arguments:
+    store -- message store
+    user -- local user
+    client -- client for outbound requests
+              (default None; uses `DEFAULT_CLIENT`)
+    workers -- maximum number of concurrent notifications
+               (default 32)
+    deadline -- time in seconds after which the function returns
+                (default 3)
+    """
+    client = client or DEFAULT_CLIENT
+    peers = sorted({entry.peer for entry in store.list_catalog()})
+    report = InformReport({peer: "timeout" for peer in peers})
+    if not peers:
+        return report
+    body = codec.dumpb({"peer": user.address})
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(peers)))
+    try:
+        futures = {
+            executor.submit(_inform_peer, client, peer, body): peer
+            for peer in peers
+        }
+        done, _ = wait(futures, timeout=deadline)
+        for future in done:
+            report.peers[futures[future]] = future.result()
+    finally:
+        # do not wait for notifications that exceeded the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+    return report
+
+
+def push_attachments(
+    peer: str,
+    m: Message,
+    store: MessageStore,
+    client: Optional[PeerClient] = None,
+) -> None:
     """
-    completed = []
-    for cid in store.list_conversations():
-        c = store.load_conversation(cid)
-        if c is None or c.peer in completed:
+    Transfers (streams) attachments of `m` that are missing on `peer`
+    (requires feature 'attachments' on the peer's side; otherwise, the
+    message is sent without attachment data). Raises an exception if a
+    transfer fails.
+    """
+    if not m.attachments:
+        return
+    client = client or DEFAULT_CLIENT
+    if "attachments" not in client.features(peer):
+        print(
+            f"WARNING: Peer '{peer}' does not support attachments, "
+            + f"sending message '{m.id_}' without attachment data.",
+            file=sys.stderr,
+        )
+        return
+    for a in m.attachments:
+        url = peer + f"/api/v0/attachments/{a.id_}"
+        if client.head(url).status_code == 200:
             continue
-        try:
-            requests.post(
-                c.peer + "/api/v0/update-available",
-                json={"peer": user.address},
-                timeout=2,
-            )
-        except (
-            requests.exceptions.BaseHTTPError,
-            requests.exceptions.ConnectionError,
-        ):
-            pass
-        completed.append(c.peer)
+        with store.attachments.open(a.id_) as f:
+            # allow more time for the peer to acknowledge a large upload
+            client.put(
+                url,
+                data=f,
+                headers={"Content-Type": "application/octet-stream"},
+                timeout=(client.timeout(peer), 30),
+            ).raise_for_status()
 
 
 def send_message(
@@ -44,23 +151,34 @@ def send_message(
     store: MessageStore,
     user: User,
     socket: SocketIO,
+    client: Optional[PeerClient] = None,
 ) -> bool:
     """
     Attempt to send given message. During this process the message
     status is updated accordingly (store and client via socket).
+
+    Requests are sent via `client` (default `DEFAULT_CLIENT`) such that
+    connections to the peer are reused and the message is queued
+    immediately if the peer is known to be unavailable.
     """
+    client = client or DEFAULT_CLIENT
     if m.status == MessageStatus.OK:
         return True
+    if m.key is None:
+        # key is persisted along with the status below such that
+        # retries are recognized as duplicates by the peer
+        m.key = uuid4().hex
     m.status = MessageStatus.SENDING
     socket.emit("update-message", {"cid": c.id_, "message": m.json})
     try:
+        push_attachments(c.peer, m, store, client)
         body = {"cid": c.id_, "msg": m.json, "name": c.name}
         if user.address:
             body["peer"] = user.address
-        requests.post(
+        client.post(
             c.peer + "/api/v0/message",
-            json=body,
-            timeout=2,
+            data=codec.dumpb(body),
+            headers=JSON_HEADERS,
         )
     # pylint: disable=broad-exception-caught
     except Exception as exc_info:
@@ -78,3 +196,72 @@ def send_message(
     store.post_message(c.id_, m)
     socket.emit("update-message", {"cid": c.id_, "message": m.json})
     return True
+
+
+def send_messages(
+    c: Conversation,
+    ms: list[Message],
+    store: MessageStore,
+    user: User,
+    socket: SocketIO,
+    client: Optional[PeerClient] = None,
+) -> bool:
+    """
+    Attempt to send given messages of a conversation in a single
+    request (requires feature 'message-batch' on the peer's side). In
+    contrast to `send_message`, status changes are stored in a single
+    batch and emitted as single 'update-messages'-event; the messages
+    are either all sent or all queued.
+    """
+    client = client or DEFAULT_CLIENT
+    ms = [m for m in ms if m.status != MessageStatus.OK]
+    if not ms:
+        return True
+    for m in ms:
+        if m.key is None:
+            m.key = uuid4().hex
+        m.status = MessageStatus.SENDING
+    socket.emit(
+        "update-messages", {"cid": c.id_, "messages": [m.json for m in ms]}
+    )
+    try:
+        for m in ms:
+            push_attachments(c.peer, m, store, client)
+        body = {"cid": c.id_, "msgs": [m.json for m in ms], "name": c.name}
+        if user.address:
+            body["peer"] = user.address
+        response = client.post(
+            c.peer + "/api/v0/messages",
+            data=codec.dumpb(body),
+            headers=JSON_HEADERS,
+            # allow more time for the peer to store a large batch
+            timeout=(client.timeout(c.peer), 30),
+        )
+        if response.status_code == 404:
+            # peer no longer supports batches
+            client.forget(c.peer)
+        response.raise_for_status()
+    # pylint: disable=broad-exception-caught
+    except Exception as exc_info:
+        print(
+            f"ERROR: Unable to send {len(ms)} message(s) of conversation "
+            + f"'{c.id_}': {exc_info}",
+            file=sys.stderr,
+        )
+        for m in ms:
+            m.status = MessageStatus.QUEUED
+            if m.id_ not in c.queued_messages:
+                c.queued_messages.append(m.id_)
+        store.post_messages(c.id_, ms)
+        socket.emit(
+            "update-messages",
+            {"cid": c.id_, "messages": [m.json for m in ms]},
+        )
+        return False
+    for m in ms:
+        m.status = MessageStatus.OK
+    store.post_messages(c.id_, ms)
+    socket.emit(
+        "update-messages", {"cid": c.id_, "messages": [m.json for m in ms]}
+    )
+    return True
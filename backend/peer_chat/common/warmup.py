@@ -0,0 +1,170 @@
+"""Definitions for warming up the message store-cache at startup."""
+
+from typing import Optional, Callable
+import sys
+import threading
+from time import time
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from .store import MessageStore
+
+
+@dataclass
+class WarmUpStatus:
+    """Record class for the progress of a `WarmUp`."""
+
+    done: int = 0
+    total: int = 0
+    ready: bool = False
+
+    @property
+    def json(self) -> dict:
+        """Returns a serializable representation of this object."""
+        return {"done": self.done, "total": self.total, "ready": self.ready}
+
+
+class WarmUp:
+    """
+    Threaded worker class that loads conversation-metadata (and the
+    most recent messages of recently active conversations) of a
+    `MessageStore` into its cache using a pool of threads.
+    Conversations are loaded in the order of their last modification
+    (most recent first).
+
+    Keyword arguments:
+    store -- message store
+    conversations -- maximum number of conversations for which metadata
+                     is loaded
+                     (default None; all conversations)
+    active_conversations -- number of most recently active
+                            conversations for which messages are loaded
+                            (default 0)
+    messages -- number of most recent messages that are loaded per
+                active conversation
+                (default 0)
+    threads -- number of worker threads
+               (default 4)
+    callback -- callable that is called with the current `WarmUpStatus`
+                whenever progress has been made (at most every
+                `callback_interval` seconds) and on completion
+                (default None)
+    callback_interval -- minimum interval between callbacks in seconds
+                         (default 0.1)
+    """
+
+    def __init__(
+        self,
+        store: MessageStore,
+        conversations: Optional[int] = None,
+        active_conversations: int = 0,
+        messages: int = 0,
+        threads: int = 4,
+        callback: Optional[Callable[[WarmUpStatus], None]] = None,
+        callback_interval: float = 0.1,
+    ) -> None:
+        self.store = store
+        self.conversations = conversations
+        self.active_conversations = active_conversations
+        self.messages = messages
+        self.threads = threads
+        self.callback = callback
+        self.callback_interval = callback_interval
+
+        self.thread = None
+        self._status = WarmUpStatus()
+        self._status_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._last_callback = 0.0
+
+    @property
+    def status(self) -> WarmUpStatus:
+        """Returns (a copy of) the current progress."""
+        with self._status_lock:
+            return WarmUpStatus(**vars(self._status))
+
+    @property
+    def ready(self) -> bool:
+        """Returns `True` if the warm-up has been completed."""
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the warm-up has been completed (or `timeout`
+        seconds have passed). Returns `True` if completed.
+        """
+        return self._ready.wait(timeout)
+
+    def start(self) -> None:
+        """Starts warm-up in the background."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def _notify(self, force: bool = False) -> None:
+        """Runs callback (if due)."""
+        if self.callback is None:
+            return
+        with self._status_lock:
+            if not force and time() - self._last_callback < (
+                self.callback_interval
+            ):
+                return
+            self._last_callback = time()
+            status = WarmUpStatus(**vars(self._status))
+        try:
+            self.callback(status)
+        except (
+            Exception  # pylint: disable=broad-exception-caught
+        ) as exc_info:
+            print(
+                f"ERROR: Unable to report warm-up progress: {exc_info}",
+                file=sys.stderr,
+            )
+
+    def _load(self, cid: str, messages: int) -> None:
+        """Loads conversation (and messages) into the cache."""
+        try:
+            if (
+                self.store.load_conversation(cid) is not None
+                and messages > 0
+            ):
+                self.store.load_messages(cid, -messages)
+        except (
+            Exception  # pylint: disable=broad-exception-caught
+        ) as exc_info:
+            print(
+                f"ERROR: Unable to warm up conversation '{cid}': {exc_info}",
+                file=sys.stderr,
+            )
+        with self._status_lock:
+            self._status.done += 1
+        self._notify()
+
+    def run(self) -> None:
+        """Runs warm-up (blocking)."""
+        time0 = time()
+        entries = sorted(
+            self.store.list_catalog(),
+            key=lambda entry: entry.last_modified,
+            reverse=True,
+        )[: self.conversations]
+        with self._status_lock:
+            self._status.total = len(entries)
+        self._notify(force=True)
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for i, entry in enumerate(entries):
+                executor.submit(
+                    self._load,
+                    entry.id_,
+                    self.messages if i < self.active_conversations else 0,
+                )
+        with self._status_lock:
+            self._status.ready = True
+        self._ready.set()
+        self._notify(force=True)
+        print(
+            f"INFO: Warmed up cache with {len(entries)} conversation(s) "
+            + f"in {time() - time0:.2f}s.",
+            file=sys.stderr,
+        )
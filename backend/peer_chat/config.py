@@ -31,6 +31,57 @@ class AppConfig:
     USER_AVATAR_PATH = Path(".avatar")
     USER_PEER_URL = os.environ.get("USER_PEER_URL")
     DATA_DIRECTORY = Path("data")
+    STORAGE_ENGINE = os.environ.get(
+        "STORAGE_ENGINE", "directory"
+    )  # "directory" | "segment" | "sqlite"
+    FSYNC_POLICY = os.environ.get(
+        "FSYNC_POLICY", "never"
+    )  # "never" | "batch" | "always"
+    JSON_CODEC = os.environ.get(
+        "JSON_CODEC"
+    )  # "json" | "orjson"; default: fastest available
+    CACHE_MAX_MESSAGES = 10000
+    CACHE_MAX_BYTES = 64 * 1024 * 1024
+    CACHE_MAX_CONVERSATIONS = 1000
+    INDEX_WRITE_MODE = os.environ.get(
+        "INDEX_WRITE_MODE", "write-through"
+    )  # "write-through" | "write-behind"
+    INDEX_FLUSH_INTERVAL = 1.0
+    LOCK_STRIPES = 64
+    LOCK_INSTRUMENTATION = (
+        os.environ.get("LOCK_INSTRUMENTATION", "no") == "yes"
+    )
+    DEDUP_KEYS = 1000
+    ATTACHMENT_MAX_SIZE = 64 * 1024 * 1024
+    ATTACHMENT_PENDING_QUOTA = 256 * 1024 * 1024
+    ATTACHMENT_PENDING_TTL = 3600.0
+    PEER_POOL_SIZE = 4
+    PEER_POOL_MAX_PEERS = 64
+    PEER_MIN_TIMEOUT = 0.5
+    PEER_MAX_TIMEOUT = 2.0
+    PEER_FAILURE_THRESHOLD = 3
+    PEER_RESET_TIMEOUT = 30.0
+    INFORM_PEERS_WORKERS = 32
+    INFORM_PEERS_DEADLINE = 3.0
+    DELIVERY_THREADS = 4
+    DELIVERY_BASE_DELAY = 1.0
+    DELIVERY_MAX_DELAY = 300.0
+    DELIVERY_BATCH_SIZE = 1000
+    ARCHIVE_MAX_AGE = (
+        float(os.environ["ARCHIVE_MAX_AGE"])
+        if "ARCHIVE_MAX_AGE" in os.environ
+        else None
+    )  # in days
+    ARCHIVE_KEEP_LAST = (
+        int(os.environ["ARCHIVE_KEEP_LAST"])
+        if "ARCHIVE_KEEP_LAST" in os.environ
+        else None
+    )
+    ARCHIVE_INTERVAL = 3600.0
+    WARM_UP = os.environ.get("WARM_UP", "no") == "yes"
+    WARM_UP_ACTIVE_CONVERSATIONS = 20
+    WARM_UP_MESSAGES = 50
+    WARM_UP_THREADS = 4
     UPDATES_FILE_PATH = Path(".updates")
     USE_NOTIFICATIONS = os.environ.get("USE_NOTIFICATIONS", "yes") == "yes"
     CLIENT_URL = os.environ.get("CLIENT_URL")
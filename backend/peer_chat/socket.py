@@ -1,22 +1,27 @@
 """Socket.IO-websocket definition."""
 
+from typing import Optional
 import sys
 from datetime import datetime
 from dataclasses import dataclass, field
+from threading import Lock, Thread
 
 from flask import request
 from flask_socketio import SocketIO
 
 from peer_chat.config import AppConfig
 from peer_chat.common import (
+    codec,
     Auth,
     User,
     MessageStore,
     Conversation,
     Message,
     MessageStatus,
+    WarmUp,
+    PeerClient,
+    DeliveryWorker,
     inform_peers as _inform_peers,
-    send_message as _send_message,
 )
 
 
@@ -24,23 +29,37 @@ from peer_chat.common import (
 class SocketInfo:
     socket: SocketIO
     connections: list[str] = field(default_factory=list)
+    warm_up: Optional[WarmUp] = None
+    client: Optional[PeerClient] = None
+    delivery: Optional[DeliveryWorker] = None
 
 
 def socket_(
-    config: AppConfig, auth: Auth, store: MessageStore, user: User
+    config: AppConfig,
+    auth: Auth,
+    store: MessageStore,
+    user: User,
+    client: Optional[PeerClient] = None,
 ) -> SocketInfo:
     """
     Returns a fully configured `SocketIO`-object that can be registered
-    with a Flask-application.
+    with a Flask-application. Outbound requests to peers are sent via
+    `client`.
     """
     # enable CORS in development-environment
     if config.MODE == "dev":
         print("INFO: Configuring socket for CORS.", file=sys.stderr)
         socket_info = SocketInfo(
-            SocketIO(cors_allowed_origins=config.DEV_CORS_FRONTEND_URL)
+            SocketIO(
+                cors_allowed_origins=config.DEV_CORS_FRONTEND_URL,
+                json=codec.SocketIOJSON,
+            ),
+            client=client,
         )
     else:
-        socket_info = SocketInfo(SocketIO())
+        socket_info = SocketInfo(
+            SocketIO(json=codec.SocketIOJSON), client=client
+        )
 
     @socket_info.socket.on("connect")
     def connect():
@@ -75,10 +94,42 @@ def socket_(
     def ping():
         return "pong"
 
+    @socket_info.socket.on("get-warm-up-status")
+    def get_warm_up_status():
+        """
+        Returns progress of the cache warm-up (ready if no warm-up is
+        configured).
+        """
+        if socket_info.warm_up is None:
+            return {"done": 0, "total": 0, "ready": True}
+        return socket_info.warm_up.status.json
+
+    informing = Lock()
+
+    def run_inform_peers():
+        """Posts update-notification to all peers and emits result."""
+        try:
+            report = _inform_peers(
+                store,
+                user,
+                socket_info.client,
+                workers=config.INFORM_PEERS_WORKERS,
+                deadline=config.INFORM_PEERS_DEADLINE,
+            )
+            socket_info.socket.emit("peers-informed", report.json)
+        finally:
+            informing.release()
+
     @socket_info.socket.on("inform-peers")
     def inform_peers():
-        """Posts update-notification to all peers."""
-        _inform_peers(store, user)
+        """
+        Posts update-notification to all peers in the background and
+        emits the result as 'peers-informed'-event (requests while a
+        previous notification is still running are ignored).
+        """
+        if not informing.acquire(blocking=False):
+            return
+        Thread(target=run_inform_peers, daemon=True).start()
 
     @socket_info.socket.on("create-conversation")
     def create_conversation(name: str, peer: str):
@@ -105,6 +156,20 @@ def socket_(
         """Returns a (heuristic) list of conversations."""
         return store.list_conversations()
 
+    @socket_info.socket.on("get-conversations")
+    def get_conversations(cursor: Optional[str] = None, limit: int = 50):
+        """
+        Returns a page of conversation metadata (most recently modified
+        first) and the cursor for the next page (`None` if exhausted).
+        """
+        conversations, cursor = store.load_conversations(
+            min(max(1, limit), 1000), cursor
+        )
+        return {
+            "conversations": [c.json for c in conversations],
+            "cursor": cursor,
+        }
+
     @socket_info.socket.on("get-conversation")
     def get_conversation(cid: str):
         """Returns conversation metadata."""
@@ -140,6 +205,28 @@ def socket_(
         except AttributeError:
             return None
 
+    @socket_info.socket.on("get-messages")
+    def get_messages(cid: str, start: int = 0, stop: Optional[int] = None):
+        """
+        Returns list of message data for the range `start` to `stop`
+        (exclusive; negative values are counted from the back).
+        """
+        messages = store.load_messages(cid, start, stop)
+        if messages is None:
+            return None
+        return [m.json for m in messages]
+
+    @socket_info.socket.on("search")
+    def search(query: str, offset: int = 0, limit: int = 20):
+        """
+        Returns total number and page of ranked hits (conversation and
+        message id) of full-text search for `query`.
+        """
+        total, hits = store.search(
+            query, offset=max(0, offset), limit=min(max(0, limit), 1000)
+        )
+        return {"total": total, "hits": [hit.json for hit in hits]}
+
     @socket_info.socket.on("post-message")
     def post_message(cid: str, msg: dict):
         """Post message data."""
@@ -147,17 +234,16 @@ def socket_(
 
     @socket_info.socket.on("send-message")
     def send_message(cid: str, mid: int):
-        """Send message to peer."""
+        """
+        Submit message for delivery to peer (returns without waiting for
+        the delivery; status changes are emitted as 'update-message').
+        """
         c = store.load_conversation(cid)
         if not c:
             return False
-        m = store.load_message(cid, mid)
-        if not m:
-            return False
         c.last_modified = datetime.now()
-        socket_info.socket.emit("update-conversation", c.json)
 
-        return _send_message(c, m, store, user, socket_info.socket)
+        return socket_info.delivery.submit(cid, mid)
 
     @socket_info.socket.on("delete-message")
     def delete_message(cid: str, mid: int):
@@ -30,6 +30,7 @@ setup(
         "gunicorn",
         "desktop-notifier>=6,<7",
     ],
+    extras_require={"fast": ["orjson>=3,<4"]},
     packages=[
         "peer_chat",
         "peer_chat.api",
@@ -39,6 +40,7 @@ setup(
     entry_points={
         "console_scripts": [
             "peerChat = peer_chat.app:run",
+            "peerChat-store = peer_chat.cli:run",
         ],
     },
     classifiers=[
@@ -85,6 +85,8 @@ def test_app_who(testing_config: AppConfig):
     assert response.status_code == 200
     assert "name" in response.json and response.json["name"] == "peerChatAPI"
     assert "api" in response.json
+    assert "message-batch" in response.json["features"]["0"]
+    assert "attachments" in response.json["features"]["0"]
 
 
 def test_app_create_auth_key(testing_config: AppConfig):
@@ -125,3 +127,111 @@ def test_app_create_auth_key_user_value(testing_config: AppConfig):
     assert response.data == (
         testing_config.WORKING_DIRECTORY / testing_config.USER_AUTH_KEY_PATH
     ).read_bytes()
+
+
+def test_app_store_stats(testing_config: AppConfig):
+    """Test endpoint `GET-/store/stats`."""
+    key = str(uuid4())
+    testing_config.USER_AUTH_KEY = key
+    client = app_factory(testing_config)[0].test_client()
+    assert client.get("/store/stats").status_code == 401
+    client.set_cookie(Auth.KEY, key)
+    response = client.get("/store/stats")
+    assert response.status_code == 200
+    assert "hits" in response.json["cache"]["messages"]
+
+
+def test_app_peers_health(testing_config: AppConfig):
+    """Test endpoint `GET-/peers/health`."""
+    key = str(uuid4())
+    testing_config.USER_AUTH_KEY = key
+    client = app_factory(testing_config)[0].test_client()
+    assert client.get("/peers/health").status_code == 401
+    client.set_cookie(Auth.KEY, key)
+    response = client.get("/peers/health")
+    assert response.status_code == 200
+    assert isinstance(response.json, dict)
+
+
+def test_app_store_search(testing_config: AppConfig, fake_conversation):
+    """Test endpoint `GET-/store/search`."""
+    key = str(uuid4())
+    testing_config.USER_AUTH_KEY = key
+    c = fake_conversation(
+        testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+    )
+    client = app_factory(testing_config)[0].test_client()
+    assert client.get("/store/search?q=cat").status_code == 401
+    client.set_cookie(Auth.KEY, key)
+    response = client.get("/store/search?q=cat dog bird")
+    assert response.status_code == 200
+    assert response.json == {"total": 0, "hits": []}
+    response = client.get(f"/store/search?q={c.messages[0].body}&limit=1")
+    assert response.status_code == 200
+    assert response.json["total"] >= 1
+    assert len(response.json["hits"]) == 1
+    assert response.json["hits"][0]["cid"] == c.id_
+    assert client.get("/store/search?q=cat&offset=a").status_code == 400
+
+
+def test_app_store_export_import(testing_config: AppConfig, fake_conversation):
+    """Test endpoints `GET-/store/export` and `POST-/store/import`."""
+    key = str(uuid4())
+    testing_config.USER_AUTH_KEY = key
+    c = fake_conversation(
+        testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+    )
+    client = app_factory(testing_config)[0].test_client()
+    assert client.get("/store/export").status_code == 401
+    assert client.post("/store/import").status_code == 401
+    client.set_cookie(Auth.KEY, key)
+    response = client.get("/store/export")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    export = response.data
+    assert len(export.splitlines()) == 1 + 1 + c.length
+
+    testing_config.DATA_DIRECTORY = Path("data-import")
+    client = app_factory(testing_config)[0].test_client()
+    client.set_cookie(Auth.KEY, key)
+    response = client.post("/store/import", data=export)
+    assert response.status_code == 200
+    assert response.json["conversations"] == 1
+    assert response.json["messages"] == c.length
+    assert client.get("/store/export").data == export
+    assert client.post("/store/import", data=b"{}").status_code == 400
+
+
+def test_app_attachments(testing_config: AppConfig):
+    """Test endpoints `POST-/attachments` and `GET-/attachments/<id>`."""
+    key = str(uuid4())
+    testing_config.USER_AUTH_KEY = key
+    testing_config.ATTACHMENT_MAX_SIZE = 100
+    client = app_factory(testing_config)[0].test_client()
+    assert client.post("/attachments", data=b"data").status_code == 401
+    client.set_cookie(Auth.KEY, key)
+
+    data = bytes(range(100))
+    response = client.post(
+        "/attachments?name=a.bin&type=application/x-test", data=data
+    )
+    assert response.status_code == 200
+    attachment = response.json
+    assert attachment["size"] == len(data)
+    assert attachment["name"] == "a.bin"
+    assert attachment["type"] == "application/x-test"
+    assert (
+        client.post("/attachments", data=data).json["id"] == attachment["id"]
+    )
+    assert client.post("/attachments", data=data + b"-").status_code == 413
+
+    response = client.get(f"/attachments/{attachment['id']}?name=a.bin")
+    assert response.status_code == 200
+    assert response.data == data
+    assert "a.bin" in response.headers["Content-Disposition"]
+    response = client.get(
+        f"/attachments/{attachment['id']}", headers={"Range": "bytes=10-19"}
+    )
+    assert response.status_code == 206
+    assert response.data == data[10:20]
+    assert client.get(f"/attachments/{'0' * 64}").status_code == 404
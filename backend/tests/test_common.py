@@ -2,9 +2,51 @@
 
 from pathlib import Path
 from shutil import rmtree
+from threading import Thread, Event
+from datetime import datetime, timedelta
+from time import sleep, perf_counter
 from json import dumps, loads
+from io import BytesIO
+from hashlib import sha256
+from base64 import b64encode
 
-from peer_chat.common import Message, Conversation, MessageStore
+import pytest
+import requests
+
+from peer_chat.common import (
+    Message,
+    MessageStatus,
+    Conversation,
+    MessageStore,
+    DirectoryEngine,
+    SegmentEngine,
+    SQLiteEngine,
+    FSYNC_POLICIES,
+    Archiver,
+    SearchIndex,
+    WarmUp,
+    export_ndjson,
+    import_ndjson,
+    ChangeJournal,
+    create_snapshot,
+    list_snapshots,
+    restore_snapshots,
+    migrate,
+    codec,
+    Attachment,
+    AttachmentStore,
+    fsck,
+    FsckIssue,
+    PeerClient,
+    PeerHealth,
+    PeerUnavailable,
+    User,
+    inform_peers,
+    DeliveryWorker,
+)
+from peer_chat.common.engine import GroupCommitter
+from peer_chat.common.fsck import ConversationCheck, _repair
+from peer_chat.common.util import push_attachments
 
 
 def test_message_de_serialization():
@@ -19,6 +61,36 @@ def test_conversation_de_serialization(tmp: Path):
     assert c.json == Conversation.from_json(loads(dumps(c.json))).json
 
 
+def test_compact_models():
+    """Test compact representation of `Message` and `Conversation`."""
+    m = Message.from_json(
+        {
+            "id": 0,
+            "body": "a",
+            "status": "queued",
+            "isMine": False,
+            "lastModified": "2025-01-02T03:04:05.000006",
+        }
+    )
+    assert not hasattr(m, "__dict__")
+    assert m.status == MessageStatus.QUEUED
+    assert m.last_modified == datetime(2025, 1, 2, 3, 4, 5, 6)
+    assert m.json["lastModified"] == "2025-01-02T03:04:05.000006"
+    assert Message.from_json(m.json) == m
+    m.status = MessageStatus.OK
+    assert m.json["status"] == "ok"
+    assert Message(last_modified=datetime(2025, 1, 1)).json[
+        "lastModified"
+    ] == "2025-01-01T00:00:00"
+
+    c0 = Conversation("".join(["0.0.0.", "0"]), "c-0")
+    c1 = Conversation.from_json(c0.json | {"id": "c-1"})
+    assert not hasattr(c0, "__dict__")
+    assert c0.peer is c1.peer
+    assert c1.last_modified == c0.last_modified
+    assert Conversation.from_json(c0.json) == c0
+
+
 def test_message_store_loading_and_caching_conversation(
     tmp: Path, fake_conversation
 ):
@@ -76,3 +148,1530 @@ def test_message_store_load_conversations(tmp: Path, fake_conversation):
     assert set(store.list_conversations()) == set(
         [faked_conversation1.id_, faked_conversation2.id_]
     )
+
+
+@pytest.mark.parametrize(
+    "engine", [DirectoryEngine, SegmentEngine, SQLiteEngine]
+)
+def test_message_store_engines(tmp: Path, engine):
+    """Test `MessageStore` with different storage engines."""
+    store = MessageStore(tmp, engine=engine(tmp))
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    for body in ["a", "b", "c"]:
+        store.post_message(c.id_, Message(body=body))
+    m = store.load_message(c.id_, 1)
+    m.body = "d"
+    store.write(c.id_, 1)
+
+    store = MessageStore(tmp, engine=engine(tmp))
+    assert store.list_conversations() == [c.id_]
+    assert store.load_conversation(c.id_).length == 3
+    assert [store.load_message(c.id_, mid).body for mid in range(3)] == [
+        "a",
+        "d",
+        "c",
+    ]
+    assert store.load_message(c.id_, -1).body == "c"
+    assert store.engine.list_messages(c.id_) == [0, 1, 2]
+
+    store = MessageStore(tmp, engine=engine(tmp))
+    assert [m.body for m in store.load_messages(c.id_, -2)] == ["d", "c"]
+    assert [m.body for m in store.load_messages(c.id_)] == ["a", "d", "c"]
+    assert [m.body for m in store.load_messages(c.id_, 1, 2)] == ["d"]
+    assert store.load_messages(c.id_, 5) == []
+    assert store.load_messages("unknown-id") is None
+    assert store.cache_stats["messages"]["misses"] == 3
+
+
+def test_segment_engine_recovery(tmp: Path):
+    """Test recovery of offset index in `SegmentEngine`."""
+    engine = SegmentEngine(tmp, segment_size=64)
+    engine.write_conversation("c", {"id": "c"})
+    for mid in range(5):
+        engine.write_message("c", mid, Message(mid, str(mid)).json)
+    assert len(list((tmp / "c").glob("segment-*.log"))) > 1
+
+    # simulate crash before writing offset index and while writing record
+    (tmp / "c" / "segments.idx").unlink()
+    with open(sorted((tmp / "c").glob("segment-*.log"))[-1], "ab") as f:
+        f.write(b'{"id": 5, "bo')
+
+    engine = SegmentEngine(tmp, segment_size=64)
+    assert engine.list_messages("c") == list(range(5))
+    assert engine.read_message("c", 4)["body"] == "4"
+
+    # continue writing after recovery
+    engine.write_message("c", 5, Message(5, "5").json)
+    assert SegmentEngine(tmp).read_message("c", 5)["body"] == "5"
+
+
+def test_segment_engine_compaction(tmp: Path):
+    """Test compaction of outdated records in `SegmentEngine`."""
+    engine = SegmentEngine(tmp, segment_size=256)
+    engine.write_conversation("c", {"id": "c"})
+    for mid in range(5):
+        engine.write_message("c", mid, Message(mid, str(mid)).json)
+    assert engine.compact() == 0
+    for i in range(20):
+        engine.write_message("c", 1, Message(1, f"update-{i}").json)
+
+    def size():
+        return sum(
+            p.stat().st_size for p in (tmp / "c").glob("segment-*.log")
+        )
+
+    before = size()
+    segments = sorted((tmp / "c").glob("segment-*.log"))
+    assert engine.compact(["c"]) == 1
+    assert size() < before / 2
+    assert not any(p.exists() for p in segments)
+    assert engine.compact(["c"]) == 0
+    assert engine.read_message("c", 1)["body"] == "update-19"
+
+    # interrupted compaction: previous segments left behind
+    engine.write_message("c", 1, Message(1, "stale").json)
+    stale = sorted((tmp / "c").glob("segment-*.log"))
+    engine.write_message("c", 1, Message(1, "latest").json)
+    index = (tmp / "c" / "segments.idx").read_bytes()
+    data = {p.name: p.read_bytes() for p in stale}
+    engine.compact(["c"], min_ratio=1)
+    for name, content in data.items():
+        (tmp / "c" / name).write_bytes(content)
+    engine = SegmentEngine(tmp, segment_size=256)
+    assert engine.list_messages("c") == list(range(5))
+    assert engine.read_message("c", 1)["body"] == "latest"
+    assert not any(p.exists() for p in stale)
+    assert (tmp / "c" / "segments.idx").read_bytes() != index
+
+    # compacted when flushing the store
+    store = MessageStore(
+        tmp / "store", engine=SegmentEngine(tmp / "store", segment_size=256)
+    )
+    c = Conversation("0.0.0.0", "c")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    m = store.load_message(c.id_, store.post_message(c.id_, Message()))
+    for i in range(10):
+        m.body = f"update-{i}"
+        store.write(c.id_, m.id_)
+    log = store.engine._log(c.id_)  # pylint: disable=protected-access
+    assert log.live < log.total / 2
+    store.flush()
+    assert log.live == log.total
+    assert store.engine.read_message(c.id_, m.id_)["body"] == "update-9"
+    store.close()
+
+    # compacted while writing
+    engine = SegmentEngine(
+        tmp / "auto", segment_size=256, compact_min_size=1024
+    )
+    engine.write_conversation("c", {"id": "c"})
+    for i in range(100):
+        engine.write_message("c", 0, Message(0, f"update-{i}").json)
+        log = engine._log("c")  # pylint: disable=protected-access
+        assert log.total < 2048
+    with engine.batch():
+        for i in range(100):
+            engine.write_message("c", 0, Message(0, f"batch-{i}").json)
+        assert log.total > 2048
+    assert log.live == log.total
+    assert engine.read_message("c", 0)["body"] == "batch-99"
+
+    # compacted by fsck
+    engine = SegmentEngine(tmp / "store")
+    for i in range(10):
+        engine.write_message(c.id_, m.id_, Message(m.id_, str(i)).json)
+    engine.close()
+    assert fsck(tmp / "store", "segment", jobs=1, dry_run=True).compacted == 0
+    assert fsck(tmp / "store", "segment", jobs=1).compacted == 1
+
+
+def test_migrate(tmp: Path, fake_conversation):
+    """Test function `migrate`."""
+    c = fake_conversation(tmp / "source")
+    source = DirectoryEngine(tmp / "source")
+    target = SegmentEngine(tmp / "target")
+
+    source_attachments = AttachmentStore(tmp / "source" / ".attachments")
+    target_attachments = AttachmentStore(tmp / "target" / ".attachments")
+    id_, _ = source_attachments.put(BytesIO(b"data"))
+
+    assert migrate(source, target, source_attachments, target_attachments) == (
+        1,
+        c.length,
+        1,
+    )
+    assert list(target_attachments.ids()) == [id_]
+    assert target.list_conversations() == [c.id_]
+    assert target.read_conversation(c.id_) == c.json
+    for mid in range(c.length):
+        assert target.read_message(c.id_, mid) == c.messages[mid].json
+
+
+def test_sqlite_engine_batch(tmp: Path):
+    """Test rollback of batched writes in `SQLiteEngine`."""
+    engine = SQLiteEngine(tmp)
+    engine.write_conversation("c", {"id": "c"})
+    with pytest.raises(ValueError):
+        with engine.batch():
+            engine.write_message("c", 0, {"id": 0})
+            raise ValueError()
+    assert engine.list_messages("c") == []
+    with engine.batch():
+        engine.write_message("c", 0, {"id": 0})
+        engine.write_message("c", 1, {"id": 1})
+    assert engine.list_messages("c") == [0, 1]
+
+
+def test_message_store_lru_cache(tmp: Path):
+    """Test bounded cache of `MessageStore`."""
+    store = MessageStore(tmp, max_messages=2, max_conversations=1)
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    for body in ["a", "b", "c"]:
+        store.post_message(c.id_, Message(body=body))
+    assert sorted(c.messages) == [1, 2]
+    assert store.load_message(c.id_, 0).body == "a"
+    assert sorted(c.messages) == [0, 2]
+    stats = store.cache_stats["messages"]
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 2
+    assert stats["entries"] == 2
+
+    # messages that are being sent are not evicted
+    c.messages[0].status = MessageStatus.SENDING
+    store.load_message(c.id_, 1)
+    assert sorted(c.messages) == [0, 1]
+
+    # unloading idle conversation persists metadata
+    c.name = "c-1"
+    c2 = Conversation("0.0.0.0", "c-2")
+    store.set_conversation_path(c2)
+    store.create_conversation(c2)
+    assert store.cache_stats["conversations"]["evictions"] == 0
+    c.messages[0].status = MessageStatus.OK
+    store.load_conversation(c2.id_)
+    store.create_conversation(Conversation("0.0.0.0", "c-3"))
+    assert store.cache_stats["conversations"]["evictions"] > 0
+    assert c.id_ not in store._cache
+    assert MessageStore(tmp).load_conversation(c.id_).name == "c-1"
+    # evicted object that is still referenced is reused
+    assert store.load_conversation(c.id_) is c
+
+
+def test_message_store_lru_cache_stale_references(tmp: Path):
+    """
+    Test changes made to evicted but still referenced objects being
+    persisted.
+    """
+    store = MessageStore(tmp, max_messages=1, max_conversations=1)
+    c1 = Conversation("peer", "c-1")
+    store.set_conversation_path(c1)
+    store.create_conversation(c1)
+    mid = store.post_message(c1.id_, Message(body="a"))
+    m = store.load_message(c1.id_, mid)
+
+    c1 = store.load_conversation(c1.id_)
+    c2 = Conversation("peer", "c-2")
+    store.set_conversation_path(c2)
+    store.create_conversation(c2)
+    store.post_message(c2.id_, Message(body="b"))
+    assert c1.id_ not in store._cache
+
+    # modify and write stale objects (see `send_message`)
+    m.status = MessageStatus.QUEUED
+    c1.queued_messages.append(mid)
+    store.post_message(c1.id_, m)
+    assert store.load_conversation(c1.id_) is c1
+    assert store.list_queued("peer") == [c1.id_]
+    store.load_conversation(c2.id_)
+
+    # write message that has been evicted (see 'delete-message')
+    m.status = MessageStatus.DELETED
+    store.write(c1.id_, mid)
+
+    fresh = MessageStore(tmp)
+    assert fresh.load_conversation(c1.id_).queued_messages == [mid]
+    assert fresh.load_message(c1.id_, mid).status == MessageStatus.DELETED
+
+
+def test_message_store_lru_cache_bytes(tmp: Path):
+    """Test memory budget of `MessageStore`-cache."""
+    store = MessageStore(tmp, max_bytes=3 * MessageStore.MESSAGE_OVERHEAD)
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    for body in ["a", "b", "c"]:
+        store.post_message(c.id_, Message(body=body))
+    assert sorted(c.messages) == [1, 2]
+    assert (
+        store.cache_stats["messages"]["bytes"]
+        <= 3 * MessageStore.MESSAGE_OVERHEAD
+    )
+
+
+def test_message_store_catalog(tmp: Path, fake_conversation):
+    """Test conversation-catalog of `MessageStore`."""
+    c1 = fake_conversation(tmp)
+    store = MessageStore(tmp)
+    c2 = fake_conversation(tmp)
+
+    # picks up changes by other instances
+    assert set(store.list_conversations()) == {c1.id_, c2.id_}
+
+    c = store.load_conversation(c1.id_)
+    c.queued_messages.append(0)
+    store.write(c.id_)
+    entry = next(e for e in store.list_catalog() if e.id_ == c1.id_)
+    assert entry.peer == c1.peer
+    assert entry.queued_messages == 1
+
+    store.delete_conversation(store.load_conversation(c2.id_))
+    assert store.list_conversations() == [c1.id_]
+
+    # compaction
+    for _ in range(200):
+        c.unread_messages = not c.unread_messages
+        store.write(c.id_)
+    assert len((tmp / ".catalog").read_text().splitlines()) < 200
+    assert MessageStore(tmp).list_conversations() == [c1.id_]
+
+    # rebuild
+    (tmp / ".catalog").unlink()
+    assert MessageStore(tmp).list_catalog()[0].queued_messages == 1
+
+
+def test_message_store_queued_index(tmp: Path):
+    """Test index of conversations with queued messages per peer."""
+    store = MessageStore(tmp)
+    cs = [Conversation(peer, "c") for peer in ["a", "a", "b"]]
+    for c in cs:
+        store.set_conversation_path(c)
+        store.create_conversation(c)
+    assert store.list_queued() == []
+
+    for c in cs:
+        c.queued_messages.append(0)
+        store.write(c.id_)
+    assert sorted(store.list_queued("a")) == sorted([cs[0].id_, cs[1].id_])
+    assert store.list_queued("b") == [cs[2].id_]
+    assert store.list_queued("c") == []
+    assert len(store.list_queued()) == 3
+
+    # changes of queue and peer
+    cs[0].queued_messages.clear()
+    store.write(cs[0].id_)
+    cs[1].peer = "b"
+    store.write(cs[1].id_)
+    assert store.list_queued("a") == []
+    assert sorted(store.list_queued("b")) == sorted([cs[1].id_, cs[2].id_])
+
+    # rebuilt from journal and from engine
+    assert sorted(MessageStore(tmp).list_queued("b")) == sorted(
+        [cs[1].id_, cs[2].id_]
+    )
+    store.rebuild_catalog()
+    assert sorted(store.list_queued("b")) == sorted([cs[1].id_, cs[2].id_])
+
+    store.delete_conversation(cs[2])
+    assert store.list_queued("b") == [cs[1].id_]
+
+
+def test_message_store_write_behind(tmp: Path):
+    """Test write-behind mode of `MessageStore`."""
+
+    class CountingEngine(DirectoryEngine):
+        """Engine counting metadata-writes."""
+
+        writes = 0
+
+        def write_conversation(self, cid, json_):
+            self.writes += 1
+            super().write_conversation(cid, json_)
+
+    engine = CountingEngine(tmp)
+    store = MessageStore(tmp, engine=engine, flush_interval=3600)
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    assert engine.writes == 1
+    for body in ["a", "b", "c"]:
+        store.post_message(c.id_, Message(body=body, key=body))
+    store.set_conversation_read(c.id_)
+    assert engine.writes == 1
+    assert engine.read_conversation(c.id_)["length"] == 0
+    assert store.list_catalog()[0].unread_messages
+    assert not (tmp / ".dedup").exists()
+    assert store.post_message(c.id_, Message(body="a", key="a")) == 0
+    store.flush()
+    assert engine.writes == 2
+    assert engine.read_conversation(c.id_)["length"] == 3
+    assert not store.list_catalog()[0].unread_messages
+    reopened = MessageStore(tmp)
+    assert reopened.post_message(c.id_, Message(body="b", key="b")) == 1
+
+    # recovery of lost metadata-update
+    store.post_message(c.id_, Message(body="d"))
+    assert engine.read_conversation(c.id_)["length"] == 3
+    store = MessageStore(tmp, flush_interval=3600)
+    assert store.load_conversation(c.id_).length == 4
+    store.close()
+
+
+@pytest.mark.parametrize("fsync", FSYNC_POLICIES)
+@pytest.mark.parametrize(
+    "engine", [DirectoryEngine, SegmentEngine, SQLiteEngine]
+)
+def test_engine_fsync_policies(tmp: Path, engine, fsync):
+    """Test storage engines with different fsync-policies."""
+    store = MessageStore(tmp, engine=engine(tmp, fsync=fsync))
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+
+    def post():
+        for _ in range(10):
+            store.post_message(c.id_, Message(body="a"))
+
+    threads = [Thread(target=post) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    store = MessageStore(tmp, engine=engine(tmp))
+    assert store.load_conversation(c.id_).length == 40
+    assert len(store.load_messages(c.id_)) == 40
+    assert not list(tmp.glob("**/*.tmp"))
+
+
+def test_group_committer(tmp: Path):
+    """Test group commits of `GroupCommitter`."""
+    synced = []
+
+    class RecordingCommitter(GroupCommitter):
+        """Records processed groups."""
+
+        def _process(self, commits):
+            synced.append(len(commits))
+            super()._process(commits)
+
+    committer = RecordingCommitter()
+    files = [tmp / f"{i}" for i in range(20)]
+    for f in files:
+        f.with_suffix(".tmp").write_text("data")
+    # pylint: disable=import-outside-toplevel
+    from peer_chat.common.engine import _Commit
+
+    threads = [
+        Thread(
+            target=committer.commit,
+            args=([_Commit(renames=[(f.with_suffix(".tmp"), f)])],),
+        )
+        for f in files
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(synced) == 20
+    assert all(f.read_text() == "data" for f in files)
+
+
+@pytest.mark.parametrize(
+    "engine", [DirectoryEngine, SegmentEngine, SQLiteEngine]
+)
+def test_message_store_search(tmp: Path, engine):
+    """Test full-text search of `MessageStore`."""
+    store = MessageStore(tmp, engine=engine(tmp))
+    c0 = Conversation("0.0.0.0", "c-0")
+    c1 = Conversation("0.0.0.1", "c-1")
+    for c in (c0, c1):
+        store.set_conversation_path(c)
+        store.create_conversation(c)
+    store.post_message(c0.id_, Message(body="The cat sat on the mat."))
+    store.post_message(c0.id_, Message(body="a dog"))
+
+    # lazy build from stored messages
+    assert store.search("cat")[0] == 1
+    store.post_message(c1.id_, Message(body="Cat, cat, and another cat!"))
+    store.post_message(c1.id_, Message(body="cat and dog"))
+    # re-posting (e.g. status change) does not duplicate hits
+    m = store.load_message(c1.id_, 1)
+    m.status = MessageStatus.OK
+    store.post_message(c1.id_, m)
+
+    total, hits = store.search("CAT")
+    assert total == 3
+    assert (hits[0].cid, hits[0].mid) == (c1.id_, 0)
+    total, hits_ = store.search("cat dog")
+    assert total == 1
+    assert hits_[0].json["cid"] == c1.id_
+    assert hits_[0].json["mid"] == 1
+    assert store.search("bird") == (0, [])
+    assert store.search("") == (0, [])
+
+    # pagination
+    assert [
+        (hit.cid, hit.mid) for hit in store.search("cat", offset=1, limit=1)[1]
+    ] == [(hits[1].cid, hits[1].mid)]
+
+    # persistence and incomplete journal
+    assert (tmp / ".search" / f"{c0.id_}.jsonl").is_file()
+    with open(tmp / ".search" / f"{c1.id_}.jsonl", "a") as f:
+        f.write('{"id": 5, "ter')
+    store.close()
+    store = MessageStore(tmp, engine=engine(tmp))
+    assert [(hit.cid, hit.mid) for hit in store.search("cat")[1]] == [
+        (hit.cid, hit.mid) for hit in hits
+    ]
+
+    # message deletion
+    m = store.load_message(c1.id_, 1)
+    m.status = MessageStatus.DELETED
+    store.write(c1.id_, 1)
+    assert store.search("cat dog") == (0, [])
+    assert store.search("cat")[0] == 2
+    store.close()
+    store = MessageStore(tmp, engine=engine(tmp))
+    assert store.search("cat dog") == (0, [])
+    assert store.search("dog")[0] == 1
+
+    # deletion
+    store.delete_conversation(store.load_conversation(c1.id_))
+    assert store.search("cat")[0] == 1
+    assert not (tmp / ".search" / f"{c1.id_}.jsonl").exists()
+
+
+def test_search_index_concurrent_build(tmp: Path):
+    """Test that `SearchIndex` does not block while loading."""
+    started = Event()
+    proceed = Event()
+
+    def loader(cid, indexed):
+        if cid == "c-0":
+            started.set()
+            proceed.wait(5)
+        return [Message(id_=0, body=f"{cid} word")]
+
+    index = SearchIndex(tmp, loader)
+    index.search("word", ["c-1"])
+    thread = Thread(target=index.search, args=("word", ["c-0"]))
+    thread.start()
+    assert started.wait(5)
+    # other conversations and the conversation being loaded are
+    # not blocked
+    index.add("c-1", Message(id_=1, body="word"))
+    index.add("c-0", Message(id_=1, body="word"))
+    proceed.set()
+    thread.join()
+    total, hits = index.search("word", ["c-0", "c-1"])
+    assert total == 4
+    assert {(hit.cid, hit.mid) for hit in hits} == {
+        ("c-0", 0),
+        ("c-0", 1),
+        ("c-1", 0),
+        ("c-1", 1),
+    }
+
+
+def test_message_store_archive(tmp: Path):
+    """Test archival of messages in `MessageStore`."""
+    store = MessageStore(tmp)
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    for i in range(200):
+        store.post_message(
+            c.id_,
+            Message(
+                body=str(i),
+                status=(
+                    MessageStatus.QUEUED if i == 5 else MessageStatus.OK
+                ),
+                last_modified=datetime(2020, 1, 1) if i < 150 else None,
+            ),
+        )
+
+    assert store.archive() == 0
+    assert store.archive(keep_last=100) == 99
+    assert len(list((tmp / c.id_).glob("*.json"))) == 102
+    assert store.archive(max_age=timedelta(days=1)) == 50
+    assert len(list((tmp / c.id_).glob("*.json"))) == 52
+
+    # transparent access
+    store = MessageStore(tmp)
+    assert store.engine.list_messages(c.id_) == list(range(200))
+    assert store.load_message(c.id_, 42).body == "42"
+    assert [m.body for m in store.load_messages(c.id_, 60, 70)] == [
+        str(i) for i in range(60, 70)
+    ]
+
+    # writes after archival take precedence
+    m = store.load_message(c.id_, 42)
+    m.status = MessageStatus.DELETED
+    store.write(c.id_, 42)
+    store = MessageStore(tmp)
+    assert store.load_message(c.id_, 42).status == MessageStatus.DELETED
+    assert store.archive(keep_last=100) == 1
+    store = MessageStore(tmp)
+    assert store.load_message(c.id_, 42).status == MessageStatus.DELETED
+
+    # unsupported engine
+    assert (
+        MessageStore(
+            tmp / "segment", engine=SegmentEngine(tmp / "segment")
+        ).archive(keep_last=0)
+        == 0
+    )
+
+
+def test_message_store_archive_concurrent(tmp: Path):
+    """Test that archival does not block posting while reading."""
+
+    class SlowEngine(DirectoryEngine):
+        """Engine posting from another thread while reading."""
+
+        posted = []
+
+        def read_messages(self, cid, mids):
+            thread = Thread(
+                target=lambda: self.posted.append(
+                    store.post_message(cid, Message(body="new"))
+                )
+            )
+            thread.start()
+            thread.join(5)
+            return super().read_messages(cid, mids)
+
+    store = MessageStore(tmp, engine=SlowEngine(tmp))
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    for i in range(10):
+        store.post_message(c.id_, Message(body=str(i)))
+
+    assert store.archive(keep_last=5) == 5
+    assert SlowEngine.posted == [10]
+    assert store.load_message(c.id_, 10).body == "new"
+
+
+def test_archiver(tmp: Path):
+    """Test background archival with `Archiver`."""
+    store = MessageStore(tmp)
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    for i in range(10):
+        store.post_message(c.id_, Message(body=str(i)))
+
+    archiver = Archiver(store, 0.01, keep_last=2)
+    archiver.start()
+    sleep(0.2)
+    archiver.stop()
+    assert len(list((tmp / c.id_).glob("*.json"))) == 3
+    assert store.load_message(c.id_, 0).body == "0"
+
+
+def test_warm_up(tmp: Path, fake_conversation):
+    """Test cache warm-up with `WarmUp`."""
+    cs = [fake_conversation(tmp) for _ in range(10)]
+    store = MessageStore(tmp)
+    reported = []
+    warm_up = WarmUp(
+        store,
+        conversations=8,
+        active_conversations=2,
+        messages=1,
+        threads=3,
+        callback=reported.append,
+    )
+    warm_up.start()
+    assert warm_up.wait(5)
+    assert warm_up.ready
+    assert warm_up.status.json == {"done": 8, "total": 8, "ready": True}
+    assert reported[-1].ready
+
+    stats = store.cache_stats
+    assert stats["conversations"]["entries"] == 8
+    assert stats["messages"]["entries"] == 2
+    latest = max(cs, key=lambda c: c.last_modified)
+    assert latest.length - 1 in store.load_conversation(latest.id_).messages
+
+
+def test_message_store_lock_striping(tmp: Path):
+    """Test lock striping and instrumentation of `MessageStore`."""
+    store = MessageStore(tmp, lock_stripes=4, lock_instrumentation=True)
+    for i in range(100):
+        assert store.post_message(f"unknown-{i}", Message(body="a")) is None
+
+    # conversations in different stripes can be locked concurrently
+    # pylint: disable=protected-access
+    a = "c-a"
+    b = next(
+        f"c-{i}"
+        for i in range(100)
+        if store._stripe(f"c-{i}") is not store._stripe(a)
+    )
+    results = {}
+
+    def try_lock():
+        for cid in (a, b):
+            stripe = store._stripe(cid)
+            results[cid] = stripe.acquire(timeout=0.1)
+            if results[cid]:
+                stripe.release()
+
+    with store._lock(a, "test"):
+        t = Thread(target=try_lock)
+        t.start()
+        t.join()
+    # pylint: enable=protected-access
+    assert results == {a: False, b: True}
+
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+
+    def post():
+        for _ in range(20):
+            store.post_message(c.id_, Message(body="a"))
+            store.load_messages(c.id_, -5)
+
+    threads = [Thread(target=post) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = store.lock_stats
+    assert stats["post_message"]["acquisitions"] == 180
+    assert stats["load_messages"]["acquisitions"] == 80
+    assert stats["post_message"]["waitMax"] >= 0
+    assert store.load_conversation(c.id_).length == 80
+    assert MessageStore(tmp).lock_stats is None
+
+
+def test_message_store_post_messages(tmp: Path):
+    """Test posting multiple messages with `MessageStore.post_messages`."""
+    store = MessageStore(tmp)
+    c = Conversation("0.0.0.0", "c-0")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    assert store.post_messages(
+        c.id_, [Message(body="a"), Message(body="b")]
+    ) == [0, 1]
+    assert store.post_messages(
+        c.id_, [Message(5, body="c")], cache=False
+    ) == [5]
+    assert 5 not in c.messages
+    assert c.length == 6
+    assert store.post_messages("unknown", [Message(body="a")]) is None
+
+    store = MessageStore(tmp)
+    assert store.load_conversation(c.id_).length == 6
+    assert [m.body for m in store.load_messages(c.id_)] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize(
+    "engine", [DirectoryEngine, SegmentEngine, SQLiteEngine]
+)
+def test_export_import_ndjson(tmp: Path, fake_conversation, engine):
+    """Test NDJSON-export and -import."""
+    cs = [fake_conversation(tmp / "source") for _ in range(3)]
+    source = MessageStore(tmp / "source")
+    lines = list(export_ndjson(source, chunk_size=2))
+    assert loads(lines[0])["type"] == "header"
+    assert len(lines) == 1 + 3 + sum(c.length for c in cs)
+
+    target = MessageStore(tmp / "target", engine=engine(tmp / "target"))
+    stats = import_ndjson(target, iter(lines), batch_size=2)
+    assert stats.json == {
+        "conversations": 3,
+        "messages": sum(c.length for c in cs),
+        "skippedConversations": 0,
+        "skippedMessages": 0,
+        "attachments": 0,
+    }
+    target = MessageStore(tmp / "target", engine=engine(tmp / "target"))
+    for c in cs:
+        assert target.load_conversation(c.id_).json == c.json
+        assert [m.json for m in target.load_messages(c.id_)] == [
+            m.json for m in source.load_messages(c.id_)
+        ]
+    assert list(export_ndjson(target, [cs[0].id_]))[1:] == list(
+        export_ndjson(source, [cs[0].id_])
+    )[1:]
+
+    # existing conversations are skipped
+    assert import_ndjson(target, lines).skipped_conversations == 3
+    with pytest.raises(ValueError):
+        import_ndjson(target, [b'{"type": "conversation"}\n'])
+
+
+def test_export_import_ndjson_attachments(tmp: Path):
+    """Test NDJSON-export and -import of attachment data."""
+    source = MessageStore(tmp / "source")
+    c = Conversation("0.0.0.0", "c")
+    source.set_conversation_path(c)
+    source.create_conversation(c)
+    id_, size = source.attachments.put(BytesIO(b"data"))
+    for _ in range(2):
+        source.post_message(
+            c.id_, Message(None, "a", attachments=[Attachment(id_, size)])
+        )
+    source.post_message(
+        c.id_, Message(None, "b", attachments=[Attachment("0" * 64, 1)])
+    )
+
+    lines = list(export_ndjson(source))
+    assert [loads(line)["type"] for line in lines].count("attachment") == 1
+    assert not any(
+        loads(line)["type"] == "attachment"
+        for line in export_ndjson(source, attachments=False)
+    )
+
+    target = MessageStore(tmp / "target")
+    assert import_ndjson(target, lines).attachments == 1
+    with target.attachments.open(id_) as f:
+        assert f.read() == b"data"
+
+    # large attachments are exported in chunks and streamed on import
+    data = bytes(range(256)) * 1024
+    large, size = source.attachments.put(BytesIO(data))
+    source.post_message(
+        c.id_, Message(None, "c", attachments=[Attachment(large, size)])
+    )
+    lines = list(export_ndjson(source))
+    chunks = [
+        loads(line)
+        for line in lines
+        if loads(line)["type"] == "attachment" and loads(line)["id"] == large
+    ]
+    assert len(chunks) > 1
+    assert [chunk["final"] for chunk in chunks] == [False] * (
+        len(chunks) - 1
+    ) + [True]
+    target = MessageStore(tmp / "target-2")
+    stats = import_ndjson(target, lines)
+    assert stats.attachments == 2
+    assert stats.messages == 4
+    with target.attachments.open(large) as f:
+        assert f.read() == data
+
+    # interrupted chunk-sequence
+    interrupted = [
+        line
+        for line in lines
+        if not (
+            loads(line)["type"] == "attachment"
+            and loads(line)["id"] == large
+            and loads(line)["final"]
+        )
+    ]
+    target = MessageStore(tmp / "target-3")
+    stats = import_ndjson(target, interrupted)
+    assert stats.attachments == 1
+    assert stats.messages == 4
+    assert not target.attachments.exists(large)
+
+    # records of version 1 contain the complete data
+    target = MessageStore(tmp / "target-4")
+    header = {"type": "header", "format": "peerChat-ndjson", "version": 1}
+    encoded = b64encode(b"data").decode()
+    record = {"type": "attachment", "id": id_, "data": encoded}
+    import_ndjson(
+        target,
+        [dumps(header).encode() + b"\n", dumps(record).encode() + b"\n"],
+    )
+    assert target.attachments.exists(id_)
+
+
+def test_change_journal(tmp: Path):
+    """Test `ChangeJournal`."""
+    journal = ChangeJournal(tmp, max_size=100)
+    assert journal.cursor() == (0, 0)
+    for i in range(10):
+        journal.record("c", i)
+    journal.record("c", deleted=True)
+    cursor = journal.cursor()
+    assert len(journal.generations()) > 1
+    records = list(journal.read((0, 0), cursor))
+    assert [r.get("mid") for r in records[:10]] == list(range(10))
+    assert records[-1] == {"cid": "c", "deleted": True}
+
+    # incomplete record is not included
+    with open(journal.generation_path(cursor[0]), "ab") as f:
+        f.write(b'{"cid": "c", "mi')
+    assert journal.cursor() == cursor
+    journal.record("c")
+    assert list(journal.read(cursor, journal.cursor())) == []
+
+    journal.prune(cursor)
+    assert journal.generations() == [cursor[0]]
+
+    # records are visible to other instances without closing the journal
+    cursor = journal.cursor()
+    with journal.batch():
+        journal.record("c", 10)
+        journal.record("c", 11)
+    journal.record("c", 12)
+    reopened = ChangeJournal(tmp, max_size=100)
+    assert [
+        r["mid"] for r in reopened.read(cursor, reopened.cursor())
+    ] == [10, 11, 12]
+
+
+def test_change_journal_opt_in(tmp: Path):
+    """Test that `ChangeJournal` only records changes once enabled."""
+    journal = ChangeJournal(tmp / "journal", interval=0.1)
+    assert not journal.enabled
+    journal.record("c", 0)
+    assert not (tmp / "journal").exists()
+    assert journal.cursor() == (0, 0)
+
+    # enabled by another instance (e.g. in another process)
+    other = ChangeJournal(tmp / "journal")
+    other.enable()
+    assert other.enabled
+    sleep(0.2)
+    journal.record("c", 1)
+    assert [r["mid"] for r in other.read((0, 0), journal.cursor())] == [1]
+
+
+def test_backup_and_restore(tmp: Path, fake_conversation):
+    """Test incremental snapshots and restoring them."""
+    cs = [fake_conversation(tmp / "data") for _ in range(3)]
+    store = MessageStore(tmp / "data")
+    assert not store.changes.enabled
+    full = create_snapshot(store, tmp / "backup")
+    assert store.changes.enabled
+    assert not full.incremental
+    assert full.conversations == 3
+    assert full.messages == sum(c.length for c in cs)
+
+    # changes
+    store.post_message(cs[0].id_, Message(body="new"))
+    c = store.load_conversation(cs[1].id_)
+    c.name = "renamed"
+    store.write(c.id_)
+    store.delete_conversation(store.load_conversation(cs[2].id_))
+    c3 = Conversation("0.0.0.0", "c-3")
+    store.set_conversation_path(c3)
+    store.create_conversation(c3)
+    store.post_message(c3.id_, Message(body="c3"))
+
+    incremental = create_snapshot(store, tmp / "backup")
+    assert incremental.incremental
+    assert incremental.conversations == 3
+    assert incremental.messages == 2
+    assert incremental.deletions == 1
+    id_, size = store.attachments.put(BytesIO(b"data"))
+    store.post_message(
+        c3.id_, Message(body="a", attachments=[Attachment(id_, size)])
+    )
+    with_attachment = create_snapshot(store, tmp / "backup")
+    assert with_attachment.messages == 1
+    assert with_attachment.attachments == 1
+    empty = create_snapshot(store, tmp / "backup")
+    assert (empty.conversations, empty.messages) == (0, 0)
+    assert [s.id_ for s in list_snapshots(tmp / "backup")] == [1, 2, 3, 4]
+
+    restored = MessageStore(tmp / "restored")
+    assert restore_snapshots(restored, tmp / "backup").attachments == 1
+    assert restored.attachments.exists(id_)
+    assert sorted(restored.list_conversations()) == sorted(
+        store.list_conversations()
+    )
+    for cid in store.list_conversations():
+        assert restored.load_conversation(cid).json == (
+            store.load_conversation(cid).json
+        )
+        assert [m.json for m in restored.load_messages(cid)] == [
+            m.json for m in store.load_messages(cid)
+        ]
+
+    # restore up to first snapshot
+    restored = MessageStore(tmp / "restored-1")
+    restore_snapshots(restored, tmp / "backup", until=1)
+    assert sorted(restored.list_conversations()) == sorted(
+        c.id_ for c in cs
+    )
+    with pytest.raises(ValueError):
+        restore_snapshots(MessageStore(tmp / "x"), tmp / "missing")
+
+
+def test_message_store_load_conversations_paginated(tmp: Path):
+    """Test sorted, paginated listing of conversations."""
+    store = MessageStore(tmp)
+    cs = []
+    for i in range(25):
+        c = Conversation(
+            "0.0.0.0", f"c-{i}", last_modified=datetime(2025, 1, 1 + i % 5)
+        )
+        store.set_conversation_path(c)
+        store.create_conversation(c)
+        cs.append(c)
+    expected = [
+        c.id_
+        for c in sorted(
+            cs, key=lambda c: (c.last_modified, c.id_), reverse=True
+        )
+    ]
+
+    def collect(store_, limit):
+        ids, cursor = [], None
+        while True:
+            page, cursor = store_.load_conversations(limit, cursor)
+            ids.extend(c.id_ for c in page)
+            if cursor is None:
+                return ids
+
+    assert collect(store, 10) == expected
+    assert collect(store, 25) == expected
+
+    # update moves conversation to the front
+    c = store.load_conversation(expected[-1])
+    c.last_modified = datetime(2026, 1, 1)
+    store.write(c.id_)
+    assert store.load_conversations(1)[0][0].id_ == c.id_
+
+    # index is restored from catalog and follows deletions
+    store.delete_conversation(store.load_conversation(expected[0]))
+    store = MessageStore(tmp)
+    assert collect(store, 7) == [c.id_] + expected[1:-1]
+    assert store.load_conversations(5, "bad-cursor") == ([], None)
+
+
+@pytest.mark.parametrize("backend", codec.BACKENDS)
+def test_codec(tmp: Path, fake_conversation, backend):
+    """Test `codec`-backends and their compatibility."""
+    previous = codec.BACKEND
+    try:
+        assert codec.use(backend) == backend
+        obj = {"a": [1, 2.5, None, True], "b": "äö\n", "c": {"d": "e"}}
+        assert codec.loads(codec.dumps(obj)) == obj
+        assert codec.loads(codec.dumpb(obj)) == obj
+        assert codec.dumpl(obj) == codec.dumpb(obj) + b"\n"
+        assert loads(codec.dumps(obj)) == obj
+        assert codec.loads(dumps(obj)) == obj
+        assert codec.dumps({"b": 1, "a": 2}, sort_keys=True).index(
+            '"a"'
+        ) < codec.dumps({"b": 1, "a": 2}, sort_keys=True).index('"b"')
+        assert codec.dumps({"a": datetime(2026, 1, 1)}, default=str) in (
+            '{"a": "2026-01-01 00:00:00"}',
+            '{"a":"2026-01-01 00:00:00"}',
+        )
+        if backend == "json":
+            assert codec.dumps(obj) == dumps(obj)
+        with pytest.raises(codec.JSONDecodeError):
+            codec.loads(b"{")
+
+        # data written with this backend can be read with the others
+        c = fake_conversation(tmp / backend)
+        store = MessageStore(tmp / backend)
+        mid = store.post_message(c.id_, Message(None, "äö"))
+        store.close()
+        for other in codec.BACKENDS:
+            codec.use(other)
+            store = MessageStore(tmp / backend)
+            assert store.load_message(c.id_, mid).body == "äö"
+            assert store.load_conversation(c.id_).name == c.name
+            store.close()
+    finally:
+        codec.use(previous)
+
+    with pytest.raises(ValueError):
+        codec.use("unknown")
+
+
+def test_message_store_dedup(tmp: Path, fake_conversation):
+    """Test deduplication of messages by key in `MessageStore`."""
+    c = fake_conversation(tmp)
+    store = MessageStore(tmp, dedup_keys=3)
+    length = store.load_conversation(c.id_).length
+
+    mid = store.post_message(c.id_, Message(None, "a", key="key-a"))
+    assert mid == length
+    assert store.post_message(c.id_, Message(None, "a", key="key-a")) == mid
+    assert store.load_conversation(c.id_).length == length + 1
+    assert store.lookup_message_key(c.id_, "key-a") == mid
+    assert store.lookup_message_key(c.id_, "unknown") is None
+
+    # batches (including duplicates within the batch)
+    assert store.post_messages(
+        c.id_,
+        [
+            Message(None, "a", key="key-a"),
+            Message(None, "b", key="key-b"),
+            Message(None, "b", key="key-b"),
+            Message(None, "c"),
+        ],
+    ) == [mid, mid + 1, mid + 1, mid + 2]
+    assert store.load_conversation(c.id_).length == length + 3
+
+    # persisted and bounded
+    for i in range(10):
+        store.post_message(c.id_, Message(None, key=f"key-{i}"))
+    store = MessageStore(tmp, dedup_keys=3)
+    assert store.lookup_message_key(c.id_, "key-9") == length + 12
+    assert store.lookup_message_key(c.id_, "key-6") is None
+    assert store.lookup_message_key(c.id_, "key-a") is None
+    assert len((tmp / ".dedup" / f"{c.id_}.jsonl").read_bytes().split()) <= 6
+
+    # removed with conversation
+    store.delete_conversation(store.load_conversation(c.id_))
+    assert not (tmp / ".dedup" / f"{c.id_}.jsonl").exists()
+
+
+def test_attachment_store(tmp: Path):
+    """Test content-addressed `AttachmentStore`."""
+    store = AttachmentStore(tmp, chunk_size=4)
+    data = b"some attachment data"
+    id_, size = store.put(BytesIO(data))
+    assert id_ == sha256(data).hexdigest()
+    assert size == len(data)
+    assert store.exists(id_)
+    assert store.size(id_) == len(data)
+    with store.open(id_) as f:
+        assert f.read() == data
+
+    # deduplicated
+    assert store.put(BytesIO(data), expected=id_) == (id_, size)
+    assert list(store.ids()) == [id_]
+
+    with pytest.raises(ValueError):
+        store.put(BytesIO(b"other data"), expected=id_)
+    with pytest.raises(ValueError):
+        store.put(BytesIO(b"other data"), max_size=5)
+    with pytest.raises(ValueError):
+        store.path("../x")
+    assert list(store.ids()) == [id_]
+    assert not list((tmp / ".tmp").iterdir())
+
+    store.delete(id_)
+    assert not store.exists(id_)
+    assert store.size(id_) is None
+
+    # pending attachments
+    id_, size = store.put(BytesIO(data), pending=True)
+    other, _ = store.put(BytesIO(b"other data"), pending=True)
+    assert store.pending_size == size + len(b"other data")
+    store.claim([id_])
+    assert store.pending_size == len(b"other data")
+    assert store.expire(3600) == []
+    assert store.expire(0) == [other]
+    assert store.pending_size == 0
+    assert list(store.ids()) == [id_]
+
+
+def test_fsck_repair_unloadable(tmp: Path):
+    """Test repair of conversations with messages that cannot be loaded."""
+    store = MessageStore(tmp)
+    c = Conversation("peer", "c")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    store.post_message(c.id_, Message(None, "a", MessageStatus.SENDING))
+
+    sending = FsckIssue(c.id_, "sending", "", fixable=True)
+    issues = _repair(
+        store,
+        ConversationCheck(
+            c.id_, issues=[sending], requeue=[0, 5], queued_messages=[0, 5]
+        ),
+    )
+    assert [(i.cid, i.kind, i.fixable) for i in issues] == [
+        (c.id_, "message", False)
+    ]
+    assert store.load_message(c.id_, 0).status == MessageStatus.QUEUED
+    assert store.load_conversation(c.id_).queued_messages == [0]
+    # only the repaired message is reported as fixed
+    assert sending.fixed
+    assert sending.detail.startswith("1 message(s)")
+
+    sending = FsckIssue(c.id_, "sending", "", fixable=True)
+    _repair(store, ConversationCheck(c.id_, issues=[sending], requeue=[5]))
+    assert not sending.fixed
+
+    issues = _repair(store, ConversationCheck("unknown", requeue=[0]))
+    assert [(i.cid, i.kind) for i in issues] == [("unknown", "metadata")]
+
+
+def test_message_attachments_de_serialization():
+    """Test (de-)serialization of `Message` with attachments."""
+    m = Message(
+        0,
+        "text",
+        attachments=[
+            Attachment("0" * 64, 1, name="a.txt", type_="text/plain"),
+            Attachment("1" * 64, 2),
+        ],
+    )
+    assert Message.from_json(loads(dumps(m.json))) == m
+    assert "attachments" not in Message(0, "text").json
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_fsck(tmp: Path, jobs):
+    """Test consistency check and repair with `fsck`."""
+    store = MessageStore(tmp)
+    c, ok = Conversation("peer", "c"), Conversation("peer", "ok")
+    for c_ in (c, ok):
+        store.set_conversation_path(c_)
+        store.create_conversation(c_)
+        for _ in range(3):
+            store.post_message(c_.id_, Message(None, "text", MessageStatus.OK))
+    id_, size = store.attachments.put(BytesIO(b"data"))
+    store.post_message(
+        c.id_,
+        Message(None, "a", attachments=[Attachment(id_, size)]),
+    )
+    store.attachments.put(BytesIO(b"unreferenced"))
+    store.close()
+
+    # simulate crash: message written but metadata outdated, message
+    # stuck in 'sending', and queue out of sync
+    index = loads((tmp / c.id_ / "index.json").read_text(encoding="utf-8"))
+    length = index["length"]
+    index["length"] = length - 2
+    index["queuedMessages"] = [0]
+    (tmp / c.id_ / "index.json").write_text(dumps(index), encoding="utf-8")
+    m = loads((tmp / c.id_ / "1.json").read_text(encoding="utf-8"))
+    m["status"] = "sending"
+    (tmp / c.id_ / "1.json").write_text(dumps(m), encoding="utf-8")
+
+    report = fsck(tmp, jobs=jobs, dry_run=True)
+    assert report.conversations == 2
+    assert not report.clean
+    kinds = {(issue.cid, issue.kind) for issue in report.issues}
+    assert kinds == {
+        (c.id_, "length"),
+        (c.id_, "sending"),
+        (c.id_, "queued"),
+        (None, "catalog"),
+        (None, "attachment"),
+    }
+    assert all(issue.fixable and not issue.fixed for issue in report.issues)
+    assert (
+        loads((tmp / c.id_ / "index.json").read_text(encoding="utf-8"))
+        == index
+    )
+
+    # catalog is updated along with the repaired conversation
+    report = fsck(tmp, jobs=jobs)
+    assert report.clean
+    assert len(report.issues) == 4
+    store = MessageStore(tmp)
+    c = store.load_conversation(c.id_)
+    assert c.length == length
+    assert c.queued_messages == [1]
+    assert store.load_message(c.id_, 1).status == MessageStatus.QUEUED
+    assert next(
+        e for e in store.list_catalog() if e.id_ == c.id_
+    ).queued_messages == 1
+    assert list(store.attachments.ids()) == [id_]
+    assert store.load_conversation(ok.id_).length == ok.length
+
+    report = fsck(tmp, jobs=jobs)
+    assert report.clean
+    assert not report.issues
+    assert report.messages == c.length + ok.length
+
+    # dry run does not rebuild a missing catalog
+    (tmp / ".catalog").unlink()
+    report = fsck(tmp, jobs=jobs, dry_run=True)
+    assert [(i.kind, i.detail) for i in report.issues] == [
+        ("catalog", "Missing catalog.")
+    ]
+    assert not (tmp / ".catalog").exists()
+
+
+def test_peer_client():
+    """Test sessions of `PeerClient` being reused per peer."""
+    client = PeerClient(pool_size=2, max_peers=2)
+
+    a = client._session("http://peer-a:27182/api/v0/message")
+    assert client._session("http://peer-a:27182/api/v0/ping") is a
+    assert client._session("https://peer-a:27182/api/v0/ping") is not a
+    assert client.peers == 2
+    assert a.get_adapter("http://peer-a:27182")._pool_maxsize == 2
+
+    # least recently used peer is dropped
+    client._session("http://peer-a:27182")
+    client._session("http://peer-b:27182")
+    assert client.peers == 2
+    assert client._session("http://peer-a:27182") is a
+
+    client.close()
+    assert client.peers == 0
+
+
+def test_inform_peers(tmp: Path):
+    """Test concurrent update-notifications with deadline."""
+    store = MessageStore(tmp)
+    for i in range(20):
+        c = Conversation(f"http://slow-{i}", "slow")
+        store.set_conversation_path(c)
+        store.create_conversation(c)
+    for peer in ["http://ok", "http://offline"]:
+        c = Conversation(peer, peer)
+        store.set_conversation_path(c)
+        store.create_conversation(c)
+
+    class FakeClient:
+        """Fake for `PeerClient`."""
+
+        def post(self, url, **kwargs):
+            """Simulates peers."""
+            if url.startswith("http://slow"):
+                sleep(1)
+            if url.startswith("http://offline"):
+                raise requests.exceptions.ConnectionError()
+            response = requests.Response()
+            response.status_code = 200
+            return response
+
+    start = perf_counter()
+    report = inform_peers(
+        store, User("me", address="http://me"), FakeClient(), deadline=0.5
+    )
+    assert perf_counter() - start < 0.9
+    assert report.peers["http://ok"] == "ok"
+    assert report.peers["http://offline"] == "failed"
+    assert report.json["timeout"] == 20
+    assert report.json["ok"] == 1
+    assert report.json["failed"] == 1
+
+
+def test_delivery_worker(tmp: Path):
+    """Test background delivery with backoff."""
+    store = MessageStore(tmp)
+    c = Conversation("http://peer", "c")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    mids = [
+        store.post_message(c.id_, Message(body=str(i))) for i in range(3)
+    ]
+
+    class FakeClient:
+        """Fake for `PeerClient` (first attempts fail)."""
+
+        def __init__(self):
+            self.attempts = []
+
+        def features(self, peer):
+            """Peer does not support batches."""
+            return set()
+
+        def post(self, url, **kwargs):
+            """Simulates peer."""
+            self.attempts.append(perf_counter())
+            if len(self.attempts) < 3:
+                raise requests.exceptions.ConnectionError()
+            return requests.Response()
+
+    class FakeSocket:
+        """Fake for `SocketIO`."""
+
+        def __init__(self):
+            self.events = []
+
+        def emit(self, event, data):
+            """Records event."""
+            self.events.append((event, data))
+
+    client = FakeClient()
+    socket = FakeSocket()
+    worker = DeliveryWorker(
+        store,
+        User("me"),
+        socket,
+        client,
+        threads=2,
+        base_delay=0.1,
+    )
+    worker.start()
+    for mid in mids:
+        assert worker.submit(c.id_, mid)
+    assert not worker.submit(c.id_, 10)
+    assert c.queued_messages == mids
+
+    for _ in range(50):
+        if not worker.pending:
+            break
+        sleep(0.1)
+    worker.stop()
+
+    assert not worker.pending
+    assert not c.queued_messages
+    assert all(
+        store.load_message(c.id_, mid).status == MessageStatus.OK
+        for mid in mids
+    )
+    # exponential backoff (with jitter) between failed attempts
+    assert client.attempts[1] - client.attempts[0] >= 0.05
+    assert client.attempts[2] - client.attempts[1] >= 0.1
+    assert len(client.attempts) == 5
+    # status updates
+    assert [
+        data["message"]["status"]
+        for event, data in socket.events
+        if event == "update-message" and data["message"]["id"] == mids[0]
+    ] == ["queued", "sending", "queued", "sending", "queued", "sending", "ok"]
+
+
+def test_push_attachments_features(tmp: Path):
+    """Test that attachments are only pushed to supporting peers."""
+    store = MessageStore(tmp)
+    id_, size = store.attachments.put(BytesIO(b"data"))
+    m = Message(body="a", attachments=[Attachment(id_, size)])
+
+    class FakeClient:
+        """Fake for `PeerClient`."""
+
+        def __init__(self, features):
+            self._features = features
+            self.requests = []
+
+        def features(self, peer):
+            """Returns configured features."""
+            return self._features
+
+        def timeout(self, url):
+            """Returns fixed timeout."""
+            return 2
+
+        def head(self, url, **kwargs):
+            """Simulates peer without the attachment."""
+            self.requests.append(("HEAD", url))
+            response = requests.Response()
+            response.status_code = 404
+            return response
+
+        def put(self, url, **kwargs):
+            """Simulates peer."""
+            self.requests.append(("PUT", url))
+            response = requests.Response()
+            response.status_code = 201
+            return response
+
+    client = FakeClient(set())
+    push_attachments("http://peer", m, store, client)
+    assert not client.requests
+
+    client = FakeClient({"attachments"})
+    push_attachments("http://peer", m, store, client)
+    assert [method for method, _ in client.requests] == ["HEAD", "PUT"]
+
+
+def test_delivery_worker_batch(tmp: Path):
+    """Test background delivery of batches."""
+    store = MessageStore(tmp)
+    c = Conversation("http://peer", "c")
+    store.set_conversation_path(c)
+    store.create_conversation(c)
+    mids = [
+        store.post_message(c.id_, Message(body=str(i))) for i in range(5)
+    ]
+
+    class FakeClient:
+        """Fake for `PeerClient`."""
+
+        def __init__(self):
+            self.requests = []
+
+        def features(self, peer):
+            """Peer supports batches."""
+            return {"message-batch"}
+
+        def timeout(self, url):
+            """Returns fixed timeout."""
+            return 2
+
+        def post(self, url, **kwargs):
+            """Simulates peer."""
+            self.requests.append((url, loads(kwargs["data"])))
+            response = requests.Response()
+            response.status_code = 200
+            return response
+
+    class FakeSocket:
+        """Fake for `SocketIO`."""
+
+        def emit(self, event, data):
+            """Ignores event."""
+
+    client = FakeClient()
+    worker = DeliveryWorker(
+        store, User("me"), FakeSocket(), client, batch_size=4
+    )
+    for mid in mids:
+        assert worker.submit(c.id_, mid)
+    worker.start()
+    for _ in range(50):
+        if not worker.pending:
+            break
+        sleep(0.1)
+    worker.stop()
+
+    assert not c.queued_messages
+    # batch of four, followed by single message
+    assert [url for url, _ in client.requests] == [
+        "http://peer/api/v0/messages",
+        "http://peer/api/v0/message",
+    ]
+    assert [m["body"] for m in client.requests[0][1]["msgs"]] == [
+        "0",
+        "1",
+        "2",
+        "3",
+    ]
+    assert all(
+        store.load_message(c.id_, mid).status == MessageStatus.OK
+        for mid in mids
+    )
+
+
+def test_peer_client_circuit_breaker():
+    """Test health-tracking and circuit breaker of `PeerClient`."""
+    client = PeerClient(failure_threshold=2, reset_timeout=0.2)
+    peer = "http://127.0.0.1:9"
+
+    assert client.timeout(peer) == client.max_timeout
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError) as exc_info:
+            client.post(peer + "/api/v0/message")
+        assert not isinstance(exc_info.value, PeerUnavailable)
+    assert client.health[peer]["failures"] == 2
+    assert client.health[peer]["state"] == "open"
+
+    # fail immediately while open
+    with pytest.raises(PeerUnavailable):
+        client.post(peer + "/api/v0/message")
+
+    # failed probe re-opens circuit
+    sleep(0.25)
+    assert client.health[peer]["state"] == "half-open"
+    with pytest.raises(requests.exceptions.ConnectionError) as exc_info:
+        client.post(peer + "/api/v0/message")
+    assert not isinstance(exc_info.value, PeerUnavailable)
+    assert client.health[peer]["state"] == "open"
+
+    client.reset(peer)
+    assert client.health[peer]["state"] == "closed"
+    assert client.health[peer]["failures"] == 0
+
+
+def test_peer_health_rtt():
+    """Test round-trip time-estimate of `PeerHealth`."""
+    health = PeerHealth()
+    health.sample(0.1)
+    assert health.srtt == pytest.approx(0.1)
+    assert health.rttvar == pytest.approx(0.05)
+    for _ in range(100):
+        health.sample(0.02)
+    assert health.srtt == pytest.approx(0.02, abs=1e-3)
+    assert health.rttvar == pytest.approx(0, abs=1e-3)
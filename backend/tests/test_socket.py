@@ -2,6 +2,9 @@
 
 from pathlib import Path
 from uuid import uuid4
+from time import sleep
+from hashlib import sha256
+from json import loads
 
 import pytest
 from flask import Flask
@@ -67,6 +70,31 @@ def test_list_conversations(
     assert socket_client.emit("list-conversations", callback=True) == [c.id_]
 
 
+def test_inform_peers(
+    clients: tuple[Flask, SocketIO],
+    testing_config: AppConfig,
+    fake_conversation,
+):
+    """Test 'inform-peers'-event."""
+    _, socket_client = clients
+
+    c = fake_conversation(
+        testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+    )
+    socket_client.get_received()
+    socket_client.emit("inform-peers")
+    for _ in range(50):
+        events = [
+            event
+            for event in socket_client.get_received()
+            if event["name"] == "peers-informed"
+        ]
+        if events:
+            break
+        sleep(0.1)
+    assert list(events[0]["args"][0]["peers"]) == [c.peer]
+
+
 def test_get_conversation_unknown(clients: tuple[Flask, SocketIO]):
     """Test 'get-conversation'-event for unknown conversation."""
     _, socket_client = clients
@@ -148,6 +176,30 @@ def test_get_message(
     )
 
 
+def test_get_messages(
+    clients: tuple[Flask, SocketIO],
+    testing_config: AppConfig,
+    fake_conversation,
+):
+    """Test 'get-messages'-event."""
+    _, socket_client = clients
+
+    c = fake_conversation(
+        testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+    )
+
+    assert socket_client.emit("get-messages", c.id_, callback=True) == [
+        c.messages[mid].json for mid in range(c.length)
+    ]
+    assert socket_client.emit(
+        "get-messages", c.id_, -1, None, callback=True
+    ) == [c.messages[c.length - 1].json]
+    assert (
+        socket_client.emit("get-messages", "unknown-id", 0, 1, callback=True)
+        == []
+    )
+
+
 def test_post_message_minimal(
     clients: tuple[Flask, SocketIO],
     testing_config: AppConfig,
@@ -279,6 +331,81 @@ def test_api_post_message_new_conversation(clients: tuple[Flask, SocketIO]):
     )
 
 
+def test_api_post_message_duplicate(clients: tuple[Flask, SocketIO]):
+    """Test API-endpoint for POST-/message with repeated delivery."""
+    flask_client, socket_client = clients
+
+    cid = str(uuid4())
+    m = Message(body="text", key=uuid4().hex)
+
+    for _ in range(3):
+        response = flask_client.post(
+            "/api/v0/message", json={"cid": cid, "msg": m.json}
+        )
+        assert response.status_code == 200
+        assert response.text == cid
+    assert (
+        socket_client.emit("get-conversation", cid, callback=True)["length"]
+        == 1
+    )
+    assert (
+        socket_client.emit("get-message", cid, 0, callback=True)["key"]
+        == m.key
+    )
+
+    # different key is processed
+    m.key = uuid4().hex
+    flask_client.post("/api/v0/message", json={"cid": cid, "msg": m.json})
+    assert (
+        socket_client.emit("get-conversation", cid, callback=True)["length"]
+        == 2
+    )
+
+
+def test_api_post_messages(clients: tuple[Flask, SocketIO]):
+    """Test API-endpoint for POST-/messages."""
+    flask_client, socket_client = clients
+
+    cid = str(uuid4())
+    ms = [Message(body=str(i), key=uuid4().hex) for i in range(3)]
+
+    assert (
+        flask_client.post(
+            "/api/v0/messages", json={"cid": cid, "msgs": []}
+        ).status_code
+        == 422
+    )
+    socket_client.get_received()
+    for _ in range(2):
+        response = flask_client.post(
+            "/api/v0/messages",
+            json={"cid": cid, "msgs": [m.json for m in ms]},
+        )
+        assert response.status_code == 200
+        assert response.text == cid
+
+    # single, coalesced event
+    events = [
+        event
+        for event in socket_client.get_received()
+        if event["name"] == "update-messages"
+    ]
+    assert len(events) == 1
+    assert [m["body"] for m in events[0]["args"][0]["messages"]] == [
+        "0",
+        "1",
+        "2",
+    ]
+    assert (
+        socket_client.emit("get-conversation", cid, callback=True)["length"]
+        == 3
+    )
+    assert (
+        socket_client.emit("get-message", cid, 2, callback=True)["status"]
+        == "ok"
+    )
+
+
 def test_api_post_message_change_peer(clients: tuple[Flask, SocketIO]):
     """Test API-endpoint for POST-/message with peer-address update."""
     flask_client, socket_client = clients
@@ -338,6 +465,23 @@ def test_send_message(
 
     assert socket_client.emit("send-message", cid, mid, callback=True)
 
+    # wait for delivery in the background
+    for _ in range(50):
+        if (
+            socket_client.emit("get-message", cid, mid, callback=True)[
+                "status"
+            ]
+            == "ok"
+        ):
+            break
+        sleep(0.1)
+    assert (
+        socket_client.emit("get-message", cid, mid, callback=True)["status"]
+        == "ok"
+    )
+    assert not socket_client.emit("get-conversation", cid, callback=True)[
+        "queuedMessages"
+    ]
     assert (
         AnotherConfig.WORKING_DIRECTORY / AnotherConfig.DATA_DIRECTORY / cid
     ).exists()
@@ -353,3 +497,188 @@ def test_send_message(
         / cid
         / "0.json"
     ).is_file()
+
+
+def test_api_attachments(clients: tuple[Flask, SocketIO]):
+    """Test API-endpoints for HEAD- and PUT-/attachments/<id>."""
+    flask_client, _ = clients
+
+    data = b"attachment data"
+    id_ = sha256(data).hexdigest()
+    assert flask_client.head(f"/api/v0/attachments/{id_}").status_code == 404
+    assert (
+        flask_client.put(f"/api/v0/attachments/{id_}", data=b"other")
+    ).status_code == 400
+    assert (
+        flask_client.put("/api/v0/attachments/bad-id", data=data)
+    ).status_code == 400
+    assert (
+        flask_client.put(f"/api/v0/attachments/{id_}", data=data)
+    ).status_code == 201
+    assert (
+        flask_client.put(f"/api/v0/attachments/{id_}", data=data)
+    ).status_code == 200
+    response = flask_client.head(f"/api/v0/attachments/{id_}")
+    assert response.status_code == 200
+    assert response.content_length == len(data)
+
+
+def test_api_attachments_pending(testing_config: AppConfig):
+    """Test quota and expiration of unreferenced attachment-uploads."""
+    testing_config.ATTACHMENT_PENDING_QUOTA = 15
+    app, _ = app_factory(testing_config)
+    client = app.test_client()
+    data = testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+
+    a, b, c = b"a" * 10, b"b" * 10, b"c" * 10
+    ids = [sha256(x).hexdigest() for x in (a, b, c)]
+
+    def put(id_, data_):
+        return client.put(f"/api/v0/attachments/{id_}", data=data_).status_code
+
+    assert put(ids[0], a) == 201
+    assert put(ids[1], b) == 507
+
+    # referenced attachments no longer count towards the quota
+    assert (
+        client.post(
+            "/api/v0/message",
+            json={
+                "cid": str(uuid4()),
+                "msg": {
+                    "body": "a",
+                    "attachments": [{"id": ids[0], "size": len(a)}],
+                },
+                "peer": "http://localhost:8082",
+            },
+        ).status_code
+        == 200
+    )
+    assert put(ids[1], b) == 201
+
+    # unreferenced attachments expire
+    testing_config.ATTACHMENT_PENDING_TTL = 0
+    assert put(ids[2], c) == 201
+    assert client.head(f"/api/v0/attachments/{ids[0]}").status_code == 200
+    assert client.head(f"/api/v0/attachments/{ids[1]}").status_code == 404
+    assert (data / ".attachments" / ids[2][:2] / ids[2]).is_file()
+
+
+def test_send_message_with_attachment(
+    clients: tuple[Flask, SocketIO], tmp: Path, run_app
+):
+    """Test transfer of attachments with send-message-event."""
+
+    class AnotherConfig(AppConfig):
+        WORKING_DIRECTORY = tmp / "test_send_message_with_attachment"
+
+    run_app(
+        app_factory(AnotherConfig())[0],
+        "8082",
+    )
+
+    flask_client, socket_client = clients
+
+    attachment = flask_client.post(
+        "/attachments?name=a.txt", data=b"attachment data"
+    ).json
+    cid = socket_client.emit(
+        "create-conversation",
+        "some topic",
+        "http://localhost:8082",
+        callback=True,
+    )
+    mid = socket_client.emit(
+        "post-message",
+        cid,
+        {"body": "text", "attachments": [attachment]},
+        callback=True,
+    )
+    assert socket_client.emit("send-message", cid, mid, callback=True)
+
+    data = AnotherConfig.WORKING_DIRECTORY / AnotherConfig.DATA_DIRECTORY
+    for _ in range(50):
+        if (data / cid / "0.json").is_file():
+            break
+        sleep(0.1)
+    data = AnotherConfig.WORKING_DIRECTORY / AnotherConfig.DATA_DIRECTORY
+    assert (
+        data / ".attachments" / attachment["id"][:2] / attachment["id"]
+    ).read_bytes() == b"attachment data"
+    assert (
+        loads((data / cid / "0.json").read_bytes())["attachments"]
+        == [attachment]
+    )
+
+
+def test_search(clients: tuple[Flask, SocketIO]):
+    """Test 'search'-event."""
+    _, socket_client = clients
+
+    cid = socket_client.emit("create-conversation", "c", "peer", callback=True)
+    socket_client.emit("post-message", cid, {"body": "hello world"})
+    socket_client.emit("post-message", cid, {"body": "hello"})
+
+    result = socket_client.emit("search", "hello", 0, 1, callback=True)
+    assert result["total"] == 2
+    assert len(result["hits"]) == 1
+    assert result["hits"][0]["cid"] == cid
+    assert socket_client.emit("search", "world", callback=True)["hits"][0][
+        "mid"
+    ] == 0
+
+
+def test_get_warm_up_status(testing_config: AppConfig, fake_conversation):
+    """Test 'get-warm-up-status'-event."""
+    fake_conversation(
+        testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+    )
+    key = str(uuid4())
+    (
+        testing_config.WORKING_DIRECTORY / testing_config.USER_AUTH_KEY_PATH
+    ).write_text(key, encoding="utf-8")
+    testing_config.WARM_UP = True
+    app, socket = app_factory(testing_config)
+    http_client = app.test_client()
+    http_client.set_cookie(Auth.KEY, key)
+    socket_client = socket.test_client(app=app, flask_test_client=http_client)
+
+    for _ in range(50):
+        status = socket_client.emit("get-warm-up-status", callback=True)
+        if status["ready"]:
+            break
+        sleep(0.1)
+    assert status == {"done": 1, "total": 1, "ready": True}
+
+
+def test_get_warm_up_status_disabled(clients: tuple[Flask, SocketIO]):
+    """Test 'get-warm-up-status'-event without warm-up."""
+    _, socket_client = clients
+    assert socket_client.emit("get-warm-up-status", callback=True)["ready"]
+
+
+def test_get_conversations(
+    clients: tuple[Flask, SocketIO],
+    testing_config: AppConfig,
+    fake_conversation,
+):
+    """Test 'get-conversations'-event."""
+    _, socket_client = clients
+    cs = [
+        fake_conversation(
+            testing_config.WORKING_DIRECTORY / testing_config.DATA_DIRECTORY
+        )
+        for _ in range(3)
+    ]
+
+    result = socket_client.emit("get-conversations", None, 2, callback=True)
+    assert len(result["conversations"]) == 2
+    assert result["cursor"] is not None
+    result2 = socket_client.emit(
+        "get-conversations", result["cursor"], 2, callback=True
+    )
+    assert len(result2["conversations"]) == 1
+    assert result2["cursor"] is None
+    assert sorted(
+        c["id"] for c in result["conversations"] + result2["conversations"]
+    ) == sorted(c.id_ for c in cs)
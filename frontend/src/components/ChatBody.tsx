@@ -31,31 +31,43 @@ export default function ChatBody({ conversation }: ChatBodyProps) {
     [setMessages]
   );
 
-  const pullMessage = useCallback(
-    (mid: number) =>
-      socket?.emit("get-message", conversation.id, mid, (m: Message) => {
-        if (m) pushMessage(m);
+  const pushMessages = useCallback(
+    (ms: Message[]) =>
+      setMessages((messages) => {
+        return {
+          ...messages,
+          ...Object.fromEntries(ms.map((m) => [m.id.toString(), m])),
+        };
       }),
-    [socket, pushMessage, conversation.id]
+    [setMessages]
+  );
+
+  const pullMessages = useCallback(
+    (start: number, stop: number | null) =>
+      socket?.emit(
+        "get-messages",
+        conversation.id,
+        start,
+        stop,
+        (ms: Message[]) => {
+          if (ms) pushMessages(ms);
+        }
+      ),
+    [socket, pushMessages, conversation.id]
   );
 
   const pullNMessages = useCallback(
     (n: number) => {
       const currentIndex = Math.min(...Object.keys(messages).map(Number));
-      for (let index = currentIndex; index >= currentIndex - n; index--) {
-        if (index < 0) break;
-        pullMessage(index);
-      }
+      pullMessages(Math.max(0, currentIndex - n), currentIndex);
     },
-    [messages, pullMessage]
+    [messages, pullMessages]
   );
 
   // load initial set of messages
   useEffect(() => {
-    for (let index = -1; index >= -DEFAULT_NMESSAGES; index--) {
-      pullMessage(index);
-    }
-  }, [conversation.id, pullMessage]);
+    pullMessages(-DEFAULT_NMESSAGES, null);
+  }, [conversation.id, pullMessages]);
 
   // configure socket events
   useEffect(() => {
@@ -67,11 +79,20 @@ export default function ChatBody({ conversation }: ChatBodyProps) {
         pushMessage(message);
       }
     );
+    socket?.on(
+      "update-messages",
+      ({ cid, messages }: { cid: string; messages: Message[] }) => {
+        if (cid !== conversation.id) return;
+        socket.emit("mark-conversation-read", cid);
+        pushMessages(messages);
+      }
+    );
 
     return () => {
       socket?.off("update-message");
+      socket?.off("update-messages");
     };
-  }, [conversation.id, socket, pushMessage]);
+  }, [conversation.id, socket, pushMessage, pushMessages]);
 
   // reset initial values for state if conversation changes
   useEffect(() => {
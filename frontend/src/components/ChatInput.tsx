@@ -1,8 +1,9 @@
 import { useRef, useContext, useState, useEffect } from "react";
 import { Button, Textarea } from "flowbite-react";
 
-import { SocketContext } from "../App";
+import { SocketContext, ApiUrl } from "../App";
 import Markdown from "./Markdown";
+import { Attachment, formatSize } from "./ChatMessageItem";
 
 /**
  * Returns true if the given url-string is a valid url.
@@ -23,6 +24,10 @@ export type ChatInputProps = {
 export default function ChatInput({ cid }: ChatInputProps) {
   const socket = useContext(SocketContext);
   const newMessageRef = useRef<HTMLTextAreaElement>(null);
+  const fileInputRef = useRef<HTMLInputElement>(null);
+  const [attachments, setAttachments] = useState<Attachment[]>([]);
+  const [uploading, setUploading] = useState(false);
+  const [uploadError, setUploadError] = useState<string | undefined>();
   const [messageContent, setMessageContent] = useState("");
   const [preview, setPreview] = useState(false);
   const [previewContent, setPreviewContent] = useState("");
@@ -34,20 +39,57 @@ export default function ChatInput({ cid }: ChatInputProps) {
    * Attempts to send current input as message. Skip if socket is undefined.
    */
   function sendMessage() {
-    if (!socket || messageContent === "") return;
+    if (
+      !socket ||
+      uploading ||
+      (messageContent === "" && attachments.length === 0)
+    )
+      return;
 
     socket.emit(
       "post-message",
       cid,
-      { body: messageContent, isMine: true },
+      { body: messageContent, isMine: true, attachments: attachments },
       (mid: number) => {
         setMessageContent("");
+        setAttachments([]);
         setPreview(false);
         socket.emit("send-message", cid, mid);
       }
     );
   }
 
+  /**
+   * Uploads the given files (streamed as request body) and adds them to
+   * the attachments of the current input.
+   * @param files files to upload
+   */
+  async function uploadFiles(files: FileList) {
+    setUploading(true);
+    setUploadError(undefined);
+    try {
+      for (const file of Array.from(files)) {
+        const params = new URLSearchParams({ name: file.name });
+        if (file.type) params.set("type", file.type);
+        const response = await fetch(
+          ApiUrl + "/attachments?" + params.toString(),
+          { method: "POST", credentials: "include", body: file }
+        );
+        if (!response.ok)
+          throw new Error(
+            "Unable to upload '" + file.name + "': " + response.statusText
+          );
+        const attachment: Attachment = await response.json();
+        setAttachments((state) => [...state, attachment]);
+      }
+    } catch (error) {
+      setUploadError((error as Error).message);
+    } finally {
+      setUploading(false);
+      if (fileInputRef.current) fileInputRef.current.value = "";
+    }
+  }
+
   return (
     <div className="flex flex-col space-y-2 px-4 pb-2">
       <div className="flex flex-row space-x-2">
@@ -58,6 +100,40 @@ export default function ChatInput({ cid }: ChatInputProps) {
         >
           {preview ? "Continue writing" : "Preview"}
         </Button>
+        <Button
+          color="gray"
+          size="xs"
+          disabled={uploading}
+          onClick={() => fileInputRef.current?.click()}
+        >
+          {uploading ? "Uploading..." : "Attach"}
+        </Button>
+        <input
+          ref={fileInputRef}
+          className="hidden"
+          type="file"
+          multiple
+          onChange={(e) => e.target.files && uploadFiles(e.target.files)}
+        />
+        {attachments.map((attachment, i) => (
+          <Button
+            key={attachment.id + i}
+            color="light"
+            size="xs"
+            title="Remove attachment"
+            onClick={() =>
+              setAttachments((state) => state.filter((_, j) => j !== i))
+            }
+          >
+            {(attachment.name ?? attachment.id.slice(0, 12)) +
+              " (" +
+              formatSize(attachment.size) +
+              ") ✕"}
+          </Button>
+        ))}
+        {uploadError && (
+          <p className="text-xs text-red-600 self-center">{uploadError}</p>
+        )}
       </div>
       <div className="flex flex-row space-x-2">
         {preview && (
@@ -118,7 +194,12 @@ export default function ChatInput({ cid }: ChatInputProps) {
           onChange={(e) => setMessageContent(e.target.value)}
         />
         <div>
-          <Button disabled={messageContent === ""} onClick={sendMessage}>
+          <Button
+            disabled={
+              uploading || (messageContent === "" && attachments.length === 0)
+            }
+            onClick={sendMessage}
+          >
             Send
           </Button>
         </div>
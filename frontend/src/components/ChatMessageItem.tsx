@@ -1,17 +1,56 @@
 import { useContext } from "react";
 import { Tooltip, Spinner, Alert, Button } from "flowbite-react";
 
-import { SocketContext } from "../App";
+import { SocketContext, ApiUrl } from "../App";
 import Markdown from "./Markdown";
 
+export type Attachment = {
+  id: string;
+  size: number;
+  name?: string;
+  type?: string;
+};
+
 export type Message = {
   id: number;
   body: string | null;
   status: "ok" | "sending" | "draft" | "queued" | "deleted" | "error";
   isMine: boolean;
   lastModified: string;
+  key?: string;
+  attachments?: Attachment[];
 };
 
+const INLINE_ATTACHMENT_TYPES = [
+  "image/png",
+  "image/jpeg",
+  "image/gif",
+  "image/webp",
+];
+
+/**
+ * Returns url for downloading the given attachment.
+ * @param attachment attachment
+ * @returns url
+ */
+export function attachmentUrl(attachment: Attachment): string {
+  const params = new URLSearchParams();
+  if (attachment.name) params.set("name", attachment.name);
+  if (attachment.type) params.set("type", attachment.type);
+  return ApiUrl + "/attachments/" + attachment.id + "?" + params.toString();
+}
+
+/**
+ * Returns human-readable file size.
+ * @param size size in bytes
+ * @returns formatted size
+ */
+export function formatSize(size: number): string {
+  if (size < 1024) return size + " B";
+  if (size < 1024 * 1024) return (size / 1024).toFixed(1) + " KiB";
+  return (size / 1024 / 1024).toFixed(1) + " MiB";
+}
+
 export type ChatMessageItemProps = {
   cid: string;
   message: Message;
@@ -56,6 +95,38 @@ export default function ChatMessageItem({
       {message ? (
         <div className="space-y-2 pt-2">
           <Markdown>{message.body}</Markdown>
+          {message.attachments && message.attachments.length > 0 && (
+            <div className="flex flex-col space-y-1">
+              {message.attachments.map((attachment) =>
+                INLINE_ATTACHMENT_TYPES.includes(attachment.type ?? "") ? (
+                  <a
+                    key={attachment.id}
+                    href={attachmentUrl(attachment)}
+                    target="_blank"
+                    rel="noreferrer"
+                  >
+                    <img
+                      className="max-h-64 rounded-md"
+                      src={attachmentUrl(attachment)}
+                      alt={attachment.name ?? attachment.id}
+                      crossOrigin="use-credentials"
+                    />
+                  </a>
+                ) : (
+                  <a
+                    key={attachment.id}
+                    className="text-sm text-blue-600 underline"
+                    href={attachmentUrl(attachment)}
+                  >
+                    {(attachment.name ?? attachment.id.slice(0, 12)) +
+                      " (" +
+                      formatSize(attachment.size) +
+                      ")"}
+                  </a>
+                )
+              )}
+            </div>
+          )}
           <div className="flex flex-row place-content-between items-end">
             {message.status === "sending" ? (
               <Tooltip content="sending">
@@ -1,9 +1,9 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef, useContext } from "react";
 import { Sidebar as FBSidebar, Alert, Tooltip } from "flowbite-react";
 import { useShallow } from "zustand/react/shallow";
 import { FiRefreshCw } from "react-icons/fi";
 
-import { ApiUrl } from "../App";
+import { ApiUrl, SocketContext } from "../App";
 import useStore, { Conversation } from "../stores";
 import SidebarUserItem, { DropdownItemType } from "./SidebarUserItem";
 import SidebarConversationItem from "./SidebarConversationItem";
@@ -24,10 +24,18 @@ export default function Sidebar({
   onNewConversationClick,
   onConversationClick,
 }: SidebarProps) {
+  const socket = useContext(SocketContext);
   const connected = useStore((state) => state.socket.connected);
   const conversations = useStore(
     useShallow((state) => state.conversations.data)
   );
+  const { hasMore, fetchMore } = useStore(
+    useShallow((state) => ({
+      hasMore: state.conversations.cursor !== null,
+      fetchMore: state.conversations.fetchMore,
+    }))
+  );
+  const listEndRef = useRef<HTMLDivElement>(null);
   const [versionString, setVersionString] = useState<string | null>(null);
   const [showUpgradeDialog, setShowUpgradeDialog] = useState(false);
   const { info, setError, setInfo, fetchInfo } = useStore(
@@ -42,6 +50,16 @@ export default function Sidebar({
   // eslint-disable-next-line
   useEffect(() => fetchInfo(ApiUrl, true), []);
 
+  // load further conversations once the end of the list becomes visible
+  useEffect(() => {
+    if (!socket || !hasMore || !listEndRef.current) return;
+    const observer = new IntersectionObserver((entries) => {
+      if (entries.some((entry) => entry.isIntersecting)) fetchMore(socket);
+    });
+    observer.observe(listEndRef.current);
+    return () => observer.disconnect();
+  }, [socket, hasMore, fetchMore, conversations]);
+
   // fetch software-version
   useEffect(() => {
     fetch(url + "/version")
@@ -138,6 +156,7 @@ export default function Sidebar({
                   onClick={onConversationClick}
                 />
               ))}
+            {hasMore ? <div ref={listEndRef} className="h-1" /> : null}
           </FBSidebar.ItemGroup>
         </FBSidebar.Items>
       </FBSidebar>
@@ -2,6 +2,8 @@ import { create } from "zustand";
 import { produce } from "immer";
 import { Socket } from "socket.io-client";
 
+const CONVERSATIONS_PAGE_SIZE = 100;
+
 interface ConnectionState {
   connected: boolean;
   connect: () => void;
@@ -21,10 +23,14 @@ export type Conversation = {
 interface Conversations {
   data: Record<string, Conversation>;
   ids: string[];
+  cursor: string | null;
+  loading: boolean;
   setConversation: (c: Conversation) => void;
+  setConversations: (cs: Conversation[], replace?: boolean) => void;
   removeConversation: (id: string) => void;
   fetch: (socket: Socket, id: string) => void;
   fetchAll: (socket: Socket) => void;
+  fetchMore: (socket: Socket) => void;
   listen: (socket: Socket) => void;
   stopListening: (socket: Socket) => void;
 }
@@ -144,6 +150,8 @@ const useStore = create<StoreState>((set, get) => ({
   conversations: {
     data: {},
     ids: [],
+    cursor: null,
+    loading: false,
     setConversation: (c: Conversation) => {
       set(
         produce((state: StoreState) => {
@@ -153,6 +161,24 @@ const useStore = create<StoreState>((set, get) => ({
         })
       );
     },
+    setConversations: (cs: Conversation[], replace?: boolean) => {
+      set(
+        produce((state: StoreState) => {
+          const data = replace ? {} : { ...state.conversations.data };
+          const ids = replace ? [] : [...state.conversations.ids];
+          const known = new Set(ids);
+          cs.forEach((c) => {
+            data[c.id] = c;
+            if (!known.has(c.id)) {
+              known.add(c.id);
+              ids.push(c.id);
+            }
+          });
+          state.conversations.data = data;
+          state.conversations.ids = ids;
+        })
+      );
+    },
     removeConversation: (id: string) => {
       set(
         produce((state: StoreState) => {
@@ -171,14 +197,50 @@ const useStore = create<StoreState>((set, get) => ({
       });
     },
     fetchAll: (socket) => {
-      socket.emit("list-conversations", (ids: string[]) => {
-        ids.forEach((id) => get().conversations.fetch(socket, id));
-        set(
-          produce((state: StoreState) => {
-            state.conversations.ids = ids;
-          })
-        );
-      });
+      // load first page of conversations (most recent first); further
+      // pages are loaded on demand (see fetchMore)
+      set(
+        produce((state: StoreState) => {
+          state.conversations.loading = true;
+        })
+      );
+      socket.emit(
+        "get-conversations",
+        null,
+        CONVERSATIONS_PAGE_SIZE,
+        (page: { conversations: Conversation[]; cursor: string | null }) => {
+          get().conversations.setConversations(page.conversations, true);
+          set(
+            produce((state: StoreState) => {
+              state.conversations.cursor = page.cursor;
+              state.conversations.loading = false;
+            })
+          );
+        }
+      );
+    },
+    fetchMore: (socket) => {
+      const { cursor, loading } = get().conversations;
+      if (!cursor || loading) return;
+      set(
+        produce((state: StoreState) => {
+          state.conversations.loading = true;
+        })
+      );
+      socket.emit(
+        "get-conversations",
+        cursor,
+        CONVERSATIONS_PAGE_SIZE,
+        (page: { conversations: Conversation[]; cursor: string | null }) => {
+          get().conversations.setConversations(page.conversations);
+          set(
+            produce((state: StoreState) => {
+              state.conversations.cursor = page.cursor;
+              state.conversations.loading = false;
+            })
+          );
+        }
+      );
     },
     listen: (socket) => {
       socket.on("new-conversation", (id: string) =>